@@ -0,0 +1,465 @@
+"""API HTTP/JSON local de Fleet Plus, pensada para la app móvil complementaria.
+
+    python3 api.py [--host 127.0.0.1] [--puerto 8080] [--lectores 8]
+
+Lecturas (GET, JSON comprimido con gzip si el cliente lo acepta):
+
+    /api/vehiculos                          vehículos por matrícula
+    /api/vehiculos/<matricula>              datos, costes, ritmo de uso y próximos cambios
+    /api/vehiculos/<matricula>/<lista>      mantenimientos, obligaciones, gastos o facturas del vehículo
+    /api/<lista>                            lo mismo para toda la flota
+    /api/vencimientos?dias=30&km=2000       próximos cambios de la flota
+    /api/sincronizar?desde=<versión>        filas cambiadas desde la marca del cliente
+
+Las listas van por páginas: ``?limite=`` (por defecto 100, como mucho 1000) y
+``?despues=`` con el valor de ``siguiente`` de la página anterior; la respuesta
+es ``{"datos": [...], "siguiente": ...}`` y ``siguiente`` es ``null`` en la
+última página.
+
+Escrituras (POST con cuerpo JSON): ``/api/vehiculos/<matricula>/km``
+(``{"km": 120500}``), ``/api/gastos``, ``/api/mantenimientos`` y
+``/api/sincronizar`` (``{"cambios": [...]}``, ver sincronizacion.py).
+
+Cada hilo de petición toma una de las conexiones de solo lectura del grupo y
+todas las escrituras pasan por un único hilo escritor, así que la API no compite
+consigo misma por el bloqueo de escritura de SQLite. Las respuestas llevan
+``ETag`` y se guardan mientras no cambie la BD (``PRAGMA data_version``): una
+petición repetida con ``If-None-Match`` se contesta con 304 sin consultar nada.
+La API no tiene autenticación: escucha en 127.0.0.1 salvo que se indique otra
+dirección.
+"""
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import consultas
+import sincronizacion
+from base_datos import conectar, inicializar_base_datos, normalizar_fecha, recalcular_ritmos
+
+PUERTO = 8080
+LECTORES = 8
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+LIMITE_SINCRONIZACION = 5000
+
+# Mayor valor de un INTEGER de SQLite; los números de las escrituras no pueden pasar de aquí
+ENTERO_MAXIMO = 2 ** 63 - 1
+
+# Respuestas GET que se guardan para contestar sin consultar mientras la BD no cambie
+TAMANO_CACHE = 512
+
+# Por debajo de esto no compensa comprimir
+MINIMO_GZIP = 512
+
+# Listas paginadas: función de consultas y clave de paginación de una fila
+LISTAS = {
+    "mantenimientos": (consultas.pagina_mantenimientos, lambda f: (f["fecha"], f["id_mantenimiento"])),
+    "obligaciones": (consultas.pagina_obligaciones, lambda f: (f["fecha_vencimiento"], f["id_obligacion"])),
+    "gastos": (consultas.pagina_gastos, lambda f: (f["fecha"], f["id_gasto"])),
+    "facturas": (consultas.pagina_facturas, lambda f: (f["fecha_emision"], f["id_factura"])),
+}
+
+
+class ErrorApi(Exception):
+    """Error que se devuelve al cliente como ``{"error": mensaje}`` con el estado HTTP indicado."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def _dicts(filas):
+    return [dict(f) for f in filas]
+
+
+def _cursor(clave):
+    """Codifica la clave de paginación de la última fila como texto opaco para ``?despues=``."""
+    return base64.urlsafe_b64encode(json.dumps(clave).encode()).decode()
+
+
+def _leer_cursor(texto, compuesto):
+    """Clave de paginación de ``?despues=``: texto (matrícula) o, si ``compuesto``, el par [fecha, id]."""
+    try:
+        clave = json.loads(base64.urlsafe_b64decode(texto.encode()))
+    except ValueError:
+        clave = None
+    if compuesto:
+        if (isinstance(clave, list) and len(clave) == 2 and isinstance(clave[0], (str, type(None)))
+                and isinstance(clave[1], int) and not isinstance(clave[1], bool)):
+            return tuple(clave)
+    elif isinstance(clave, str):
+        return clave
+    raise ErrorApi(400, "Parámetro 'despues' no válido.")
+
+
+def _entero(parametros, nombre, defecto, maximo=None):
+    try:
+        valor = int(parametros.get(nombre, [defecto])[0])
+    except ValueError:
+        raise ErrorApi(400, f"El parámetro '{nombre}' debe ser un número entero.")
+    if valor < 0:
+        raise ErrorApi(400, f"El parámetro '{nombre}' no puede ser negativo.")
+    return min(valor, maximo) if maximo else valor
+
+
+def _paginar(parametros, leer, clave, compuesto=True):
+    """Lee una página con ``leer(despues, limite)`` y la devuelve con el cursor de la siguiente.
+
+    ``compuesto`` indica si la clave es un par (fecha, id) o un texto, para rechazar
+    con 400 un ``?despues=`` de otra lista.
+    """
+    limite = _entero(parametros, "limite", LIMITE_POR_DEFECTO, LIMITE_MAXIMO) or LIMITE_POR_DEFECTO
+    despues = parametros.get("despues", [None])[0]
+    filas = leer(_leer_cursor(despues, compuesto) if despues else None, limite)
+    siguiente = _cursor(clave(filas[-1])) if len(filas) == limite else None
+    return {"datos": _dicts(filas), "siguiente": siguiente}
+
+
+# Lecturas: reciben una conexión de solo lectura, los parámetros de la URL y los grupos de la ruta
+
+def _vehiculos(conn, parametros):
+    return _paginar(parametros, lambda despues, limite: consultas.pagina_coches(conn, despues, limite),
+                    lambda f: f["matricula"], compuesto=False)
+
+
+def _vehiculo(conn, parametros, matricula):
+    coche = consultas.coche(conn, matricula)
+    if coche is None:
+        raise ErrorApi(404, f"No existe el vehículo {matricula}.")
+    return {
+        **dict(coche),
+        "costes": dict(consultas.costes_coche(conn, matricula)),
+        "vencimientos": _dicts(consultas.vencimientos_coche(conn, matricula)),
+    }
+
+
+def _lista(conn, parametros, nombre, matricula=None):
+    leer, clave = LISTAS[nombre]
+    return _paginar(parametros, lambda despues, limite: leer(conn, despues, limite, matricula=matricula), clave)
+
+
+def _vencimientos(conn, parametros):
+    dias = _entero(parametros, "dias", 30)
+    km = _entero(parametros, "km", 2000)
+    return {"datos": _dicts(consultas.vencimientos(conn, dias, km))}
+
+
+def _cambios(conn, parametros):
+    desde = _entero(parametros, "desde", 0)
+    limite = _entero(parametros, "limite", sincronizacion.LOTE, LIMITE_SINCRONIZACION) or sincronizacion.LOTE
+    return sincronizacion.cambios_desde(conn, desde, limite)
+
+
+# Escrituras: se ejecutan en el hilo escritor dentro de una transacción
+
+def _exigir_coche(conn, matricula):
+    if not conn.execute("SELECT 1 FROM Coche WHERE matricula = ?", (matricula,)).fetchone():
+        raise ErrorApi(404, f"No existe el vehículo {matricula}.")
+
+
+def _campo(datos, nombre, tipo=str, obligatorio=True):
+    valor = datos.get(nombre)
+    if valor in (None, ""):
+        if obligatorio:
+            raise ErrorApi(400, f"Falta el campo '{nombre}'.")
+        return None
+    if tipo in (int, float) and (isinstance(valor, bool) or not isinstance(valor, (int, float))):
+        raise ErrorApi(400, f"El campo '{nombre}' debe ser un número.")
+    if tipo in (int, float) and not -ENTERO_MAXIMO <= valor <= ENTERO_MAXIMO:
+        # Tampoco pasan inf ni nan; ninguno se podría guardar en la BD
+        raise ErrorApi(400, f"El campo '{nombre}' está fuera de rango.")
+    if tipo is str and not isinstance(valor, str):
+        raise ErrorApi(400, f"El campo '{nombre}' debe ser un texto.")
+    return tipo(valor)
+
+
+def _fecha(datos, nombre):
+    try:
+        return normalizar_fecha(_campo(datos, nombre))
+    except ValueError as e:
+        raise ErrorApi(400, str(e))
+
+
+def _guardar_km(conn, datos, matricula):
+    km = _campo(datos, "km", int)
+    _exigir_coche(conn, matricula)
+    conn.execute("UPDATE Coche SET km_actuales = ? WHERE matricula = ?", (km, matricula))
+    recalcular_ritmos(conn)
+    return 200, {"matricula": matricula, "km_actuales": km}
+
+
+def _crear_gasto(conn, datos):
+    matricula = _campo(datos, "matricula")
+    _exigir_coche(conn, matricula)
+    cursor = conn.execute("""
+        INSERT INTO Gasto (matricula, id_factura, fecha, categoria, concepto, importe, observaciones)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (matricula, _campo(datos, "id_factura", int, False), _fecha(datos, "fecha"),
+          _campo(datos, "categoria", obligatorio=False), _campo(datos, "concepto"),
+          _campo(datos, "importe", float), _campo(datos, "observaciones", obligatorio=False)))
+    return 201, {"id_gasto": cursor.lastrowid}
+
+
+def _crear_mantenimiento(conn, datos):
+    matricula = _campo(datos, "matricula")
+    _exigir_coche(conn, matricula)
+    id_producto = _campo(datos, "id_producto", int)
+    if not conn.execute("SELECT 1 FROM Producto WHERE id_producto = ?", (id_producto,)).fetchone():
+        raise ErrorApi(404, f"No existe el producto {id_producto}.")
+    cursor = conn.execute("""
+        INSERT INTO Mantenimiento (matricula, id_producto, fecha, km, descripcion) VALUES (?, ?, ?, ?, ?)
+    """, (matricula, id_producto, _fecha(datos, "fecha"), _campo(datos, "km", int),
+          _campo(datos, "descripcion", obligatorio=False)))
+    recalcular_ritmos(conn)
+    return 201, {"id_mantenimiento": cursor.lastrowid}
+
+
+def _subir_cambios(conn, datos):
+    cambios = datos.get("cambios")
+    if not isinstance(cambios, list):
+        raise ErrorApi(400, "Falta la lista 'cambios'.")
+    return 200, sincronizacion.aplicar_cambios(conn, cambios)
+
+
+_LISTA = "(" + "|".join(LISTAS) + ")"
+RUTAS = [
+    ("GET", r"/api/vehiculos", _vehiculos),
+    ("GET", r"/api/vehiculos/([^/]+)", _vehiculo),
+    ("GET", rf"/api/vehiculos/([^/]+)/{_LISTA}", lambda conn, p, matricula, nombre: _lista(conn, p, nombre, matricula)),
+    ("GET", rf"/api/{_LISTA}", _lista),
+    ("GET", r"/api/vencimientos", _vencimientos),
+    ("GET", r"/api/sincronizar", _cambios),
+    ("POST", r"/api/vehiculos/([^/]+)/km", _guardar_km),
+    ("POST", r"/api/gastos", _crear_gasto),
+    ("POST", r"/api/mantenimientos", _crear_mantenimiento),
+    ("POST", r"/api/sincronizar", _subir_cambios),
+]
+RUTAS = [(metodo, re.compile(patron + "/?"), funcion) for metodo, patron, funcion in RUTAS]
+
+
+class GrupoLectores:
+    """Conexiones de solo lectura compartidas por los hilos de petición."""
+
+    def __init__(self, tamano):
+        self._libres = queue.Queue()
+        for _ in range(tamano):
+            self._libres.put(conectar(solo_lectura=True, check_same_thread=False))
+        # Conexión solo para PRAGMA data_version, que cambia cuando otra conexión confirma
+        self._vigia = conectar(solo_lectura=True, check_same_thread=False)
+        self._lock_vigia = threading.Lock()
+
+    def version(self):
+        with self._lock_vigia:
+            return self._vigia.execute("PRAGMA data_version").fetchone()[0]
+
+    def ejecutar(self, funcion, *args):
+        conn = self._libres.get()
+        try:
+            return funcion(conn, *args)
+        finally:
+            self._libres.put(conn)
+
+
+class Escritor:
+    """Hilo con la única conexión de escritura; las escrituras se encolan y se esperan con un Future."""
+
+    def __init__(self):
+        self._cola = queue.Queue()
+        self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self._hilo.start()
+
+    def ejecutar(self, funcion, *args):
+        futuro = Future()
+        self._cola.put((futuro, funcion, args))
+        return futuro.result()
+
+    def cerrar(self):
+        self._cola.put(None)
+        self._hilo.join()
+
+    def _trabajar(self):
+        conn = conectar()
+        while (tarea := self._cola.get()) is not None:
+            futuro, funcion, args = tarea
+            try:
+                with conn:
+                    resultado = funcion(conn, *args)
+            except BaseException as e:
+                if not futuro.done():
+                    futuro.set_exception(e)
+                continue
+            # Solo después del commit: quien recibe la respuesta ya debe poder leer el cambio
+            futuro.set_result(resultado)
+        conn.close()
+
+
+class CacheRespuestas:
+    """Últimas respuestas GET por URL, válidas mientras no cambie la versión de la BD."""
+
+    def __init__(self, capacidad=TAMANO_CACHE):
+        self.capacidad = capacidad
+        self._respuestas = OrderedDict()   # url -> (versión, etag, cuerpo, cuerpo gzip o None)
+        self._lock = threading.Lock()
+
+    def obtener(self, url, version):
+        with self._lock:
+            respuesta = self._respuestas.get(url)
+            if respuesta is None or respuesta[0] != version:
+                return None
+            self._respuestas.move_to_end(url)
+            return respuesta
+
+    def guardar(self, url, respuesta):
+        with self._lock:
+            self._respuestas[url] = respuesta
+            self._respuestas.move_to_end(url)
+            while len(self._respuestas) > self.capacidad:
+                self._respuestas.popitem(last=False)
+
+
+class ManejadorApi(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FleetPlus"
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+    # El resto de métodos solo llegan a _ruta, que contesta 405 (o 404) en JSON
+    def do_PUT(self):
+        self._atender("PUT")
+
+    def do_PATCH(self):
+        self._atender("PATCH")
+
+    def do_DELETE(self):
+        self._atender("DELETE")
+
+    def log_message(self, formato, *args):
+        # Solo se registran los errores; con cientos de clientes el registro de cada petición sobra
+        pass
+
+    def _atender(self, metodo):
+        url = urlsplit(self.path)
+        try:
+            funcion, grupos = self._ruta(metodo, url.path)
+            if metodo == "GET":
+                self._responder_get(funcion, grupos, parse_qs(url.query))
+            else:
+                estado, datos = self.server.escritor.ejecutar(funcion, self._cuerpo(), *grupos)
+                self._enviar(estado, self._json(datos))
+        except ErrorApi as e:
+            if metodo != "GET":
+                # El cuerpo puede haberse quedado sin leer: no se reutiliza la conexión
+                self.close_connection = True
+            self._enviar(e.estado, self._json({"error": str(e)}))
+        except Exception as e:
+            print(f"Error en {metodo} {self.path}:", e)
+            self._enviar(500, self._json({"error": "Error interno."}))
+
+    def _ruta(self, metodo, ruta):
+        permitidos = False
+        for metodo_ruta, patron, funcion in RUTAS:
+            coincidencia = patron.fullmatch(ruta)
+            if coincidencia:
+                if metodo_ruta == metodo:
+                    return funcion, [unquote(g) for g in coincidencia.groups()]
+                permitidos = True
+        raise ErrorApi(405, "Método no permitido.") if permitidos else ErrorApi(404, "Ruta desconocida.")
+
+    def _cuerpo(self):
+        longitud = int(self.headers.get("Content-Length") or 0)
+        try:
+            datos = json.loads(self.rfile.read(longitud) or b"{}")
+        except ValueError:
+            raise ErrorApi(400, "El cuerpo debe ser JSON.")
+        if not isinstance(datos, dict):
+            raise ErrorApi(400, "El cuerpo debe ser un objeto JSON.")
+        return datos
+
+    def _responder_get(self, funcion, grupos, parametros):
+        lectores, cache = self.server.lectores, self.server.cache
+        version = lectores.version()
+        respuesta = cache.obtener(self.path, version)
+        if respuesta is None:
+            cuerpo = self._json(lectores.ejecutar(funcion, parametros, *grupos))
+            etag = '"{}"'.format(hashlib.blake2b(cuerpo, digest_size=12).hexdigest())
+            comprimido = gzip.compress(cuerpo, compresslevel=5) if len(cuerpo) >= MINIMO_GZIP else None
+            respuesta = (version, etag, cuerpo, comprimido)
+            cache.guardar(self.path, respuesta)
+
+        _, etag, cuerpo, comprimido = respuesta
+        if etag in (self.headers.get("If-None-Match") or ""):
+            self._enviar(304, b"", etag=etag)
+        elif comprimido is not None and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            self._enviar(200, comprimido, etag=etag, gzip=True)
+        else:
+            self._enviar(200, cuerpo, etag=etag)
+
+    @staticmethod
+    def _json(datos):
+        return json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def _enviar(self, estado, cuerpo, etag=None, gzip=False):
+        self.send_response(estado)
+        if estado != 304:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept-Encoding")
+        if gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+
+class ServidorApi(ThreadingHTTPServer):
+    daemon_threads = True
+    # Cola de conexiones pendientes de aceptar, para ráfagas de muchos clientes a la vez
+    request_queue_size = 128
+
+    def __init__(self, direccion, lectores=LECTORES):
+        super().__init__(direccion, ManejadorApi)
+        self.lectores = GrupoLectores(lectores)
+        self.escritor = Escritor()
+        self.cache = CacheRespuestas()
+
+    def server_close(self):
+        super().server_close()
+        self.escritor.cerrar()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP/JSON de Fleet Plus.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=PUERTO)
+    parser.add_argument("--lectores", type=int, default=LECTORES, help="conexiones de lectura (por defecto %(default)s)")
+    args = parser.parse_args(argv)
+
+    inicializar_base_datos()
+    servidor = ServidorApi((args.host, args.puerto), args.lectores)
+    print(f"API en http://{args.host}:{servidor.server_address[1]}/api/ (Ctrl+C para terminar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,119 +1,23 @@
 import customtkinter as ctk
-from tkinter import ttk, messagebox
-from datetime import datetime, timedelta
+from tkinter import ttk, messagebox, filedialog
+from datetime import datetime
 import sqlite3
-import os
+import sys
+
+import consultas
+import fichas
+import informes
+import tiempos
+from catalogo import Catalogos
+from base_datos import (FUENTES_BUSQUEDA, conectar, inicializar_base_datos, normalizar_fecha, formatear_fecha,
+                        recalcular_ritmos)
+from ejecutor import EjecutorConsultas, TareaLarga
+from eventos import BusCambios
+from widgets import ModeloTabla, SelectorCoche, TablaPaginada, TablaVirtual, VentanaProgreso
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
-# Ruta base del proyecto y BD
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(BASE_DIR, "app_mantenimiento.db")
-
-def inicializar_base_datos():
-    """Crea la base de datos y todas las tablas necesarias si no existen."""
-    db_existe = os.path.exists(DB_PATH)
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    if not db_existe:
-        print("Creando base de datos...")
-
-    cursor.executescript("""
-        CREATE TABLE IF NOT EXISTS TipoComponente (
-            id_tipo INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            descripcion TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS Producto (
-            id_producto INTEGER PRIMARY KEY AUTOINCREMENT,
-            id_tipo INTEGER NOT NULL,
-            marca TEXT,
-            modelo TEXT,
-            tipo TEXT,
-            descripcion TEXT,
-            vida_util_km INTEGER,
-            vida_util_meses INTEGER,
-            FOREIGN KEY (id_tipo) REFERENCES TipoComponente(id_tipo)
-        );
-
-        CREATE TABLE IF NOT EXISTS Coche (
-            matricula TEXT PRIMARY KEY,
-            marca TEXT NOT NULL,
-            modelo TEXT NOT NULL,
-            km_actuales INTEGER,
-            fecha_matriculacion DATE NOT NULL
-        );
-
-        CREATE TABLE IF NOT EXISTS Mantenimiento (
-            id_mantenimiento INTEGER PRIMARY KEY AUTOINCREMENT,
-            matricula TEXT NOT NULL,
-            id_producto INTEGER NOT NULL,
-            fecha DATE NOT NULL,
-            km INTEGER NOT NULL,
-            descripcion TEXT,
-            FOREIGN KEY (matricula) REFERENCES Coche(matricula),
-            FOREIGN KEY (id_producto) REFERENCES Producto(id_producto)
-        );
-
-        CREATE TABLE IF NOT EXISTS Obligaciones (
-            id_obligacion INTEGER PRIMARY KEY AUTOINCREMENT,
-            matricula TEXT NOT NULL,
-            tipo TEXT NOT NULL,
-            descripcion TEXT,
-            fecha_inicio DATE,
-            fecha_vencimiento DATE,
-            estado TEXT DEFAULT 'Vigente',
-            FOREIGN KEY (matricula) REFERENCES Coche(matricula)
-        );
-
-        CREATE TABLE IF NOT EXISTS Proveedor (
-            id_proveedor INTEGER PRIMARY KEY AUTOINCREMENT,
-            nombre TEXT NOT NULL,
-            cif_nif TEXT UNIQUE,
-            tipo TEXT,
-            telefono TEXT,
-            email TEXT,
-            direccion TEXT,
-            descripcion TEXT
-        );
-
-        CREATE TABLE IF NOT EXISTS Factura (
-            id_factura INTEGER PRIMARY KEY AUTOINCREMENT,
-            id_proveedor INTEGER NOT NULL,
-            num_factura TEXT NOT NULL,
-            fecha_emision DATE,
-            importe_total REAL,
-            matricula TEXT,
-            FOREIGN KEY (id_proveedor) REFERENCES Proveedor(id_proveedor),
-            FOREIGN KEY (matricula) REFERENCES Coche(matricula),
-            UNIQUE (id_proveedor, num_factura)
-        );
-
-        CREATE TABLE IF NOT EXISTS Gasto (
-            id_gasto INTEGER PRIMARY KEY AUTOINCREMENT,
-            matricula TEXT NOT NULL,
-            id_factura INTEGER,
-            fecha DATE NOT NULL,
-            categoria TEXT,
-            concepto TEXT NOT NULL,
-            importe REAL NOT NULL,
-            observaciones TEXT,
-            FOREIGN KEY (matricula) REFERENCES Coche(matricula),
-            FOREIGN KEY (id_factura) REFERENCES Factura(id_factura)
-        );
-    """)
-
-    conn.commit()
-    conn.close()
-
-    if not db_existe:
-        print("Base de datos creada correctamente.")
-    else:
-        print("Base de datos existente, arrancamos.")
-
 
 class MantenimientoApp:
     def __init__(self, root):
@@ -121,15 +25,32 @@ class MantenimientoApp:
         self.root.title("Fleet Plus - Gestión Integral de Flotas")
         self.root.geometry("1920x1080")
 
-        self.conn = sqlite3.connect(DB_PATH)
-        self.conn.row_factory = sqlite3.Row
+        self.conn = conectar()
+
+        # Entidades de los desplegables: se leen una vez y se mantienen fila a fila
+        self.catalogo = Catalogos(self.conn)
+
+        # Las lecturas pesadas van a hilos de trabajo con sus propias conexiones
+        self.ejecutor = EjecutorConsultas(self.root)
+
+        # Fichas de los últimos vehículos mostrados, para volver a ellos sin consultar
+        self.cache_fichas = fichas.CacheFichas()
+
+        # Informes PDF en marcha (TareaLarga): uno por matrícula y el lote de toda la flota
+        self.tareas_pdf = {}
+        self.tarea_flota = None
 
         # --- Crear tabs principales ---
         self.tabview = ctk.CTkTabview(self.root)
         self.tabview.pack(fill="both", expand=True, padx=20, pady=20)
 
+        # Las escrituras publican qué tablas cambian; cada vista se refresca al mostrarse su pestaña
+        self.bus = BusCambios(self.tabview.get)
+        self.tabview.configure(command=self._pestana_cambiada)
+
         # Pestañas principales
         self.tab_coches = self.tabview.add("Vehículos")
+        self.tab_vencimientos = self.tabview.add("🔧 Próximos cambios")
         self.tab_agregar_coche = self.tabview.add("➕ Gestión")
         self.tab_agregar_componente = self.tabview.add("➕ Componentes")
         self.tab_agregar_producto = self.tabview.add("➕ Productos")
@@ -138,36 +59,68 @@ class MantenimientoApp:
         self.tab_proveedores = self.tabview.add("➕ Proveedores")
         self.tab_facturas = self.tabview.add("➕ Facturas")
         self.tab_gastos = self.tabview.add("➕ Gastos")
+        self.tab_busqueda = self.tabview.add("🔍 Buscar")
+
+        # Cada pestaña se construye (y consulta sus datos) la primera vez que se muestra
+        self._pestanas_por_construir = {
+            "Vehículos": self.crear_tab_coches,
+            "🔧 Próximos cambios": self.crear_tab_vencimientos,
+            "➕ Gestión": self.crear_tab_agregar_coche,
+            "➕ Componentes": self.crear_tab_agregar_componente,
+            "➕ Productos": self.crear_tab_agregar_producto,
+            "➕ Mantenimientos": self.crear_tab_agregar_mantenimiento,
+            "➕ Obligaciones": self.crear_tab_obligaciones,
+            "➕ Proveedores": self.crear_tab_proveedores,
+            "➕ Facturas": self.crear_tab_facturas,
+            "➕ Gastos": self.crear_tab_gastos,
+            "🔍 Buscar": self.crear_tab_busqueda,
+        }
+        self.root.bind("<Control-f>", lambda e: self._ir_a_busqueda())
 
-        # Inicializar cada pestaña
-        self.crear_tab_coches()
-        self.crear_tab_agregar_coche()
-        self.crear_tab_agregar_componente()
-        self.crear_tab_agregar_producto()
-        self.crear_tab_agregar_mantenimiento()
-        self.crear_tab_obligaciones()
-        self.crear_tab_proveedores()
-        self.crear_tab_facturas()
-        self.crear_tab_gastos()
-
-    def obtener_matriculas(self, mostrar_detalle=False):
-        """Devuelve una lista de matrículas o 'matrícula (marca modelo)' si mostrar_detalle=True."""
-        try:
-            if mostrar_detalle:
-                cursor = self.conn.execute("SELECT matricula, marca, modelo FROM Coche ORDER BY matricula")
-                return [f"{row['matricula']} ({row['marca']} {row['modelo']})" for row in cursor.fetchall()]
-            else:
-                cursor = self.conn.execute("SELECT matricula FROM Coche ORDER BY matricula")
-                return [row["matricula"] for row in cursor.fetchall()]
-        except Exception as e:
-            print("Error al obtener matrículas:", e)
-            return []
+        # La pestaña inicial, cuando la ventana ya se ha pintado
+        self.root.after_idle(self._construir_pestana_inicial)
 
-    
-    def actualizar_combo_matriculas(self):
-        """Actualiza el combo de matrículas en la pestaña Obligaciones."""
-        if hasattr(self, "obl_coche_cb"):
-            self.obl_coche_cb.configure(values=self.obtener_matriculas())
+    def construir_pestana(self, nombre):
+        """Construye la pestaña si aún no se ha mostrado nunca."""
+        crear = self._pestanas_por_construir.pop(nombre, None)
+        if crear:
+            with tiempos.medir("pestaña", nombre):
+                crear()
+
+    def _construir_pestana_inicial(self):
+        tiempos.registrar("arranque", "hasta la primera pintura", tiempos.desde_inicio())
+        self.construir_pestana(self.tabview.get())
+        tiempos.informe("Arranque")
+
+    def _pestana_cambiada(self):
+        self.construir_pestana(self.tabview.get())
+        self.bus.pestana_mostrada()
+
+    def confirmar(self, *tablas, excepto=()):
+        """Confirma la transacción y avisa a las vistas de las tablas modificadas.
+
+        Si cambian los km de algún vehículo, antes recalcula su ritmo de uso.
+        """
+        if {"Coche", "Mantenimiento"} & set(tablas):
+            recalcular_ritmos(self.conn)
+        self.conn.commit()
+        self.bus.publicar(*tablas, excepto=excepto)
+
+    def coche_elegido(self, selector):
+        """Matrícula de un SelectorCoche: "" si está vacío y None, tras avisar, si no existe ese vehículo."""
+        texto = selector.get().strip()
+        if not texto:
+            return ""
+        matricula = selector.matricula()
+        if matricula is None:
+            messagebox.showwarning("Atención", f"No existe el vehículo {texto}. Elígelo de la lista.")
+        return matricula
+
+    def mostrar_pestana(self, nombre):
+        """Cambia de pestaña desde el código (``tabview.set`` no avisa al bus)."""
+        self.construir_pestana(nombre)
+        self.tabview.set(nombre)
+        self.bus.pestana_mostrada()
 
     def actualizar_km(self):
         """Actualiza los kilómetros del coche seleccionado."""
@@ -184,7 +137,7 @@ class MantenimientoApp:
 
         try:
             self.conn.execute("UPDATE Coche SET km_actuales = ? WHERE matricula = ?", (nuevo_km, matricula))
-            self.conn.commit()
+            self.confirmar("Coche")
             messagebox.showinfo("Éxito", f"Kilometraje actualizado a {nuevo_km} km para {matricula}.")
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo actualizar el kilometraje: {e}")
@@ -282,16 +235,14 @@ class MantenimientoApp:
 
         ctk.CTkLabel(frame_coche, text="Selecciona el vehículo:", font=("Arial", 18)).grid(row=0, column=0, padx=10, sticky="e")
         self.coche_var = ctk.StringVar()
-        self.combo_coche = ttk.Combobox(frame_coche, textvariable=self.coche_var, state="readonly", width=40)
+        self.combo_coche = SelectorCoche(frame_coche, self.conn, detalle=True, textvariable=self.coche_var, width=40)
         self.combo_coche.grid(row=0, column=1, padx=5)
-        self.combo_coche.bind("<<ComboboxSelected>>", lambda e: [
-        self.mostrar_mantenimientos(),
-        self.mostrar_gastos_coche(),
-        self.mostrar_facturas_coche()
-        ])
+        self.combo_coche.bind("<<ComboboxSelected>>", lambda e: self.mostrar_coche())
 
         # Botón para exportar PDF
-        ctk.CTkButton(frame_coche, text="Exportar a PDF", command=self.exportar_pdf).grid(row=1, column=0, columnspan=2, pady=10)
+        ctk.CTkButton(frame_coche, text="Exportar a PDF", command=self.exportar_pdf).grid(row=1, column=0, pady=10)
+        ctk.CTkButton(frame_coche, text="Informes de toda la flota…",
+                      command=self.exportar_pdf_flota).grid(row=1, column=1, pady=10)
 
         # --- Frame de información del coche ---
         frame_info = ctk.CTkFrame(frame_contenedor)
@@ -313,7 +264,21 @@ class MantenimientoApp:
         # --- Frame de mantenimientos centrado ---
         self.frame_mantenimientos = ctk.CTkFrame(frame_contenedor)
         self.frame_mantenimientos.grid(row=3, column=0, pady=10, sticky="n")
-        self.frame_mantenimientos.grid_columnconfigure(0, weight=1)
+
+        ctk.CTkLabel(self.frame_mantenimientos, text="Mantenimientos", font=("Arial", 20, "bold")).pack(pady=(0, 10))
+
+        # Tabla virtual: solo se crean las filas visibles, aunque el vehículo tenga miles de mantenimientos
+        self.tabla_mantenimientos = TablaVirtual(
+            self.frame_mantenimientos,
+            columnas=("elemento", "fecha", "km", "prox_km", "prox_fecha", "descripcion"),
+            titulos=("Elemento (Tipo)", "Fecha", "Km", "Próx. cambio (km)", "Próx. cambio (fecha)", "Descripción"),
+            anchos=(320, 110, 90, 150, 160, 320),
+            alto=12
+        )
+        self.tabla_mantenimientos.pack(padx=10, pady=5, fill="x", expand=True)
+
+        self.label_estado_mantenimientos = ctk.CTkLabel(self.frame_mantenimientos, text="", font=("Arial", 16))
+        self.label_estado_mantenimientos.pack(pady=(5, 10))
 
         # --- Separador visual ---
         ctk.CTkLabel(frame_contenedor, text="").grid(row=4, column=0, pady=5)
@@ -344,6 +309,12 @@ class MantenimientoApp:
             self.tree_gastos_coche.heading(col, text=title)
             self.tree_gastos_coche.column(col, width=150, anchor="center")
 
+        # Total (o indicador de carga) debajo de la tabla
+        self.label_total_gastos = ctk.CTkLabel(
+            self.frame_gastos_coche, text="", font=("Arial", 18, "bold"), text_color="lightgreen"
+        )
+        self.label_total_gastos.pack(pady=(5, 10))
+
         # --- Frame de facturas ---
         self.frame_facturas_coche = ctk.CTkFrame(frame_contenedor)
         self.frame_facturas_coche.grid(row=7, column=0, pady=20, sticky="nsew")
@@ -365,122 +336,25 @@ class MantenimientoApp:
             self.tree_facturas_coche.heading(col, text=title)
             self.tree_facturas_coche.column(col, width=200, anchor="center")
 
-        # --- Cargar datos y mostrar ---
-        self.cargar_coches()
-        self.mostrar_mantenimientos()
-        self.mostrar_gastos_coche()
-
-
-    def mostrar_gastos_coche(self, event=None):
-        """Muestra los gastos asociados a la matrícula seleccionada en la pestaña Vehículos."""
-        if not hasattr(self, "tree_gastos_coche"):
-            return
-
-        # Limpiar la tabla
-        for fila in self.tree_gastos_coche.get_children():
-            self.tree_gastos_coche.delete(fila)
-
-        matricula = self.coche_var.get().split("(")[0].strip()
-        if not matricula:
-            return
-
-        query = """
-            SELECT fecha, categoria, concepto, importe, observaciones
-            FROM Gasto
-            WHERE matricula = ?
-            ORDER BY fecha DESC
-        """
-        try:
-            cursor = self.conn.execute(query, (matricula,))
-            gastos = cursor.fetchall()
-
-            total_gastos = 0.0
-            for row in gastos:
-                importe = float(row["importe"]) if row["importe"] is not None else 0.0
-                total_gastos += importe
-                self.tree_gastos_coche.insert(
-                    "", "end",
-                    values=(
-                        row["fecha"],
-                        row["categoria"],
-                        row["concepto"],
-                        f"{importe:.2f} €",
-                        row["observaciones"]
-                    )
-                )
-
-            # Mostrar total debajo de la tabla
-            if hasattr(self, "label_total_gastos"):
-                self.label_total_gastos.destroy()
-
-            self.label_total_gastos = ctk.CTkLabel(
-                self.frame_gastos_coche,
-                text=f"💰 Total Gastos: {total_gastos:.2f} €",
-                font=("Arial", 18, "bold"),
-                text_color="lightgreen"
-            )
-            self.label_total_gastos.pack(pady=(5, 10))
-
-        except Exception as e:
-            print("Error al mostrar gastos:", e)
-
-    def mostrar_facturas_coche(self, event=None):
-        """Muestra las facturas asociadas al vehículo seleccionado."""
-        if not hasattr(self, "tree_facturas_coche"):
-            return
-
-        # Limpiar tabla
-        for fila in self.tree_facturas_coche.get_children():
-            self.tree_facturas_coche.delete(fila)
-
-        matricula = self.coche_var.get().split("(")[0].strip()
-        if not matricula:
-            return
+        # Total (o indicador de carga) debajo de la tabla
+        self.label_total_facturas = ctk.CTkLabel(
+            self.frame_facturas_coche, text="", font=("Arial", 18, "bold"), text_color="lightblue"
+        )
+        self.label_total_facturas.pack(pady=(5, 10))
 
-        query = """
-            SELECT 
-                f.num_factura,
-                p.nombre AS proveedor,
-                f.fecha_emision,
-                f.importe_total
-            FROM Factura f
-            JOIN Proveedor p ON f.id_proveedor = p.id_proveedor
-            WHERE f.matricula = ?
-            ORDER BY f.fecha_emision DESC
-        """
-        try:
-            cursor = self.conn.execute(query, (matricula,))
-            facturas = cursor.fetchall()
-
-            total_facturas = 0.0
-            for row in facturas:
-                importe = float(row["importe_total"]) if row["importe_total"] else 0.0
-                total_facturas += importe
-                self.tree_facturas_coche.insert(
-                    "",
-                    "end",
-                    values=(
-                        row["num_factura"],
-                        row["proveedor"],
-                        row["fecha_emision"],
-                        f"{importe:.2f} €",
-                    ),
-                )
+        # --- Cualquier cambio en las tablas de la ficha vacía la caché y, al volver a la pestaña, se relee ---
+        self.bus.suscribir(fichas.TABLAS_FICHA, self.cache_fichas.vaciar)
+        self.bus.suscribir(fichas.TABLAS_FICHA, self.mostrar_coche, "Vehículos")
 
-            # Mostrar total de facturas
-            if hasattr(self, "label_total_facturas"):
-                self.label_total_facturas.destroy()
+        # --- Cargar datos y mostrar ---
+        self.cargar_coches()
+        self.mostrar_coche()
 
-            self.label_total_facturas = ctk.CTkLabel(
-                self.frame_facturas_coche,
-                text=f"📄 Total facturas: {total_facturas:.2f} €",
-                font=("Arial", 18, "bold"),
-                text_color="lightblue",
-            )
-            self.label_total_facturas.pack(pady=(5, 10))
 
-        except Exception as e:
-            print("Error al mostrar facturas:", e)
+    def _error_carga(self, label, mensaje, error):
+        """Quita el indicador de carga de una sección cuya consulta ha fallado."""
+        print(mensaje, error)
+        label.configure(text="")
 
 
     # PESTAÑA GESTIÓN VEHÍCULOS
@@ -513,16 +387,14 @@ class MantenimientoApp:
         ctk.CTkLabel(frame, text="Gestión de vehículos existentes", font=("Arial", 18, "bold")).grid(row=base_row, column=0, columnspan=2, pady=8)
 
         ctk.CTkLabel(frame, text="Selecciona matrícula:", font=("Arial", 22)).grid(row=base_row + 1, column=0, sticky="e", padx=10, pady=6)
-        self.combo_gestion = ttk.Combobox(frame, state="readonly", width=40, values=self.obtener_matriculas())
+        self.combo_gestion = SelectorCoche(frame, self.conn, width=40)
         self.combo_gestion.grid(row=base_row + 1, column=1, pady=6)
+        self.combo_gestion.bind("<<ComboboxSelected>>", lambda e: self.cargar_datos_coche())
 
         # === Botones de gestión (alineados correctamente) ===
         btn_row = base_row + 2
         ctk.CTkButton(frame, text="Cargar datos", hover_color="#515344",
-                    command=self.cargar_datos_coche).grid(row=btn_row, column=0, pady=8, padx=10, sticky="e")
-
-        ctk.CTkButton(frame, text="Refrescar lista", hover_color="#6168B5",
-                    command=lambda: self.combo_gestion.configure(values=self.obtener_matriculas())).grid(row=btn_row, column=1, pady=8, padx=10, sticky="w")
+                    command=self.cargar_datos_coche).grid(row=btn_row, column=0, columnspan=2, pady=8, padx=10)
 
         ctk.CTkButton(frame, text="Eliminar vehículo", fg_color="red", hover_color="#990000",
                     command=self.eliminar_coche).grid(row=btn_row + 1, column=0, columnspan=2, pady=8)
@@ -552,46 +424,27 @@ class MantenimientoApp:
             messagebox.showerror("Error", "Por favor completa todos los campos obligatorios.")
             return
 
+        try:
+            fecha_matriculacion = normalizar_fecha(datos["Fecha de matriculación:"])
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
         try:
             km = int(datos["Kilómetros actuales:"]) if datos["Kilómetros actuales:"] else 0
             self.conn.execute(
                 "INSERT INTO Coche (matricula, marca, modelo, km_actuales, fecha_matriculacion) VALUES (?, ?, ?, ?, ?)",
-                (datos["Matrícula:"], datos["Marca:"], datos["Modelo:"], km, datos["Fecha de matriculación:"])
+                (datos["Matrícula:"], datos["Marca:"], datos["Modelo:"], km, fecha_matriculacion)
             )
-            self.conn.commit()
+            self.confirmar("Coche")
             messagebox.showinfo("Éxito", f"Coche {datos['Matrícula:']} añadido correctamente.")
 
-            # Refrescar combos si existen
-            for fn in ("cargar_coches", "actualizar_combo_matriculas", "recargar_coches_en_mantenimiento"):
-                try:
-                    getattr(self, fn)()
-                except Exception:
-                    pass
-
-            if hasattr(self, "combo_gestion"):
-                try:
-                    self.combo_gestion.configure(values=self.obtener_matriculas())
-                except Exception:
-                    pass
+            # Los selectores de vehículo consultan el índice al escribir: no hay listas que refrescar
 
             # Limpiar formulario
             for var in self.vars_coche.values():
                 var.set("")
 
-            # Refrescar combobox de matrículas en pestaña Facturas
-            if hasattr(self, "factura_matricula_cb"):
-                try:
-                    self.factura_matricula_cb.configure(values=self.obtener_matriculas())
-                except Exception:
-                    pass
-
-            # Refrescar combobox de matrículas en pestaña Gastos
-            if hasattr(self, "gasto_matricula_cb"):
-                try:
-                    self.gasto_matricula_cb.configure(values=self.obtener_matriculas())
-                except Exception:
-                    pass    
-    
 
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "Ya existe un coche con esa matrícula.")
@@ -632,26 +485,30 @@ class MantenimientoApp:
             messagebox.showerror("Error", "Completa todos los campos obligatorios antes de guardar.")
             return
 
+        try:
+            fecha_matriculacion = normalizar_fecha(nuevos_datos["Fecha de matriculación:"])
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
         try:
             km = int(nuevos_datos["Kilómetros actuales:"]) if nuevos_datos["Kilómetros actuales:"] else 0
             self.conn.execute(
                 """UPDATE Coche
                 SET marca = ?, modelo = ?, km_actuales = ?, fecha_matriculacion = ?
                 WHERE matricula = ?""",
-                (nuevos_datos["Marca:"], nuevos_datos["Modelo:"], km, nuevos_datos["Fecha de matriculación:"], matricula)
+                (nuevos_datos["Marca:"], nuevos_datos["Modelo:"], km, fecha_matriculacion, matricula)
             )
-            self.conn.commit()
+            self.confirmar("Coche")
             messagebox.showinfo("Éxito", f"Datos del coche {matricula} actualizados correctamente.")
 
-            # Refrescar combos y limpiar
+            # Quitar la selección del coche modificado y limpiar
             try:
                 self.cargar_coches()
-                self.actualizar_combo_matriculas()
             except Exception:
                 pass
 
-            self.combo_gestion.configure(values=self.obtener_matriculas())
-            self.combo_gestion.set("")
+            self.combo_gestion.limpiar()
             for var in self.vars_modif.values():
                 var.set("")
 
@@ -672,34 +529,21 @@ class MantenimientoApp:
 
         try:
             self.conn.execute("DELETE FROM Coche WHERE matricula = ?", (matricula,))
-            self.conn.commit()
+            self.catalogo.cambio("Coche", matricula)
+            self.confirmar("Coche")
             messagebox.showinfo("Éxito", f"Coche {matricula} eliminado correctamente.")
 
-            # Refrescar combos y limpiar
-            for fn in ("cargar_coches", "actualizar_combo_matriculas", "recargar_coches_en_mantenimiento"):
+            # Quitar la matrícula eliminada de los selectores y limpiar
+            for fn in ("cargar_coches", "recargar_coches_en_mantenimiento"):
                 try:
                     getattr(self, fn)()
                 except Exception:
                     pass
 
-            self.combo_gestion.configure(values=self.obtener_matriculas())
-            self.combo_gestion.set("")
+            self.combo_gestion.limpiar()
             for var in self.vars_modif.values():
                 var.set("")
 
-            # Refrescar combobox de matrículas en pestaña Facturas
-            if hasattr(self, "factura_matricula_cb"):
-                try:
-                    self.factura_matricula_cb.configure(values=self.obtener_matriculas())
-                except Exception:
-                    pass        
-            # Refrescar combobox de matrículas en pestaña Gastos
-            if hasattr(self, "gasto_matricula_cb"):
-                try:
-                    self.gasto_matricula_cb.configure(values=self.obtener_matriculas())
-                except Exception:
-                    pass
-
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo eliminar el coche: {e}")
 
@@ -741,7 +585,7 @@ class MantenimientoApp:
 
         # Botones: Cargar, Refrescar, Eliminar
         ctk.CTkButton(frame, text="Cargar datos", hover_color="#515344", command=self.cargar_datos_tipo_componente).grid(row=7, column=0, pady=8)
-        ctk.CTkButton(frame, text="Refrescar lista", hover_color="#6168B5", command=lambda: self.combo_tipo_comp.configure(values=self.obtener_tipos_componentes())).grid(row=7, column=1, pady=8)
+        ctk.CTkButton(frame, text="Refrescar lista", hover_color="#6168B5", command=self.recargar_tipos_componente).grid(row=7, column=1, pady=8)
         ctk.CTkButton(frame, text="Eliminar tipo", fg_color="red", hover_color="#990000", command=self.eliminar_tipo_componente).grid(row=8, column=0, columnspan=2, pady=8)
 
         # Campos de modificación
@@ -759,13 +603,14 @@ class MantenimientoApp:
         frame.grid_columnconfigure(0, weight=0)
         frame.grid_columnconfigure(1, weight=1)
 
+        self.bus.suscribir({"TipoComponente"}, self.recargar_tipos_componente, "➕ Componentes")
+
+    def recargar_tipos_componente(self):
+        self.combo_tipo_comp.configure(values=self.obtener_tipos_componentes())
+
     def obtener_tipos_componentes(self):
         """Devuelve la lista de tipos de componentes registrados."""
-        try:
-            cursor = self.conn.execute("SELECT nombre FROM TipoComponente ORDER BY nombre")
-            return [row["nombre"] for row in cursor.fetchall()]
-        except Exception:
-            return []
+        return self.catalogo.tipos.etiquetas()
 
     def guardar_tipo_componente(self):
         """Guarda un nuevo tipo de componente."""
@@ -777,37 +622,15 @@ class MantenimientoApp:
             return
 
         try:
-            self.conn.execute("INSERT INTO TipoComponente (nombre, descripcion) VALUES (?, ?)", (nombre, descripcion))
-            self.conn.commit()
+            cursor = self.conn.execute("INSERT INTO TipoComponente (nombre, descripcion) VALUES (?, ?)", (nombre, descripcion))
+            self.catalogo.cambio("TipoComponente", cursor.lastrowid)
+            self.confirmar("TipoComponente")
             messagebox.showinfo("Éxito", f"Tipo de componente '{nombre}' añadido correctamente.")
 
-            # Refrescar listas
-            self.combo_tipo_comp.configure(values=self.obtener_tipos_componentes())
-            try:
-                self.recargar_tipos_en_producto()
-            except Exception as e:
-                print(f"No se pudo actualizar el combo de tipos en productos: {e}")
-            try:
-                self.recargar_tipos_en_mantenimiento()
-            except Exception as e:
-                print(f"No se pudo actualizar el combo de tipos en mantenimientos: {e}")
-
-
             # Limpiar formulario
             self.vars_tipo_comp["Nombre:"].set("")
             self.descripcion_tipo_componente.delete("1.0", "end")
 
-            try:
-                # Actualiza el combo aunque la pestaña no esté activa
-                tipos = sorted([r["nombre"] for r in self.conn.execute("SELECT * FROM TipoComponente").fetchall()])
-                if hasattr(self, "combo_producto_tipo") and self.combo_producto_tipo:
-                    self.combo_producto_tipo["values"] = tipos
-                    # Refresca el widget visualmente si tiene algún tipo ya seleccionado
-                    self.combo_producto_tipo.update()
-                print("Combo de productos actualizado con nuevos tipos.")
-            except Exception as e:
-                print(f"No se pudo actualizar el combo de tipos en productos: {e}")
-
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "Ya existe un tipo de componente con ese nombre.")
         except Exception as e:
@@ -851,25 +674,15 @@ class MantenimientoApp:
                 "UPDATE TipoComponente SET nombre = ?, descripcion = ? WHERE nombre = ?",
                 (nuevo_nombre, nueva_descripcion, nombre_original)
             )
-            self.conn.commit()
+            self.catalogo.cambio("TipoComponente", self.catalogo.tipos.clave_de(nombre_original))
+            self.confirmar("TipoComponente")
             messagebox.showinfo("Éxito", f"Tipo de componente '{nuevo_nombre}' actualizado correctamente.")
 
-            # Refrescar combos
-            self.combo_tipo_comp.configure(values=self.obtener_tipos_componentes())
+            # Limpiar
             self.combo_tipo_comp.set("")
             self.nombre_tipo_modif.set("")
             self.descripcion_tipo_modif.delete("1.0", "end")
 
-            try:
-                self.recargar_tipos_en_mantenimiento()
-            except Exception:
-                pass
-
-            try:
-                self.recargar_tipos_en_producto()
-            except Exception as e:
-                print(f"No se pudo actualizar el combo de tipos en productos: {e}")
-
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "Ya existe un tipo con ese nombre.")
         except Exception as e:
@@ -887,51 +700,23 @@ class MantenimientoApp:
 
         try:
             self.conn.execute("DELETE FROM TipoComponente WHERE nombre = ?", (nombre_sel,))
-            self.conn.commit()
+            self.catalogo.cambio("TipoComponente", self.catalogo.tipos.clave_de(nombre_sel))
+            self.confirmar("TipoComponente")
             messagebox.showinfo("Éxito", f"Tipo de componente '{nombre_sel}' eliminado correctamente.")
 
-            # Refrescar combos y limpiar
-            self.combo_tipo_comp.configure(values=self.obtener_tipos_componentes())
+            # Limpiar
             self.combo_tipo_comp.set("")
             self.nombre_tipo_modif.set("")
             self.descripcion_tipo_modif.delete("1.0", "end")
 
-            try:
-                self.recargar_tipos_en_mantenimiento()
-            except Exception:
-                pass
-
-            try:
-                self.recargar_tipos_en_producto()
-            except Exception as e:
-                print(f"No se pudo actualizar el combo de tipos en productos: {e}")
-
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo eliminar el tipo de componente: {e}")
 
 
     def recargar_coches_en_mantenimiento(self):
-        """Actualiza el combo de coches en la pestaña de mantenimientos."""
-        try:
-            cursor = self.conn.execute("SELECT matricula, marca, modelo FROM Coche ORDER BY matricula")
-            coches = [f"{row['matricula']} ({row['marca']} {row['modelo']})" for row in cursor.fetchall()]
-        
-            if hasattr(self, "combo_mant_coche"):
-                self.combo_mant_coche.set("")
-                self.combo_mant_coche['values'] = coches
-        except Exception as e:
-            print("Error al recargar coches en mantenimientos:", e)
-
-    def recargar_tipos_en_mantenimiento(self):
-        """Actualiza el combo de tipos de componente en la pestaña de mantenimientos."""
-        try:
-            tipos = [row["nombre"] for row in self.conn.execute("SELECT nombre FROM TipoComponente ORDER BY nombre").fetchall()]
-            if hasattr(self, "combo_mant_tipo"):
-                self.combo_mant_tipo.configure(values=tipos)
-                self.combo_mant_tipo.set("")  # opcional: limpia la selección actual
-            print("Combo de tipos de mantenimiento actualizado correctamente.")
-        except Exception as e:
-            print("Error al recargar tipos en mantenimientos:", e)
+        """Vacía el selector de coche de la pestaña de mantenimientos."""
+        if hasattr(self, "combo_mant_coche"):
+            self.combo_mant_coche.limpiar()
 
 
     # TAB AÑADIR PRODUCTO
@@ -1044,28 +829,14 @@ class MantenimientoApp:
 
         ctk.CTkButton(frame_eliminar, text="Eliminar producto", fg_color="red", hover_color="#b22222", command=self.eliminar_producto).pack(pady=10)
 
-
-        # Monitorear cambios de pestaña y actualizar los tipos si se entra en "Añadir producto"
-        self.root.after(500, self.verificar_pestana_activa)
-
-    def verificar_pestana_activa(self):
-        if self.tabview.get() == "➕ Añadir producto":
-            self.recargar_tipos_en_producto()
-        elif self.tabview.get() == "➕ Añadir obligaciones":
-            self.actualizar_combo_matriculas()  # Refresca matrículas
-
-        self.root.after(500, self.verificar_pestana_activa)
-
-        # Cargar la lista de productos existentes al crear la pestaña
-        try:
-            self.recargar_productos_existentes()
-        except Exception:
-            pass
+        self.bus.suscribir({"TipoComponente"}, self.recargar_tipos_en_producto, "➕ Productos")
+        self.bus.suscribir({"Producto", "TipoComponente"}, self.actualizar_combo_productos, "➕ Productos")
+        self.bus.suscribir({"Producto", "TipoComponente"}, self.actualizar_combo_productos_eliminar, "➕ Productos")
 
     def actualizar_tipos_componente_en_productos(self, event=None):
         """Refresca los tipos de componente en el combo de productos."""
         if hasattr(self, "vars_producto"):
-            tipos = sorted([r["nombre"] for r in self.conn.execute("SELECT * FROM TipoComponente").fetchall()])
+            tipos = self.obtener_tipos_componentes()
             combo = self.tab_agregar_producto.nametowidget(str(self.combo_producto))
             combo["values"] = tipos
 
@@ -1109,8 +880,8 @@ class MantenimientoApp:
                 vida_meses
             ))
             id_producto_nuevo = cur.lastrowid
-            self.conn.commit()
-            self.actualizar_combo_producto()
+            self.catalogo.cambio("Producto", id_producto_nuevo)
+            self.confirmar("Producto")
 
             messagebox.showinfo(
                 "Éxito",
@@ -1124,18 +895,9 @@ class MantenimientoApp:
                 else:
                     v.set("")
 
-            # --- ACTUALIZAR LOS COMBOS AUTOMÁTICAMENTE ---
-            self.actualizar_combo_productos()
-            self.actualizar_combo_productos_eliminar()
-
             # --- Seleccionar automáticamente el nuevo producto en los combos ---
             try:
-                # Construir la cadena con el mismo formato que usan las funciones de carga
-                tipo_nombre = datos["Tipo de componente:"]
-                marca = datos["Marca:"]
-                modelo = datos["Modelo:"]
-                tipo_field = datos["Tipo:"] or ""
-                nuevo_label = f"{tipo_nombre} / {marca} {modelo} {tipo_field}"
+                nuevo_label = self.catalogo.productos.etiqueta(id_producto_nuevo)
 
                 # Establecer el valor en ambos combos si existen
                 if hasattr(self, "combo_producto_existente"):
@@ -1150,38 +912,14 @@ class MantenimientoApp:
             messagebox.showerror("Error", f"No se pudo guardar el producto: {e}")
 
 
-    def verificar_pestana_activa(self):
-        """Comprueba periódicamente si se ha activado la pestaña de 'Añadir producto'."""
-        if self.tabview.get() == "➕ Añadir producto":
-            self.recargar_tipos_en_producto()
-        # Vuelve a comprobar cada 500ms
-        self.root.after(500, self.verificar_pestana_activa)
-     
-
     def recargar_tipos_en_producto(self, event=None):
-        """Recarga los tipos de componente disponibles al entrar a la pestaña de producto."""
-        if self.tabview.get() == "➕ Añadir producto":
-            tipos = sorted([r["nombre"] for r in self.conn.execute("SELECT * FROM TipoComponente").fetchall()])
-            if self.combo_producto_tipo:
-                self.combo_producto_tipo["values"] = tipos
+        """Recarga los tipos de componente disponibles en el formulario de producto."""
+        if self.combo_producto_tipo:
+            self.combo_producto_tipo["values"] = self.obtener_tipos_componentes()
 
     def actualizar_combo_productos(self):
         """Rellena el combo de modificación con los productos disponibles (sin mostrar ID, orden A–Z)."""
-        productos = self.conn.execute("""
-            SELECT p.id_producto, tc.nombre AS tipo_componente, p.marca, p.modelo, p.tipo
-            FROM Producto p
-            JOIN TipoComponente tc ON p.id_tipo = tc.id_tipo
-        """).fetchall()
-
-        # Crear el diccionario mapeando texto visible - id_producto
-        self.mapa_productos = {
-            f"{r['tipo_componente']} / {r['marca']} {r['modelo']} {r['tipo']}": r['id_producto']
-            for r in productos
-        }
-
-        # Ordenar alfabéticamente los nombres mostrados
-        lista = sorted(self.mapa_productos.keys(), key=str.lower)
-        self.combo_producto_existente["values"] = lista
+        self.combo_producto_existente["values"] = self.catalogo.productos.etiquetas()
 
     def cargar_datos_producto(self, event=None):
         """Carga los datos del producto seleccionado en los campos de modificación."""
@@ -1190,8 +928,8 @@ class MantenimientoApp:
             messagebox.showwarning("Aviso", "Selecciona un producto para modificar.")
             return
 
-        # Recuperar el id_producto directamente del mapa
-        id_producto = self.mapa_productos.get(seleccionado)
+        # Recuperar el id_producto directamente del catálogo
+        id_producto = self.catalogo.productos.clave_de(seleccionado)
         if not id_producto:
             messagebox.showerror("Error", "No se pudo identificar el producto seleccionado.")
             return
@@ -1280,12 +1018,10 @@ class MantenimientoApp:
                 self.id_producto_actual
             ))
 
-            self.conn.commit()
+            self.catalogo.cambio("Producto", self.id_producto_actual)
+            self.confirmar("Producto")
 
-            # --- Mensaje y actualización de combos ---
             messagebox.showinfo("Éxito", f"El producto '{marca} {modelo}' se actualizó correctamente.")
-            self.actualizar_combo_productos()
-            self.actualizar_combo_productos_eliminar()
 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo actualizar: {e}")
@@ -1293,21 +1029,7 @@ class MantenimientoApp:
 
     def actualizar_combo_productos_eliminar(self):
         """Rellena el combo de eliminación con los productos disponibles (sin mostrar ID, igual que el de modificar)."""
-        productos = self.conn.execute("""
-            SELECT p.id_producto, tc.nombre AS tipo_componente, p.marca, p.modelo, p.tipo
-            FROM Producto p
-            JOIN TipoComponente tc ON p.id_tipo = tc.id_tipo
-        """).fetchall()
-
-        # Crear el diccionario mapeando texto visible - id_producto
-        self.mapa_productos_eliminar = {
-            f"{r['tipo_componente']} / {r['marca']} {r['modelo']} {r['tipo']}": r['id_producto']
-            for r in productos
-        }
-
-        # Ordenar alfabéticamente los nombres mostrados
-        lista = sorted(self.mapa_productos_eliminar.keys(), key=str.lower)
-        self.combo_eliminar_producto["values"] = lista
+        self.combo_eliminar_producto["values"] = self.catalogo.productos.etiquetas()
 
 
     def eliminar_producto(self):
@@ -1317,7 +1039,7 @@ class MantenimientoApp:
             messagebox.showwarning("Aviso", "Selecciona un producto para eliminar.")
             return
 
-        id_producto = self.mapa_productos_eliminar.get(seleccion)
+        id_producto = self.catalogo.productos.clave_de(seleccion)
         if not id_producto:
             messagebox.showerror("Error", "No se pudo identificar el producto seleccionado.")
             return
@@ -1326,25 +1048,12 @@ class MantenimientoApp:
         if confirmar:
             try:
                 self.conn.execute("DELETE FROM Producto WHERE id_producto = ?", (id_producto,))
-                self.conn.commit()
+                self.catalogo.cambio("Producto", id_producto)
+                self.confirmar("Producto")
                 messagebox.showinfo("Éxito", f"Producto '{seleccion}' eliminado correctamente.")
-                self.actualizar_combo_productos()
-                self.actualizar_combo_productos_eliminar()
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo eliminar el producto: {e}")
 
-    def recargar_productos_existentes(self):
-        """Recarga y pone en self.combo_producto_existente la lista de productos.
-        Formato visible: 'id_producto - Marca Modelo (Tipo)' para distinguirlos."""
-        try:
-            cursor = self.conn.execute("SELECT id_producto, marca, modelo, tipo FROM Producto ORDER BY marca, modelo")
-            productos = [f"{row['id_producto']} - {row['marca']} {row['modelo']} ({row['tipo'] or ''})" for row in cursor.fetchall()]
-            if hasattr(self, "combo_producto_existente"):
-                self.combo_producto_existente.configure(values=productos)
-        except Exception as e:
-            print("Error al recargar productos:", e)
-
-
     # TAB AÑADIR MANTENIMIENTO
 
     def crear_tab_agregar_mantenimiento(self):
@@ -1356,15 +1065,13 @@ class MantenimientoApp:
         # Coche
         ctk.CTkLabel(frame, text="Coche:", font=("Arial", 18)).grid(row=1, column=0, sticky="e", padx=10, pady=5)
         self.mant_coche_var = ctk.StringVar()
-        coches = [r['matricula'] for r in self.conn.execute("SELECT * FROM Coche").fetchall()]
-        self.combo_mant_coche = ttk.Combobox(frame, textvariable=self.mant_coche_var, values=coches, state="readonly", width=35)
+        self.combo_mant_coche = SelectorCoche(frame, self.conn, detalle=True, textvariable=self.mant_coche_var, width=35)
         self.combo_mant_coche.grid(row=1, column=1, padx=10, pady=5)
 
         # Tipo de componente
         ctk.CTkLabel(frame, text="Tipo de componente:", font=("Arial", 18)).grid(row=2, column=0, sticky="e", padx=10, pady=5)
         self.mant_tipo_var = ctk.StringVar()
-        tipos = sorted([r['nombre'] for r in self.conn.execute("SELECT * FROM TipoComponente").fetchall()])
-        self.combo_mant_tipo = ttk.Combobox(frame, textvariable=self.mant_tipo_var, values=tipos, state="readonly", width=35)
+        self.combo_mant_tipo = ttk.Combobox(frame, textvariable=self.mant_tipo_var, values=self.obtener_tipos_componentes(), state="readonly", width=35)
         self.combo_mant_tipo.grid(row=2, column=1, padx=10, pady=5)
         self.combo_mant_tipo.bind("<<ComboboxSelected>>", self.actualizar_combo_producto)
 
@@ -1440,11 +1147,13 @@ class MantenimientoApp:
 
         ctk.CTkButton(frame_eliminar, text="Eliminar mantenimiento", fg_color="red", hover_color="#b22222", command=self.eliminar_mantenimiento).pack(pady=10)
 
+        self.bus.suscribir({"TipoComponente"}, self.recargar_tipos_en_mantenimiento, "➕ Mantenimientos")
+        self.bus.suscribir({"Producto", "TipoComponente"}, self.actualizar_combo_producto, "➕ Mantenimientos")
+        for refrescar in (self.actualizar_combo_mantenimientos, self.actualizar_combo_mantenimientos_eliminar):
+            self.bus.suscribir({"Mantenimiento", "Coche", "Producto", "TipoComponente"}, refrescar, "➕ Mantenimientos")
 
         self.recargar_coches_en_mantenimiento()
 
-        self.combo_mant_coche['values'] = self.obtener_matriculas(mostrar_detalle=True)
-
 
     def actualizar_combo_producto(self, event=None):
         tipo_sel = self.mant_tipo_var.get().strip()
@@ -1472,7 +1181,9 @@ class MantenimientoApp:
         print(tipo_sel, productos)  # Depuración
 
     def guardar_mantenimiento(self):
-        coche = self.mant_coche_var.get().split(' ')[0]
+        coche = self.coche_elegido(self.combo_mant_coche)
+        if coche is None:
+            return
         producto_str = self.mant_producto_var.get()
 
         # Para "Descripción", que es un CTkTextbox, hay que usar .get("1.0","end")
@@ -1487,6 +1198,12 @@ class MantenimientoApp:
             messagebox.showerror("Error", "Por favor completa todos los campos correctamente.")
             return
 
+        try:
+            fecha = normalizar_fecha(datos["Fecha:"])
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
         # Extraer marca, modelo y tipo_componente del producto seleccionado
         try:
             marca, modelo, tipo_componente = producto_str.split("|")
@@ -1508,11 +1225,13 @@ class MantenimientoApp:
 
         id_producto = id_producto_row["id_producto"]
 
-        self.conn.execute(
+        cursor = self.conn.execute(
             "INSERT INTO Mantenimiento (matricula, id_producto, fecha, km, descripcion) VALUES (?, ?, ?, ?, ?)",
-            (coche, id_producto, datos["Fecha:"], int(datos["Kilómetros:"]), datos["Descripción:"])
+            (coche, id_producto, fecha, int(datos["Kilómetros:"]), datos["Descripción:"])
         )
-        self.conn.commit()
+        id_mant = cursor.lastrowid
+        self.catalogo.cambio("Mantenimiento", id_mant)
+        self.confirmar("Mantenimiento")
         messagebox.showinfo("Éxito", "Mantenimiento registrado correctamente.")
 
         # Limpiar campos
@@ -1526,36 +1245,9 @@ class MantenimientoApp:
         self.mant_tipo_var.set("")
         self.mant_producto_var.set("")
 
-        # Refrescar mantenimientos si se muestra el coche correspondiente
-        coche_seleccionado = self.coche_var.get()
-        if coche_seleccionado and coche_seleccionado.split(" ")[0] == coche:
-            self.mostrar_mantenimientos()
-
-        # Refrescar los combos de mantenimiento (modificar / eliminar)
-        self.actualizar_combo_mantenimientos()
-        self.actualizar_combo_mantenimientos_eliminar()
-
         # Seleccionar automáticamente el mantenimiento recién creado
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT M.id_mantenimiento, C.matricula, TC.nombre AS tipo_componente,
-                   P.marca, P.modelo, P.tipo, M.fecha
-            FROM Mantenimiento M
-            LEFT JOIN Coche C ON M.matricula = C.matricula
-            LEFT JOIN Producto P ON M.id_producto = P.id_producto
-            LEFT JOIN TipoComponente TC ON P.id_tipo = TC.id_tipo
-            ORDER BY M.id_mantenimiento DESC
-            LIMIT 1
-        """)
-        ultimo = cursor.fetchone()
-
-        if ultimo:
-            texto_combo = f"{ultimo['matricula']} / {ultimo['tipo_componente']}, {ultimo['marca']} {ultimo['modelo']} {ultimo['tipo']} ({ultimo['fecha']})"
-
-            # Actualizar los combos para que incluyan el nuevo registro
-            self.actualizar_combo_mantenimientos()
-            self.actualizar_combo_mantenimientos_eliminar()
-
+        texto_combo = self.catalogo.mantenimientos.etiqueta(id_mant)
+        if texto_combo:
             # Seleccionar automáticamente en ambos combos
             self.combo_mant_existente.set(texto_combo)
             self.combo_eliminar_mant.set(texto_combo)
@@ -1565,30 +1257,11 @@ class MantenimientoApp:
 
             
     def recargar_tipos_en_mantenimiento(self):
-        tipos = sorted([r['nombre'] for r in self.conn.execute("SELECT * FROM TipoComponente").fetchall()])
-        self.combo_mant_tipo['values'] = tipos
+        self.combo_mant_tipo['values'] = self.obtener_tipos_componentes()
 
     def actualizar_combo_mantenimientos(self):
         """Carga los mantenimientos disponibles en el combo de modificación (sin mostrar el id)."""
-        mantenimientos = self.conn.execute("""
-            SELECT M.id_mantenimiento, C.matricula, TC.nombre AS tipo_componente,
-                P.marca, P.modelo, P.tipo, M.fecha
-            FROM Mantenimiento M
-            LEFT JOIN Coche C ON M.matricula = C.matricula
-            LEFT JOIN Producto P ON M.id_producto = P.id_producto
-            LEFT JOIN TipoComponente TC ON P.id_tipo = TC.id_tipo
-            ORDER BY C.matricula ASC, M.fecha DESC
-        """).fetchall()
-
-        # Crear mapa: texto visible - id_mantenimiento
-        self.mapa_mantenimientos = {
-            f"{r['matricula']} / {r['tipo_componente']}, {r['marca']} {r['modelo']} {r['tipo']} ({r['fecha']})": r['id_mantenimiento']
-            for r in mantenimientos if r['matricula'] and r['tipo_componente']
-        }
-
-        # Rellenar el combo ordenado alfabéticamente
-        lista = sorted(self.mapa_mantenimientos.keys(), key=str.lower)
-        self.combo_mant_existente["values"] = lista
+        self.combo_mant_existente["values"] = self.catalogo.mantenimientos.etiquetas()
 
 
     def cargar_datos_mantenimiento(self):
@@ -1598,7 +1271,7 @@ class MantenimientoApp:
             messagebox.showwarning("Aviso", "Selecciona un mantenimiento para modificar.")
             return
 
-        id_mant = self.mapa_mantenimientos.get(seleccionado)
+        id_mant = self.catalogo.mantenimientos.clave_de(seleccionado)
         row = self.conn.execute("SELECT * FROM Mantenimiento WHERE id_mantenimiento = ?", (id_mant,)).fetchone()
         if not row:
             messagebox.showerror("Error", "No se encontró el mantenimiento seleccionado.")
@@ -1623,41 +1296,29 @@ class MantenimientoApp:
             messagebox.showerror("Error", "El campo fecha es obligatorio.")
             return
 
+        try:
+            fecha = normalizar_fecha(fecha)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
         try:
             self.conn.execute("""
                 UPDATE Mantenimiento
                 SET fecha = ?, km = ?, descripcion = ?
                 WHERE id_mantenimiento = ?
             """, (fecha, int(km) if km else 0, descripcion, self.id_mant_actual))
-            self.conn.commit()
+            self.catalogo.cambio("Mantenimiento", self.id_mant_actual)
+            self.confirmar("Mantenimiento")
 
             messagebox.showinfo("Éxito", "Mantenimiento actualizado correctamente.")
-            self.actualizar_combo_mantenimientos()
-            self.actualizar_combo_mantenimientos_eliminar()
 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo actualizar: {e}")
 
     def actualizar_combo_mantenimientos_eliminar(self):
         """Rellena el combo de eliminación con los mantenimientos disponibles (sin mostrar el id)."""
-        mantenimientos = self.conn.execute("""
-            SELECT M.id_mantenimiento, C.matricula, TC.nombre AS tipo_componente,
-                P.marca, P.modelo, P.tipo, M.fecha
-            FROM Mantenimiento M
-            LEFT JOIN Coche C ON M.matricula = C.matricula
-            LEFT JOIN Producto P ON M.id_producto = P.id_producto
-            LEFT JOIN TipoComponente TC ON P.id_tipo = TC.id_tipo
-            ORDER BY C.matricula ASC, M.fecha DESC
-        """).fetchall()
-
-        # Crear mapa: texto visible - id_mantenimiento
-        self.mapa_mant_eliminar = {
-            f"{r['matricula']} / {r['tipo_componente']}, {r['marca']} {r['modelo']} {r['tipo']} ({r['fecha']})": r['id_mantenimiento']
-            for r in mantenimientos if r['matricula'] and r['tipo_componente']
-        }
-
-        lista = sorted(self.mapa_mant_eliminar.keys(), key=str.lower)
-        self.combo_eliminar_mant["values"] = lista
+        self.combo_eliminar_mant["values"] = self.catalogo.mantenimientos.etiquetas()
 
 
     def eliminar_mantenimiento(self):
@@ -1667,23 +1328,13 @@ class MantenimientoApp:
             messagebox.showwarning("Aviso", "Selecciona un mantenimiento para eliminar.")
             return
 
-        id_mant = self.mapa_mant_eliminar.get(seleccion)
+        id_mant = self.catalogo.mantenimientos.clave_de(seleccion)
         confirmar = messagebox.askyesno("Confirmar", "¿Seguro que deseas eliminar este mantenimiento?")
         if confirmar:
             self.conn.execute("DELETE FROM Mantenimiento WHERE id_mantenimiento = ?", (id_mant,))
-            self.conn.commit()
+            self.catalogo.cambio("Mantenimiento", id_mant)
+            self.confirmar("Mantenimiento")
             messagebox.showinfo("Éxito", "Mantenimiento eliminado correctamente.")
-            self.actualizar_combo_mantenimientos()
-            self.actualizar_combo_mantenimientos_eliminar()
-
-        # --- Refrescar la pestaña "Vehículos" si el coche eliminado está seleccionado ---
-        try:
-            if hasattr(self, "coche_var") and self.coche_var.get():
-                self.mostrar_mantenimientos()
-                self.mostrar_gastos_coche()
-                self.mostrar_facturas_coche()
-        except Exception as e:
-            print("Error al refrescar la pestaña Vehículos tras eliminar mantenimiento:", e)
 
 
 
@@ -1722,7 +1373,7 @@ class MantenimientoApp:
             if campo == "Coche:":
                 var = ctk.StringVar()
                 self.vars_obligacion[campo] = var
-                self.obl_coche_cb = ttk.Combobox(frame, textvariable=var, state="readonly", width=35, values=self.obtener_matriculas())
+                self.obl_coche_cb = SelectorCoche(frame, self.conn, textvariable=var, width=35)
                 self.obl_coche_cb.grid(row=i+1, column=1, padx=10, pady=5)
 
             elif campo == "Tipo:":
@@ -1796,6 +1447,9 @@ class MantenimientoApp:
 
         ctk.CTkButton(frame_eliminar, text="Eliminar obligación", fg_color="red", hover_color="#b22222",
                       command=self.eliminar_obligacion).pack(pady=10)
+
+        for refrescar in (self.actualizar_combo_obligaciones, self.actualizar_combo_obligaciones_eliminar):
+            self.bus.suscribir({"Obligaciones"}, refrescar, "➕ Obligaciones")
         
 
     def guardar_obligacion(self):
@@ -1810,36 +1464,37 @@ class MantenimientoApp:
             messagebox.showerror("Error", "Por favor, selecciona un coche y tipo de obligación.")
             return
 
+        coche = self.coche_elegido(self.obl_coche_cb)
+        if coche is None:
+            return
+
         try:
-            self.conn.execute("""
+            fecha_inicio = normalizar_fecha(datos["Fecha inicio:"], obligatoria=False)
+            fecha_vencimiento = normalizar_fecha(datos["Fecha vencimiento:"], obligatoria=False)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+
+        try:
+            cursor = self.conn.execute("""
                 INSERT INTO Obligaciones (matricula, tipo, descripcion, fecha_inicio, fecha_vencimiento)
                 VALUES (?, ?, ?, ?, ?)
             """, (
-                datos["Coche:"],
+                coche,
                 datos["Tipo:"],
                 datos["Descripción:"],
-                datos["Fecha inicio:"],
-                datos["Fecha vencimiento:"]
+                fecha_inicio,
+                fecha_vencimiento
             ))
-            self.conn.commit()
+            self.catalogo.cambio("Obligaciones", cursor.lastrowid)
+            self.confirmar("Obligaciones")
             messagebox.showinfo("Éxito", "Obligación guardada correctamente.")
-            self.actualizar_combo_obligaciones()
-            self.actualizar_combo_obligaciones_eliminar()
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo guardar la obligación: {e}")
 
 
     def actualizar_combo_obligaciones(self):
-        obligaciones = self.conn.execute("""
-            SELECT id_obligacion, matricula, tipo, fecha_vencimiento
-            FROM Obligaciones ORDER BY fecha_vencimiento DESC
-        """).fetchall()
-
-        self.mapa_obligaciones = {
-            f"{r['matricula']} - {r['tipo']} (vence {r['fecha_vencimiento']})": r["id_obligacion"]
-            for r in obligaciones
-        }
-        self.combo_obligacion_existente["values"] = sorted(self.mapa_obligaciones.keys())
+        self.combo_obligacion_existente["values"] = self.catalogo.obligaciones.etiquetas()
 
 
     def cargar_datos_obligacion(self):
@@ -1847,7 +1502,7 @@ class MantenimientoApp:
         if not seleccion:
             messagebox.showwarning("Aviso", "Selecciona una obligación para modificar.")
             return
-        id_obl = self.mapa_obligaciones.get(seleccion)
+        id_obl = self.catalogo.obligaciones.clave_de(seleccion)
         row = self.conn.execute("SELECT * FROM Obligaciones WHERE id_obligacion = ?", (id_obl,)).fetchone()
         if not row:
             messagebox.showerror("Error", "No se encontró la obligación seleccionada.")
@@ -1855,9 +1510,9 @@ class MantenimientoApp:
         self.entry_tipo_mod_obl.delete(0, "end")
         self.entry_tipo_mod_obl.insert(0, row["tipo"])
         self.entry_inicio_mod_obl.delete(0, "end")
-        self.entry_inicio_mod_obl.insert(0, row["fecha_inicio"])
+        self.entry_inicio_mod_obl.insert(0, row["fecha_inicio"] or "")
         self.entry_venc_mod_obl.delete(0, "end")
-        self.entry_venc_mod_obl.insert(0, row["fecha_vencimiento"])
+        self.entry_venc_mod_obl.insert(0, row["fecha_vencimiento"] or "")
         self.txt_desc_mod_obl.delete("1.0", "end")
         self.txt_desc_mod_obl.insert("1.0", row["descripcion"])
         self.id_obligacion_actual = id_obl
@@ -1867,6 +1522,12 @@ class MantenimientoApp:
         if not hasattr(self, "id_obligacion_actual"):
             messagebox.showwarning("Aviso", "Primero carga una obligación antes de modificar.")
             return
+        try:
+            fecha_inicio = normalizar_fecha(self.entry_inicio_mod_obl.get(), obligatoria=False)
+            fecha_vencimiento = normalizar_fecha(self.entry_venc_mod_obl.get(), obligatoria=False)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
         try:
             self.conn.execute("""
                 UPDATE Obligaciones
@@ -1875,28 +1536,19 @@ class MantenimientoApp:
             """, (
                 self.entry_tipo_mod_obl.get().strip(),
                 self.txt_desc_mod_obl.get("1.0", "end").strip(),
-                self.entry_inicio_mod_obl.get().strip(),
-                self.entry_venc_mod_obl.get().strip(),
+                fecha_inicio,
+                fecha_vencimiento,
                 self.id_obligacion_actual
             ))
-            self.conn.commit()
+            self.catalogo.cambio("Obligaciones", self.id_obligacion_actual)
+            self.confirmar("Obligaciones")
             messagebox.showinfo("Éxito", "Obligación actualizada correctamente.")
-            self.actualizar_combo_obligaciones()
-            self.actualizar_combo_obligaciones_eliminar()
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo actualizar la obligación: {e}")
 
 
     def actualizar_combo_obligaciones_eliminar(self):
-        obligaciones = self.conn.execute("""
-            SELECT id_obligacion, matricula, tipo, fecha_vencimiento
-            FROM Obligaciones ORDER BY fecha_vencimiento DESC
-        """).fetchall()
-        self.mapa_obligaciones_eliminar = {
-            f"{r['matricula']} - {r['tipo']} (vence {r['fecha_vencimiento']})": r["id_obligacion"]
-            for r in obligaciones
-        }
-        self.combo_eliminar_obligacion["values"] = sorted(self.mapa_obligaciones_eliminar.keys())
+        self.combo_eliminar_obligacion["values"] = self.catalogo.obligaciones.etiquetas()
 
 
     def eliminar_obligacion(self):
@@ -1904,14 +1556,13 @@ class MantenimientoApp:
         if not seleccion:
             messagebox.showwarning("Aviso", "Selecciona una obligación para eliminar.")
             return
-        id_obl = self.mapa_obligaciones_eliminar.get(seleccion)
+        id_obl = self.catalogo.obligaciones.clave_de(seleccion)
         confirmar = messagebox.askyesno("Confirmar", f"¿Seguro que deseas eliminar '{seleccion}'?")
         if confirmar:
             self.conn.execute("DELETE FROM Obligaciones WHERE id_obligacion = ?", (id_obl,))
-            self.conn.commit()
+            self.catalogo.cambio("Obligaciones", id_obl)
+            self.confirmar("Obligaciones")
             messagebox.showinfo("Éxito", "Obligación eliminada correctamente.")
-            self.actualizar_combo_obligaciones()
-            self.actualizar_combo_obligaciones_eliminar()
 
 
     # PESTAÑA PROVEEDORES
@@ -1961,16 +1612,20 @@ class MantenimientoApp:
         self.tree_proveedores.pack(fill="both", expand=True, pady=10)
         self.tree_proveedores.bind("<<TreeviewSelect>>", self.seleccionar_proveedor)
 
+        # Modelo por clave primaria: cada edición toca solo su fila
+        self.modelo_proveedores = ModeloTabla(
+            self.tree_proveedores,
+            clave=lambda r: r["id_proveedor"],
+            valores=tuple,
+            orden=lambda r: r["id_proveedor"]
+        )
+
         self.actualizar_tabla_proveedores()
+        self.bus.suscribir({"Proveedor"}, self.actualizar_tabla_proveedores, "➕ Proveedores")
 
 
     def actualizar_tabla_proveedores(self):
-        for fila in self.tree_proveedores.get_children():
-            self.tree_proveedores.delete(fila)
-
-        cursor = self.conn.execute("SELECT * FROM Proveedor ORDER BY id_proveedor")
-        for fila in cursor.fetchall():
-            self.tree_proveedores.insert("", "end", values=tuple(fila))
+        self.modelo_proveedores.sincronizar(consultas.tabla_proveedores(self.conn))
 
 
     def guardar_proveedor(self):
@@ -1990,7 +1645,9 @@ class MantenimientoApp:
                 datos["nombre"], datos["cif_nif"], datos["tipo"], datos["telefono"],
                 datos["email"], datos["direccion"], datos["descripcion"], id_sel
             ))
-            self.conn.commit()
+            self.catalogo.cambio("Proveedor", int(id_sel))
+            self.confirmar("Proveedor", excepto=(self.actualizar_tabla_proveedores,))
+            self.modelo_proveedores.upsert(consultas.proveedor(self.conn, id_sel))
         else:
             cursor = self.conn.execute("""
                 INSERT INTO Proveedor (nombre, cif_nif, tipo, telefono, email, direccion, descripcion)
@@ -1999,23 +1656,15 @@ class MantenimientoApp:
                 datos["nombre"], datos["cif_nif"], datos["tipo"], datos["telefono"],
                 datos["email"], datos["direccion"], datos["descripcion"]
             ))
-            self.conn.commit()
-
-            # Selecciona automáticamente el nuevo
+            # Añade la fila y selecciona automáticamente el nuevo
             nuevo_id = cursor.lastrowid
-            self.actualizar_tabla_proveedores()
-            for item in self.tree_proveedores.get_children():
-                if self.tree_proveedores.item(item, "values")[0] == str(nuevo_id):
-                    self.tree_proveedores.selection_set(item)
-                    self.tree_proveedores.focus(item)
-                    self.tree_proveedores.see(item)
-                    break
+            self.catalogo.cambio("Proveedor", nuevo_id)
+            self.confirmar("Proveedor", excepto=(self.actualizar_tabla_proveedores,))
+            self.modelo_proveedores.upsert(consultas.proveedor(self.conn, nuevo_id))
+            self.modelo_proveedores.seleccionar(nuevo_id)
 
-        self.actualizar_tabla_proveedores()
         messagebox.showinfo("Éxito", "Proveedor guardado correctamente.")
 
-        self.recargar_proveedores_en_facturas()
-
     def seleccionar_proveedor(self, event):
         item_sel = self.tree_proveedores.selection()
         if not item_sel:
@@ -2037,10 +1686,10 @@ class MantenimientoApp:
         confirmar = messagebox.askyesno("Confirmar", "¿Eliminar este proveedor?")
         if confirmar:
             self.conn.execute("DELETE FROM Proveedor WHERE id_proveedor=?", (id_sel,))
-            self.conn.commit()
-            self.actualizar_tabla_proveedores()
+            self.catalogo.cambio("Proveedor", int(id_sel))
+            self.confirmar("Proveedor", excepto=(self.actualizar_tabla_proveedores,))
+            self.modelo_proveedores.eliminar(id_sel)
             self.limpiar_form_proveedor()
-            self.recargar_proveedores_en_facturas()
 
 
     def limpiar_form_proveedor(self):
@@ -2049,14 +1698,7 @@ class MantenimientoApp:
         self.tree_proveedores.selection_remove(self.tree_proveedores.selection())
 
     def recargar_proveedores_en_facturas(self):
-        cursor = self.conn.execute("SELECT id_proveedor, nombre FROM Proveedor ORDER BY nombre")
-        proveedores = cursor.fetchall()
-
-        # Actualizamos dict
-        self.proveedor_dict = {p["nombre"]: p["id_proveedor"] for p in proveedores}
-
-        # Actualizamos combobox
-        self.factura_proveedor_cb["values"] = list(self.proveedor_dict.keys())
+        self.factura_proveedor_cb["values"] = self.catalogo.proveedores.etiquetas()
 
 
     # PESTAÑA FACTURAS
@@ -2071,15 +1713,6 @@ class MantenimientoApp:
             row=0, column=0, columnspan=2, pady=10
         )
 
-        # --- Obtener matrículas ---
-        cursor = self.conn.execute("SELECT matricula FROM Coche ORDER BY matricula")
-        matriculas = [row["matricula"] for row in cursor.fetchall()]
-
-        # --- Obtener proveedores ---
-        cursor = self.conn.execute("SELECT id_proveedor, nombre FROM Proveedor ORDER BY nombre")
-        proveedores = cursor.fetchall()
-        self.proveedor_dict = {p["nombre"]: p["id_proveedor"] for p in proveedores}
-
         # --- Variables de los campos ---
         self.factura_vars = {
             "id_factura": None,
@@ -2094,11 +1727,10 @@ class MantenimientoApp:
         ctk.CTkLabel(frame, text="Vehículo (Matrícula):", font=("Arial", 16)).grid(
             row=1, column=0, sticky="e", padx=10, pady=5
         )
-        self.factura_matricula_cb = ttk.Combobox(
+        self.factura_matricula_cb = SelectorCoche(
             frame,
+            self.conn,
             textvariable=self.factura_vars["matricula"],
-            values=matriculas,
-            state="readonly",
             width=40
         )
         self.factura_matricula_cb.grid(row=1, column=1, padx=10, pady=5)
@@ -2110,7 +1742,7 @@ class MantenimientoApp:
         self.factura_proveedor_cb = ttk.Combobox(
             frame,
             textvariable=self.factura_vars["id_proveedor"],
-            values=list(self.proveedor_dict.keys()),
+            values=self.catalogo.proveedores.etiquetas(),
             state="readonly",
             width=40
         )
@@ -2148,13 +1780,19 @@ class MantenimientoApp:
         ctk.CTkButton(botones_frame, text="Limpiar", command=self.limpiar_form_factura).grid(row=0, column=2, padx=10)
 
         # --- Listado de facturas ---
+        contenedor = ctk.CTkFrame(frame, fg_color="transparent")
+        contenedor.grid(row=7, column=0, columnspan=2, pady=(10, 0))
         self.tree_facturas = ttk.Treeview(
-            frame,
+            contenedor,
             columns=("id", "proveedor", "num", "fecha", "importe", "matricula"),
             show="headings",
             height=10
         )
-        self.tree_facturas.grid(row=7, column=0, columnspan=2, pady=10)
+        scroll_facturas = ttk.Scrollbar(contenedor, orient="vertical", command=self.tree_facturas.yview)
+        self.tree_facturas.pack(side="left")
+        scroll_facturas.pack(side="right", fill="y")
+        self.label_paginacion_facturas = ctk.CTkLabel(frame, text="")
+        self.label_paginacion_facturas.grid(row=8, column=0, columnspan=2, pady=(0, 10))
 
         for col, title in zip(("id", "proveedor", "num", "fecha", "importe", "matricula"),
                             ("ID", "Proveedor", "Nº Factura", "Fecha", "Importe €", "Matrícula")):
@@ -2163,8 +1801,27 @@ class MantenimientoApp:
 
         self.tree_facturas.bind("<<TreeviewSelect>>", self.seleccionar_factura)
 
+        self.modelo_facturas = ModeloTabla(
+            self.tree_facturas,
+            clave=lambda r: r["id_factura"],
+            valores=lambda r: (r["id_factura"], r["proveedor"], r["num_factura"], r["fecha_emision"], r["importe_total"], r["matricula"] or ""),
+            orden=lambda r: (r["fecha_emision"] or "", r["id_factura"]),
+            descendente=True
+        )
+        self.paginador_facturas = TablaPaginada(
+            self.modelo_facturas, self.ejecutor, "tabla_facturas",
+            pagina=consultas.pagina_facturas,
+            contar=consultas.total_facturas,
+            clave_pagina=lambda r: (r["fecha_emision"], r["id_factura"]),
+            etiqueta=self.label_paginacion_facturas,
+            scrollbar=scroll_facturas,
+            texto="facturas"
+        )
+
         # --- Cargar datos iniciales ---
         self.actualizar_tabla_facturas()
+        self.bus.suscribir({"Proveedor"}, self.recargar_proveedores_en_facturas, "➕ Facturas")
+        self.bus.suscribir({"Factura", "Proveedor"}, self.actualizar_tabla_facturas, "➕ Facturas")
 
         # --- Centrado visual general ---
         frame.grid_columnconfigure(0, weight=1)
@@ -2172,26 +1829,18 @@ class MantenimientoApp:
 
 
     def actualizar_tabla_facturas(self):
-        """Carga todas las facturas en la tabla."""
-        for fila in self.tree_facturas.get_children():
-            self.tree_facturas.delete(fila)
-
-        query = """
-            SELECT f.id_factura, p.nombre AS proveedor, f.num_factura, f.fecha_emision, f.importe_total, f.matricula
-            FROM Factura f
-            JOIN Proveedor p ON f.id_proveedor = p.id_proveedor
-            ORDER BY substr(f.fecha_emision, 7, 4) || '-' || substr(f.fecha_emision, 4, 2) || '-' || substr(f.fecha_emision, 1, 2) DESC
-        """
-        for row in self.conn.execute(query).fetchall():
-            self.tree_facturas.insert("", "end", values=(row["id_factura"], row["proveedor"], row["num_factura"], row["fecha_emision"], row["importe_total"], row["matricula"]))
+        """Recarga la primera página de facturas; el resto se carga al desplazarse."""
+        self.paginador_facturas.recargar()
 
 
     def guardar_factura(self):
         """Guarda o modifica una factura, asignándola opcionalmente a un vehículo."""
         proveedor_nombre = self.factura_vars["id_proveedor"].get()
-        id_proveedor = self.proveedor_dict.get(proveedor_nombre)
+        id_proveedor = self.catalogo.proveedores.clave_de(proveedor_nombre)
 
-        matricula = self.factura_vars["matricula"].get().strip()
+        matricula = self.coche_elegido(self.factura_matricula_cb)
+        if matricula is None:
+            return
         num_factura = self.factura_vars["num_factura"].get().strip()
         fecha = self.factura_vars["fecha_emision"].get().strip()
         importe = self.factura_vars["importe_total"].get().strip()
@@ -2206,6 +1855,12 @@ class MantenimientoApp:
             messagebox.showwarning("Error", "El importe debe ser un número válido.")
             return
 
+        try:
+            fecha = normalizar_fecha(fecha, obligatoria=False)
+        except ValueError as e:
+            messagebox.showwarning("Error", str(e))
+            return
+
         seleccion = self.tree_facturas.selection()
         if seleccion:
             id_factura = self.tree_facturas.item(seleccion[0], "values")[0]
@@ -2213,30 +1868,21 @@ class MantenimientoApp:
                 UPDATE Factura
                 SET id_proveedor=?, num_factura=?, fecha_emision=?, importe_total=?, matricula=?
                 WHERE id_factura=?
-            """, (id_proveedor, num_factura, fecha, importe_valor, matricula, id_factura))
-            self.conn.commit()
+            """, (id_proveedor, num_factura, fecha, importe_valor, matricula or None, id_factura))
+            self.confirmar("Factura", excepto=(self.actualizar_tabla_facturas,))
+            self.paginador_facturas.upsert(consultas.factura(self.conn, id_factura))
             messagebox.showinfo("Actualizado", "Factura modificada correctamente.")
         else:
             cursor = self.conn.execute("""
                 INSERT INTO Factura (id_proveedor, num_factura, fecha_emision, importe_total, matricula)
                 VALUES (?, ?, ?, ?, ?)
-            """, (id_proveedor, num_factura, fecha, importe_valor, matricula))
-            self.conn.commit()
+            """, (id_proveedor, num_factura, fecha, importe_valor, matricula or None))
+            self.confirmar("Factura", excepto=(self.actualizar_tabla_facturas,))
             nuevo_id = cursor.lastrowid
+            self.paginador_facturas.upsert(consultas.factura(self.conn, nuevo_id), nueva=True)
             messagebox.showinfo("Éxito", f"Factura registrada (ID {nuevo_id}).")
 
-        self.actualizar_tabla_facturas()
         self.limpiar_form_factura()
-        self.mostrar_facturas_coche()
-
-        # Refrescar combobox de facturas en pestaña Gastos
-        if hasattr(self, "gasto_factura_cb"):
-            try:
-                cursor_fact = self.conn.execute("SELECT id_factura, num_factura FROM Factura ORDER BY fecha_emision DESC")
-                facturas = [f"{row['id_factura']} - {row['num_factura']}" for row in cursor_fact.fetchall()]
-                self.gasto_factura_cb.configure(values=facturas)
-            except Exception:
-                pass
 
     def seleccionar_factura(self, event):
         """Carga los datos de la factura seleccionada en el formulario."""
@@ -2264,21 +1910,9 @@ class MantenimientoApp:
         confirmar = messagebox.askyesno("Confirmar", "¿Eliminar esta factura?")
         if confirmar:
             self.conn.execute("DELETE FROM Factura WHERE id_factura=?", (id_sel,))
-            self.conn.commit()
-            self.actualizar_tabla_facturas()
+            self.confirmar("Factura", excepto=(self.actualizar_tabla_facturas,))
+            self.paginador_facturas.eliminar(id_sel)
             self.limpiar_form_factura()
-            self.mostrar_facturas_coche()
-
-            # --- Refrescar combobox de facturas en pestaña Gastos ---
-            if hasattr(self, "gasto_factura_cb"):
-                try:
-                    cursor_fact = self.conn.execute(
-                        "SELECT id_factura, num_factura FROM Factura ORDER BY fecha_emision DESC"
-                    )
-                    facturas = [f"{row['id_factura']} - {row['num_factura']}" for row in cursor_fact.fetchall()]
-                    self.gasto_factura_cb.configure(values=facturas)
-                except Exception:
-                    pass
 
             messagebox.showinfo("Eliminada", "Factura eliminada correctamente.")
 
@@ -2303,11 +1937,6 @@ class MantenimientoApp:
             row=0, column=0, columnspan=2, pady=10
         )
 
-        # --- Obtener datos para combos ---
-        matriculas = self.obtener_matriculas()
-        cursor_fact = self.conn.execute("SELECT id_factura, num_factura FROM Factura ORDER BY fecha_emision DESC")
-        facturas = [f"{row['id_factura']} - {row['num_factura']}" for row in cursor_fact.fetchall()]
-
         # --- Variables ---
         self.gasto_vars = {
             "id_gasto": None,
@@ -2322,12 +1951,13 @@ class MantenimientoApp:
 
         # --- Campos del formulario ---
         ctk.CTkLabel(frame, text="Vehículo (Matrícula):", font=("Arial", 16)).grid(row=1, column=0, sticky="e", padx=10, pady=5)
-        self.gasto_matricula_cb = ttk.Combobox(frame, textvariable=self.gasto_vars["matricula"], values=matriculas, state="readonly", width=40)
+        self.gasto_matricula_cb = SelectorCoche(frame, self.conn, textvariable=self.gasto_vars["matricula"], width=40)
         self.gasto_matricula_cb.grid(row=1, column=1, padx=10, pady=5)
 
         ctk.CTkLabel(frame, text="Factura (opcional):", font=("Arial", 16)).grid(row=2, column=0, sticky="e", padx=10, pady=5)
-        self.gasto_factura_cb = ttk.Combobox(frame, textvariable=self.gasto_vars["id_factura"], values=facturas, state="readonly", width=40)
+        self.gasto_factura_cb = ttk.Combobox(frame, textvariable=self.gasto_vars["id_factura"], state="readonly", width=40)
         self.gasto_factura_cb.grid(row=2, column=1, padx=10, pady=5)
+        self.recargar_facturas_en_gastos()
 
         ctk.CTkLabel(frame, text="Fecha:", font=("Arial", 16)).grid(row=3, column=0, sticky="e", padx=10, pady=5)
         ctk.CTkEntry(frame, textvariable=self.gasto_vars["fecha"], width=250).grid(row=3, column=1, padx=10, pady=5)
@@ -2352,13 +1982,21 @@ class MantenimientoApp:
         ctk.CTkButton(botones_frame, text="Limpiar", command=self.limpiar_form_gasto).grid(row=0, column=2, padx=10)
 
         # --- Tabla de gastos ---
+        contenedor = ctk.CTkFrame(frame, fg_color="transparent")
+        contenedor.grid(row=9, column=0, columnspan=2, pady=(10, 0))
         self.tree_gastos = ttk.Treeview(
-            frame,
+            contenedor,
             columns=("id", "matricula", "factura", "fecha", "categoria", "concepto", "importe"),
             show="headings",
             height=10
         )
-        self.tree_gastos.grid(row=9, column=0, columnspan=2, pady=10)
+        scroll_gastos = ttk.Scrollbar(contenedor, orient="vertical", command=self.tree_gastos.yview)
+        self.tree_gastos.pack(side="left")
+        scroll_gastos.pack(side="right", fill="y")
+        self.label_paginacion_gastos = ctk.CTkLabel(frame, text="")
+        self.label_paginacion_gastos.grid(row=10, column=0, columnspan=2, pady=(0, 10))
+        self.label_costes_flota = ctk.CTkLabel(frame, text="", font=("Arial", 14, "bold"))
+        self.label_costes_flota.grid(row=11, column=0, columnspan=2, pady=(0, 10))
 
         for col, title in zip(
             ("id", "matricula", "factura", "fecha", "categoria", "concepto", "importe"),
@@ -2369,24 +2007,56 @@ class MantenimientoApp:
 
         self.tree_gastos.bind("<<TreeviewSelect>>", self.seleccionar_gasto)
 
+        self.modelo_gastos = ModeloTabla(
+            self.tree_gastos,
+            clave=lambda r: r["id_gasto"],
+            valores=tuple,
+            orden=lambda r: (r["fecha"] or "", r["id_gasto"]),
+            descendente=True
+        )
+        self.paginador_gastos = TablaPaginada(
+            self.modelo_gastos, self.ejecutor, "tabla_gastos",
+            pagina=consultas.pagina_gastos,
+            contar=consultas.total_gastos,
+            clave_pagina=lambda r: (r["fecha"], r["id_gasto"]),
+            etiqueta=self.label_paginacion_gastos,
+            scrollbar=scroll_gastos,
+            texto="gastos"
+        )
+
         self.actualizar_tabla_gastos()
+        self.actualizar_costes_flota()
+        self.bus.suscribir({"Factura"}, self.recargar_facturas_en_gastos, "➕ Gastos")
+        self.bus.suscribir({"Gasto", "Factura"}, self.actualizar_tabla_gastos, "➕ Gastos")
+        self.bus.suscribir({"Gasto", "Factura"}, self.actualizar_costes_flota, "➕ Gastos")
 
         # --- Centrar contenido ---
         frame.grid_columnconfigure(0, weight=1)
         frame.grid_columnconfigure(1, weight=1)
 
+    def recargar_facturas_en_gastos(self):
+        cursor_fact = self.conn.execute("SELECT id_factura, num_factura FROM Factura ORDER BY fecha_emision DESC")
+        self.gasto_factura_cb["values"] = [f"{row['id_factura']} - {row['num_factura']}" for row in cursor_fact.fetchall()]
+
     def actualizar_tabla_gastos(self):
-        for fila in self.tree_gastos.get_children():
-            self.tree_gastos.delete(fila)
-
-        query = """
-            SELECT g.id_gasto, g.matricula, f.num_factura AS factura, g.fecha, g.categoria, g.concepto, g.importe
-            FROM Gasto g
-            LEFT JOIN Factura f ON g.id_factura = f.id_factura
-            ORDER BY g.fecha DESC
-        """
-        for row in self.conn.execute(query).fetchall():
-            self.tree_gastos.insert("", "end", values=tuple(row))
+        """Recarga la primera página de gastos; el resto se carga al desplazarse."""
+        self.paginador_gastos.recargar()
+
+    def actualizar_costes_flota(self):
+        """Totales de la flota (histórico y mes en curso), leídos de las tablas de costes agregados."""
+        mes = datetime.now().strftime("%Y-%m")
+        self.ejecutor.enviar(
+            "costes_flota", lambda conn: (consultas.costes_flota(conn), consultas.costes_flota(conn, mes)),
+            al_terminar=self._pintar_costes_flota,
+            al_fallar=lambda e: self._error_carga(self.label_costes_flota, "Error al leer los costes de la flota:", e)
+        )
+
+    def _pintar_costes_flota(self, costes):
+        total, mes = costes
+        self.label_costes_flota.configure(
+            text=f"Flota: {total['gastos']:.2f} € en gastos y {total['facturas']:.2f} € en facturas "
+                 f"(este mes: {mes['gastos']:.2f} € y {mes['facturas']:.2f} €)"
+        )
 
     def guardar_gasto(self):
         datos = {k: v.get().strip() for k, v in self.gasto_vars.items() if k != "id_gasto"}
@@ -2395,6 +2065,21 @@ class MantenimientoApp:
             messagebox.showwarning("Atención", "Matrícula, concepto e importe son obligatorios.")
             return
 
+        if self.coche_elegido(self.gasto_matricula_cb) is None:
+            return
+
+        try:
+            importe = float(datos["importe"])
+        except ValueError:
+            messagebox.showwarning("Error", "El importe debe ser un número válido.")
+            return
+
+        try:
+            fecha = normalizar_fecha(datos["fecha"])
+        except ValueError as e:
+            messagebox.showwarning("Atención", str(e))
+            return
+
         id_factura = datos["id_factura"].split(" - ")[0] if datos["id_factura"] else None
 
         item_sel = self.tree_gastos.selection()
@@ -2403,23 +2088,18 @@ class MantenimientoApp:
             self.conn.execute("""
                 UPDATE Gasto SET matricula=?, id_factura=?, fecha=?, categoria=?, concepto=?, importe=?, observaciones=?
                 WHERE id_gasto=?
-            """, (datos["matricula"], id_factura, datos["fecha"], datos["categoria"],
-                datos["concepto"], datos["importe"], datos["observaciones"], id_sel))
+            """, (datos["matricula"], id_factura, fecha, datos["categoria"],
+                datos["concepto"], importe, datos["observaciones"], id_sel))
         else:
-            self.conn.execute("""
+            cursor = self.conn.execute("""
                 INSERT INTO Gasto (matricula, id_factura, fecha, categoria, concepto, importe, observaciones)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (datos["matricula"], id_factura, datos["fecha"], datos["categoria"],
-                  datos["concepto"], datos["importe"], datos["observaciones"]))
-        self.conn.commit()
-        self.actualizar_tabla_gastos()
+            """, (datos["matricula"], id_factura, fecha, datos["categoria"],
+                  datos["concepto"], importe, datos["observaciones"]))
+            id_sel = cursor.lastrowid
+        self.confirmar("Gasto", excepto=(self.actualizar_tabla_gastos,))
+        self.paginador_gastos.upsert(consultas.gasto(self.conn, id_sel), nueva=not item_sel)
         messagebox.showinfo("Éxito", "Gasto guardado correctamente.")
-        # --- Refrescar gastos en pestaña Vehículos si está activa ---
-        try:
-            if hasattr(self, "coche_var") and self.coche_var.get():
-                self.mostrar_gastos_coche()
-        except Exception as e:
-            print("No se pudo refrescar la vista de gastos:", e)
 
 
     def seleccionar_gasto(self, event):
@@ -2444,15 +2124,9 @@ class MantenimientoApp:
         id_sel = self.tree_gastos.item(item_sel[0], "values")[0]
         if messagebox.askyesno("Confirmar", "¿Eliminar este gasto?"):
             self.conn.execute("DELETE FROM Gasto WHERE id_gasto=?", (id_sel,))
-            self.conn.commit()
-            self.actualizar_tabla_gastos()
+            self.confirmar("Gasto", excepto=(self.actualizar_tabla_gastos,))
+            self.paginador_gastos.eliminar(id_sel)
             self.limpiar_form_gasto()
-                # --- Refrescar gastos en pestaña Vehículos si está activa ---
-        try:
-            if hasattr(self, "coche_var") and self.coche_var.get():
-                self.mostrar_gastos_coche()
-        except Exception as e:
-            print("No se pudo refrescar la vista de gastos:", e)
 
     def limpiar_form_gasto(self):
         for var in self.gasto_vars.values():
@@ -2461,134 +2135,296 @@ class MantenimientoApp:
         self.tree_gastos.selection_remove(self.tree_gastos.selection())
 
 
-    # FUNCIONES BASE DE DATOS Y PDF
+    # PESTAÑA BÚSQUEDA
+
+    def crear_tab_busqueda(self):
+        frame = ctk.CTkFrame(self.tab_busqueda)
+        frame.pack(pady=20, fill="both", expand=True)
+
+        ctk.CTkLabel(frame, text="Buscar en mantenimientos, gastos, facturas, obligaciones, productos y proveedores",
+                     font=("Arial", 18, "bold")).pack(pady=10)
+
+        self.busqueda_var = ctk.StringVar()
+        self.entry_busqueda = ctk.CTkEntry(frame, textvariable=self.busqueda_var, width=500, font=("Arial", 20),
+                                           placeholder_text="p. ej. embrague, nº de factura, proveedor...")
+        self.entry_busqueda.pack(pady=10)
+        self.busqueda_var.trace_add("write", lambda *args: self._programar_busqueda())
+        self._busqueda_pendiente = None
+
+        self.tree_busqueda = ttk.Treeview(frame, columns=("tipo", "matricula", "fragmento"), show="headings", height=18)
+        for col, title, ancho in (("tipo", "Tipo", 150), ("matricula", "Vehículo", 120), ("fragmento", "Coincidencia", 700)):
+            self.tree_busqueda.heading(col, text=title)
+            self.tree_busqueda.column(col, width=ancho)
+        self.tree_busqueda.pack(padx=10, pady=5)
+        self.tree_busqueda.bind("<Double-1>", lambda e: self.abrir_resultado_busqueda())
+        self.tree_busqueda.bind("<Return>", lambda e: self.abrir_resultado_busqueda())
+
+        self.label_busqueda = ctk.CTkLabel(frame, text="")
+        self.label_busqueda.pack(pady=5)
+        self.boton_mas_resultados = ctk.CTkButton(frame, text="Más resultados", command=self._mas_resultados)
+
+        self._resultados_busqueda = {}
+        self.bus.suscribir({f[0] for f in FUENTES_BUSQUEDA}, self.buscar, "🔍 Buscar")
+
+    def _ir_a_busqueda(self):
+        self.mostrar_pestana("🔍 Buscar")
+        self.entry_busqueda.focus_set()
+
+    def _programar_busqueda(self):
+        """Lanza la búsqueda cuando el usuario deja de escribir un momento."""
+        if self._busqueda_pendiente:
+            self.root.after_cancel(self._busqueda_pendiente)
+        self._busqueda_pendiente = self.root.after(250, self.buscar)
+
+    def buscar(self):
+        self._busqueda_pendiente = None
+        self.tree_busqueda.delete(*self.tree_busqueda.get_children())
+        self._resultados_busqueda = {}
+        self.boton_mas_resultados.pack_forget()
+
+        texto = self.busqueda_var.get()
+        if not texto.strip():
+            self.ejecutor.cancelar("busqueda")
+            self.label_busqueda.configure(text="")
+            return
+        self._pedir_resultados(texto)
 
-    def cargar_coches(self):
-        """Carga la lista de coches en el combo principal, sin seleccionar ninguno al inicio."""
-        cursor = self.conn.execute("SELECT matricula, marca, modelo FROM Coche ORDER BY matricula")
-        coches = [f"{row['matricula']} ({row['marca']} {row['modelo']})" for row in cursor.fetchall()]
-        self.combo_coche['values'] = coches
+    def _mas_resultados(self):
+        self._pedir_resultados(self.busqueda_var.get())
 
-        # Limpia la selección visualmente (aunque haya vehículos)
-        self.combo_coche.set("")  
-        self.coche_var.set("")  
+    def _pedir_resultados(self, texto, limite=50):
+        self.label_busqueda.configure(text="⏳ Buscando...")
+        self.ejecutor.enviar(
+            "busqueda", consultas.buscar, texto, len(self._resultados_busqueda), limite,
+            al_terminar=lambda filas: self._pintar_busqueda(filas, limite),
+            al_fallar=lambda e: self._error_carga(self.label_busqueda, "Error en la búsqueda:", e)
+        )
 
-        # Limpia también la tabla de mantenimientos
-        for widget in self.frame_mantenimientos.winfo_children():
-            widget.destroy()
+    def _pintar_busqueda(self, filas, limite):
+        for fila in filas:
+            iid = f"{fila['tabla']}:{fila['id_fila']}"
+            if iid in self._resultados_busqueda:
+                continue
+            self._resultados_busqueda[iid] = fila
+            self.tree_busqueda.insert("", "end", iid=iid, values=(fila["tabla"], fila["matricula"] or "-", fila["fragmento"]))
+
+        total = len(self._resultados_busqueda)
+        self.label_busqueda.configure(text=f"{total} resultados" if total else "Sin resultados.")
+        if len(filas) == limite:
+            self.boton_mas_resultados.pack(pady=5)
+        else:
+            self.boton_mas_resultados.pack_forget()
 
-        # Limpia los datos de info y km
-        self.fecha_mat_var.set("—")
-        self.km_var.set("")
+    def abrir_resultado_busqueda(self):
+        """Lleva al vehículo del resultado seleccionado, o a su pestaña si no tiene vehículo."""
+        seleccion = self.tree_busqueda.selection()
+        if not seleccion:
+            return
+        fila = self._resultados_busqueda[seleccion[0]]
+
+        if fila["matricula"]:
+            self.seleccionar_coche(fila["matricula"])
+        elif fila["tabla"] == "Proveedor":
+            self.mostrar_pestana("➕ Proveedores")
+            self.modelo_proveedores.seleccionar(fila["id_fila"])
+        elif fila["tabla"] == "Factura":
+            self.mostrar_pestana("➕ Facturas")
+            self.modelo_facturas.seleccionar(fila["id_fila"])
+        elif fila["tabla"] == "Producto":
+            self.mostrar_pestana("➕ Productos")
+
+    def seleccionar_coche(self, matricula):
+        """Muestra en la pestaña Vehículos el coche con esa matrícula."""
+        self.construir_pestana("Vehículos")
+        if not self.combo_coche.seleccionar(matricula):
+            messagebox.showwarning("Atención", f"No se encuentra el vehículo {matricula}.")
+            return
+        self.mostrar_pestana("Vehículos")
+        self.mostrar_coche()
 
 
-    def mostrar_mantenimientos(self, event=None):
-        # Limpiar el frame
-        for widget in self.frame_mantenimientos.winfo_children():
-            widget.destroy()
+    # PESTAÑA PRÓXIMOS CAMBIOS
 
-        coche_seleccionado = self.coche_var.get()
-        if not coche_seleccionado:
+    def crear_tab_vencimientos(self):
+        frame = ctk.CTkFrame(self.tab_vencimientos)
+        frame.pack(pady=20, fill="both", expand=True)
+
+        ctk.CTkLabel(frame, text="Próximos cambios de la flota", font=("Arial", 20, "bold")).pack(pady=10)
+
+        filtros = ctk.CTkFrame(frame)
+        filtros.pack(pady=5)
+        ctk.CTkLabel(filtros, text="Vencen en los próximos", font=("Arial", 16)).pack(side="left", padx=5)
+        self.venc_dias_var = ctk.StringVar(value="30")
+        ctk.CTkEntry(filtros, textvariable=self.venc_dias_var, width=60).pack(side="left")
+        ctk.CTkLabel(filtros, text="días o", font=("Arial", 16)).pack(side="left", padx=5)
+        self.venc_km_var = ctk.StringVar(value="2000")
+        ctk.CTkEntry(filtros, textvariable=self.venc_km_var, width=80).pack(side="left")
+        ctk.CTkLabel(filtros, text="km", font=("Arial", 16)).pack(side="left", padx=5)
+        ctk.CTkButton(filtros, text="Actualizar", command=self.actualizar_vencimientos).pack(side="left", padx=10)
+
+        self.tabla_vencimientos = TablaVirtual(
+            frame,
+            columnas=("vehiculo", "componente", "fecha", "km", "prox_km", "km_restantes", "fecha_estimada",
+                      "prox_fecha", "dias_restantes"),
+            titulos=("Vehículo", "Componente", "Último cambio", "Km", "Próx. km", "Km restantes", "Llega a los km",
+                     "Próx. fecha", "Días restantes"),
+            anchos=(260, 200, 120, 90, 100, 110, 120, 120, 110),
+            alto=20,
+            formatear=self._formatear_vencimiento,
+            etiquetas=lambda v: ("vencido",) if v["vencido"] else ()
+        )
+        self.tabla_vencimientos.pack(padx=10, pady=5)
+        self.tabla_vencimientos.tree.bind("<Double-1>", lambda e: self._abrir_vencimiento())
+        self.tabla_vencimientos.tree.tag_configure("vencido", foreground="#ff6b6b")
+
+        self.label_vencimientos = ctk.CTkLabel(frame, text="")
+        self.label_vencimientos.pack(pady=5)
+
+        self.actualizar_vencimientos()
+        self.bus.suscribir({"Coche", "Mantenimiento", "Producto", "TipoComponente"}, self.actualizar_vencimientos, "🔧 Próximos cambios")
+
+    def actualizar_vencimientos(self):
+        """Carga la lista de componentes que vencen pronto en toda la flota."""
+        try:
+            dias = int(self.venc_dias_var.get())
+            km = int(self.venc_km_var.get())
+        except ValueError:
+            messagebox.showwarning("Atención", "Los días y los km deben ser números enteros.")
             return
-        matricula = coche_seleccionado.split(" ")[0]
 
-        # Mostrar título de sección
-        ctk.CTkLabel(self.frame_mantenimientos, text="Mantenimientos", font=("Arial", 20, "bold"))\
-            .grid(row=0, column=0, columnspan=6, pady=(0, 10))
+        self.label_vencimientos.configure(text="⏳ Cargando próximos cambios...")
+        self.ejecutor.enviar(
+            "vencimientos", consultas.vencimientos, dias, km,
+            al_terminar=self._pintar_vencimientos,
+            al_fallar=lambda e: self._error_carga(self.label_vencimientos, "Error al cargar próximos cambios:", e)
+        )
 
-        # Obtener kilómetros actuales del vehículo
-        cursor = self.conn.execute("SELECT km_actuales, fecha_matriculacion FROM Coche WHERE matricula = ?", (matricula,))
-        row = cursor.fetchone()
-        if row:
-            self.km_var.set(row["km_actuales"] or 0)
-            self.fecha_mat_var.set(row["fecha_matriculacion"] or "—")
-        else:
-            self.km_var.set(0)
-            self.fecha_mat_var.set("—")
+    def _pintar_vencimientos(self, filas):
+        self.tabla_vencimientos.set_filas(filas)
+        vencidos = sum(1 for f in filas if f["vencido"])
+        self.label_vencimientos.configure(
+            text=f"{len(filas)} cambios próximos, {vencidos} ya vencidos" if filas else "No hay cambios próximos."
+        )
 
-        # Encabezados de tabla (empezamos en fila 1 porque fila 0 es el título)
-        headers = ["Elemento (Tipo)", "Fecha", "Km", "Próx. cambio (km)", "Próx. cambio (fecha)", "Descripción"]
-        for col, h in enumerate(headers):
-            ctk.CTkLabel(self.frame_mantenimientos, text=h, font=("Arial", 16, "bold"))\
-                .grid(row=1, column=col, padx=5, pady=3)
+    @staticmethod
+    def _formatear_vencimiento(v):
+        return (
+            f"{v['matricula']} ({v['marca']} {v['modelo']})",
+            v["tipo_componente"],
+            formatear_fecha(v["fecha"]),
+            v["km"],
+            v["prox_km"] if v["prox_km"] is not None else "-",
+            v["km_restantes"] if v["km_restantes"] is not None else "-",
+            formatear_fecha(v["fecha_estimada"]),
+            formatear_fecha(v["prox_fecha"]),
+            v["dias_restantes"] if v["dias_restantes"] is not None else "-",
+        )
+
+    def _abrir_vencimiento(self):
+        fila = self.tabla_vencimientos.fila_seleccionada()
+        if fila:
+            self.seleccionar_coche(fila["matricula"])
+
+
+    # FUNCIONES BASE DE DATOS Y PDF
+
+    def cargar_coches(self):
+        """Deja el selector de coches principal sin ningún vehículo seleccionado."""
+        # El selector busca los vehículos al escribir; solo hay que limpiar la selección
+        self.combo_coche.limpiar()
+        self.coche_var.set("")
+
+        # Limpia también las tablas del vehículo
+        self._pintar_ficha(None)
+
+        # Limpia los datos de info y km
+        self.fecha_mat_var.set("—")
+        self.km_var.set("")
 
-        # --- Mostrar mantenimientos ---
-        cursor = self.conn.execute("""
-            SELECT M.fecha, M.km, M.descripcion, 
-                T.nombre AS tipo_componente, 
-                P.marca, P.modelo, P.tipo, 
-                P.vida_util_km, P.vida_util_meses
-            FROM Mantenimiento M
-            JOIN Producto P ON M.id_producto = P.id_producto
-            JOIN TipoComponente T ON P.id_tipo = T.id_tipo
-            WHERE M.matricula = ?
-            ORDER BY M.km
-        """, (matricula,))
-
-        fila = 2  # fila inicial después de encabezados
-        for m in cursor.fetchall():
-            # Procesar fecha de mantenimiento
-            fecha_str = m["fecha"]
-            fecha_dt = None
-            for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y"):
-                try:
-                    fecha_dt = datetime.strptime(fecha_str, fmt)
-                    break
-                except ValueError:
-                    continue
-            fecha_mostrar = fecha_dt.strftime("%d-%m-%Y") if fecha_dt else fecha_str
-
-            # Calcular próximo cambio (km y fecha)
-            prox_km = m["km"] + m["vida_util_km"] if m["vida_util_km"] else "-"
-            prox_fecha = fecha_dt + timedelta(days=m["vida_util_meses"] * 30) if (fecha_dt and m["vida_util_meses"]) else None
-            prox_fecha_str = prox_fecha.strftime("%d-%m-%Y") if prox_fecha else "-"
-
-            # Datos para mostrar
-            datos = [
-                f"{m['tipo_componente']} - {m['marca']} {m['modelo']} ({m['tipo'] or '—'})",
-                fecha_mostrar,
-                m["km"],
-                prox_km,
-                prox_fecha_str,
-                m["descripcion"] or "-"
-            ]
-
-            # Mostrar en interfaz
-            for col, val in enumerate(datos):
-                # Ajustar padding: más espacio a la izquierda para las primeras columnas
-                if col == 0:  # Primera columna
-                    padx = (15, 5)
-                elif col == 1:  # Segunda columna
-                    padx = (10, 5)
-                else:  # Resto de columnas
-                    padx = (8, 5)
-
-
-                # Reducir tamaño de la columna de Descripción
-                if col == 2:  # Suponiendo que la tercera columna es "Descripción"
-                    font = ("Arial", 16)  # Fuente ligeramente más pequeña
-                else:
-                    font = ("Arial", 16)
 
-                ctk.CTkLabel(self.frame_mantenimientos, text=str(val), font=font)\
-                    .grid(row=fila, column=col, padx=padx, pady=2)
+    def mostrar_coche(self, event=None):
+        """Muestra en la pestaña Vehículos el coche seleccionado.
+
+        Si su ficha está en la caché se pinta sin consultar nada; si no, se lee
+        entera en segundo plano. Después se precargan los coches que tiene al lado
+        en la lista del selector.
+        """
+        matricula = self.coche_var.get().split(" ")[0] if self.coche_var.get() else ""
+        if not matricula:
+            self.ejecutor.cancelar("ficha_coche")
+            self._pintar_ficha(None)
+            return
 
-            fila += 1
+        ficha = self.cache_fichas.obtener(matricula)
+        if ficha is not None:
+            self._pintar_ficha(ficha)
+            self._precargar_vecinos(matricula)
+            return
 
-        # Mostrar obligaciones del coche debajo de los mantenimientos
-        self.mostrar_obligaciones_coche()
+        self._pintar_ficha(None, cargando=True)
+        version = self.cache_fichas.version
+        self.ejecutor.enviar(
+            "ficha_coche", fichas.leer_ficha, matricula,
+            al_terminar=lambda ficha: self._ficha_leida(ficha, version),
+            al_fallar=lambda e: self._error_carga(self.label_estado_mantenimientos, "Error al mostrar el vehículo:", e)
+        )
 
+    def _ficha_leida(self, ficha, version):
+        self.cache_fichas.guardar(ficha, version)
+        self._pintar_ficha(ficha)
+        self._precargar_vecinos(ficha["matricula"])
+
+    def _precargar_vecinos(self, matricula):
+        for i, vecino in enumerate(self.combo_coche.vecinos(matricula)):
+            if vecino not in self.cache_fichas:
+                self.ejecutor.enviar(
+                    f"ficha_vecina_{i}", fichas.leer_ficha, vecino,
+                    al_terminar=lambda ficha, version=self.cache_fichas.version: self.cache_fichas.guardar(ficha, version)
+                )
 
-    def mostrar_obligaciones_coche(self):
-        """Muestra las obligaciones del coche seleccionado en la pestaña Coches."""
+    def _pintar_ficha(self, ficha, cargando=False):
+        """Pinta todas las secciones de la pestaña Vehículos; sin ficha las deja vacías."""
+        self.tree_gastos_coche.delete(*self.tree_gastos_coche.get_children())
+        self.tree_facturas_coche.delete(*self.tree_facturas_coche.get_children())
         for widget in self.frame_obligaciones_coche.winfo_children():
             widget.destroy()
 
-        matricula = self.coche_var.get().split(" ")[0] if self.coche_var.get() else None
-        if not matricula:
+        if ficha is None:
+            self.tabla_mantenimientos.set_filas([])
+            self.label_estado_mantenimientos.configure(text="⏳ Cargando vehículo..." if cargando else "")
+            self.label_total_gastos.configure(text="")
+            self.label_total_facturas.configure(text="")
             return
 
-        # Título de sección
+        # Kilómetros actuales y fecha de matriculación del vehículo
+        self.km_var.set(ficha["km_actuales"])
+        self.fecha_mat_var.set(ficha["fecha_matriculacion"])
+
+        # Mantenimientos y próximos cambios
+        mantenimientos = ficha["mantenimientos"]
+        self.tabla_mantenimientos.set_filas(mantenimientos)
+        resumen = [f"{len(mantenimientos)} mantenimientos" if mantenimientos else "No hay mantenimientos registrados."]
+        if ficha["proximo_km"]:
+            tipo, km, fecha_estimada = ficha["proximo_km"]
+            estado = f"faltan {km} km" if km > 0 else "vencido"
+            if km > 0 and fecha_estimada:
+                estado += f", hacia el {fecha_estimada}"
+            resumen.append(f"próximo por km: {tipo} ({estado})")
+        if ficha["proxima_fecha"]:
+            resumen.append("próximo por fecha: {} ({})".format(*ficha["proxima_fecha"]))
+        self.label_estado_mantenimientos.configure(text=" · ".join(resumen))
+
+        self._pintar_obligaciones_coche(ficha["obligaciones"])
+
+        for valores in ficha["gastos"]:
+            self.tree_gastos_coche.insert("", "end", values=valores)
+        self.label_total_gastos.configure(text=f"💰 Total Gastos: {ficha['total_gastos']:.2f} €")
+
+        for valores in ficha["facturas"]:
+            self.tree_facturas_coche.insert("", "end", values=valores)
+        self.label_total_facturas.configure(text=f"📄 Total facturas: {ficha['total_facturas']:.2f} €")
+
+    def _pintar_obligaciones_coche(self, obligaciones):
         ctk.CTkLabel(self.frame_obligaciones_coche, text="Obligaciones", font=("Arial", 20, "bold"))\
             .pack(pady=(5, 10))
 
@@ -2607,44 +2443,16 @@ class MantenimientoApp:
         tabla.column("inicio", width=80, anchor="center")
         tabla.column("vencimiento", width=80, anchor="center")
 
-        # Cargar datos
-        cursor = self.conn.execute("""
-            SELECT tipo, descripcion, fecha_inicio, fecha_vencimiento
-            FROM Obligaciones
-            WHERE matricula = ?
-            ORDER BY fecha_vencimiento ASC
-        """, (matricula,))
-
-        for fila in cursor.fetchall():
-            tabla.insert("", "end", values=(
-                fila["tipo"],
-                fila["descripcion"] or "-",
-                fila["fecha_inicio"] or "-",
-                fila["fecha_vencimiento"] or "-"
-            ))
+        for valores in obligaciones:
+            tabla.insert("", "end", values=valores)
 
     def exportar_pdf(self):
-        from reportlab.pdfgen import canvas
-        from reportlab.lib.pagesizes import A4
-        from reportlab.platypus import Table, TableStyle, SimpleDocTemplate, Paragraph, Spacer
-        from reportlab.lib import colors
-        from reportlab.lib.styles import getSampleStyleSheet
-        from dateutil import parser
-        from reportlab.lib.styles import ParagraphStyle
-        from reportlab.lib.enums import TA_CENTER
-        """Exporta a PDF el historial completo del vehículo, incluyendo mantenimientos, obligaciones, gastos y facturas."""
-
-        def formatear_fecha(fecha_str):
-            if not fecha_str:
-                return "-"
-            for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y"):
-                try:
-                    fecha_dt = datetime.strptime(fecha_str, fmt)
-                    return fecha_dt.strftime("%d-%m-%Y")
-                except Exception:
-                    continue
-            return fecha_str
+        """Exporta a PDF el historial completo del vehículo, incluyendo mantenimientos, obligaciones, gastos y facturas.
 
+        El informe se genera en segundo plano, con su propia conexión, mientras
+        una ventana muestra el avance y permite cancelarlo; se puede seguir
+        usando la aplicación (y lanzar el de otro vehículo) mientras tanto.
+        """
         coche_seleccionado = self.coche_var.get()
         if not coche_seleccionado:
             messagebox.showerror("Error", "Selecciona un coche primero.")
@@ -2654,263 +2462,102 @@ class MantenimientoApp:
         if not matricula:
             messagebox.showerror("Error", "No se pudo obtener la matrícula del coche.")
             return
+        if matricula in self.tareas_pdf:
+            messagebox.showinfo("PDF", f"El informe de {matricula} ya se está generando.")
+            return
 
-        try:
-            # --- Datos del coche ---
-            cursor_coche = self.conn.execute(
-                "SELECT marca, modelo, fecha_matriculacion, km_actuales FROM Coche WHERE matricula = ?",
-                (matricula,)
-            )
-            coche_info = cursor_coche.fetchone()
-            if not coche_info:
-                messagebox.showerror("Error", f"No se encontró el coche con matrícula {matricula}.")
-                return
-
-            marca = coche_info["marca"]
-            modelo = coche_info["modelo"]
-            fecha_matriculacion = formatear_fecha(coche_info["fecha_matriculacion"])
-            km_actuales = coche_info["km_actuales"] if coche_info["km_actuales"] is not None else 0
-
-            pdf_name = f"{matricula.replace('/', '_').replace(' ', '_')}_informe_completo.pdf"
-            doc = SimpleDocTemplate(pdf_name, pagesize=A4)
-            elements = []
-            styles = getSampleStyleSheet()
-            centered = ParagraphStyle('centered', parent=styles['Normal'], alignment=TA_CENTER)
-
-            # --- Encabezado principal ---
-            title = Paragraph(f"<b>Informe del vehículo {matricula}</b>", styles['Title'])
-
-            subtitle_text = (
-                f"<b>Marca:</b> {marca} &nbsp;&nbsp; "
-                f"<b>Modelo:</b> {modelo} &nbsp;&nbsp; "
-                f"<b>Fecha matriculación:</b> {fecha_matriculacion} &nbsp;&nbsp;<br/> "
-                f"<b>Kilómetros actuales:</b> {km_actuales} km"
-            )
-
-            subtitle = Paragraph(subtitle_text, centered)
-
-            elements.extend([title, subtitle, Spacer(1, 16)])
-
-
-
-            # MANTENIMIENTOS
-
-            elements.append(Paragraph("<b>Mantenimientos</b>", styles['Heading2']))
-            elements.append(Spacer(1, 8))
-
-            cursor = self.conn.execute("""
-                SELECT M.fecha, M.km, M.descripcion, 
-                       T.nombre AS tipo, P.marca, P.modelo, P.tipo AS tipo_producto,
-                       P.vida_util_km, P.vida_util_meses
-                FROM Mantenimiento M
-                JOIN Producto P ON M.id_producto = P.id_producto
-                JOIN TipoComponente T ON P.id_tipo = T.id_tipo
-                WHERE M.matricula = ?
-                ORDER BY M.km
-            """, (matricula,))
-            mantenimientos = cursor.fetchall()
-
-            if mantenimientos:
-                data = [["Componente", "Fecha", "Km", "Próx. km", "Próx. fecha", "Descripción"]]
-                for m in mantenimientos:
-                    vida_km = m["vida_util_km"] or 0
-                    vida_meses = m["vida_util_meses"] or 0
-                    prox_km = f"{m['km'] + vida_km:.0f}" if vida_km else "-"
-                    try:
-                        fecha_dt = datetime.strptime(m["fecha"], "%Y-%m-%d")
-                        prox_fecha = fecha_dt + timedelta(days=vida_meses * 30) if vida_meses else None
-                        prox_fecha_str = prox_fecha.strftime("%d-%m-%Y") if prox_fecha else "-"
-                    except Exception:
-                        prox_fecha_str = "-"
-
-                    data.append([
-                        Paragraph(f"{m['tipo']} ({m['marca']} {m['modelo']} {m['tipo_producto']})", centered),
-                        Paragraph(formatear_fecha(m["fecha"]), centered),
-                        Paragraph(str(m["km"]), centered),
-                        Paragraph(prox_km, centered),
-                        Paragraph(prox_fecha_str, centered),
-                        Paragraph(m["descripcion"] or "-", centered)
-                    ])
-
-                table = Table(data, repeatRows=1, colWidths=[140, 70, 55, 80, 80, 140])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#003366")),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                    ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.lightgrey])
-                ]))
-                elements.append(table)
-            else:
-                elements.append(Paragraph("No hay mantenimientos registrados.", styles['Normal']))
-
-
-            # OBLIGACIONES
-
-            elements.append(Spacer(1, 20))
-            elements.append(Paragraph("<b>Obligaciones</b>", styles['Heading2']))
-            elements.append(Spacer(1, 8))
-
-            cursor_oblig = self.conn.execute("""
-                SELECT tipo, fecha_inicio, fecha_vencimiento, estado, descripcion
-                FROM Obligaciones
-                WHERE matricula = ?
-                ORDER BY date(replace(fecha_vencimiento, '-', '/')) ASC
-            """, (matricula,))
-            obligaciones = cursor_oblig.fetchall()
-
-            if obligaciones:
-                data_obl = [["Tipo", "Inicio", "Vencimiento", "Estado", "Descripción"]]
-                for o in obligaciones:
-                    data_obl.append([
-                        Paragraph(o["tipo"], centered),
-                        Paragraph(formatear_fecha(o["fecha_inicio"]), centered),
-                        Paragraph(formatear_fecha(o["fecha_vencimiento"]), centered),
-                        Paragraph(o["estado"] or "-", centered),
-                        Paragraph(o["descripcion"] or "-", centered)
-                    ])
-
-                table_obl = Table(data_obl, repeatRows=1, colWidths=[70, 70, 70, 60, 160])
-                table_obl.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#003366")),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                    ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.lightgrey])
-                ]))
-                elements.append(table_obl)
-            else:
-                elements.append(Paragraph("No hay obligaciones registradas.", styles['Normal']))
-
-
-            # GASTOS
-
-            elements.append(Spacer(1, 20))
-            elements.append(Paragraph("<b>Gastos</b>", styles['Heading2']))
-            elements.append(Spacer(1, 8))
-
-            cursor_gastos = self.conn.execute("""
-                SELECT G.fecha, G.categoria, G.concepto, G.importe, G.observaciones,
-                       F.num_factura, F.fecha_emision, F.importe_total,
-                       P.nombre AS proveedor
-                FROM Gasto G
-                LEFT JOIN Factura F ON G.id_factura = F.id_factura
-                LEFT JOIN Proveedor P ON F.id_proveedor = P.id_proveedor
-                WHERE G.matricula = ?
-                ORDER BY date(replace(G.fecha, '-', '/')) DESC
-            """, (matricula,))
-            gastos = cursor_gastos.fetchall()
-
-            total_gastos = 0
-
-            if gastos:
-                total_gastos = 0
-                data_gastos = [["Fecha", "Categoría", "Concepto", "Importe (€)", "Factura / Proveedor", "Observaciones"]]
-                for g in gastos:
-                    total_gastos += g["importe"]
-                    factura_info = "-"
-                    if g["num_factura"]:
-                        factura_info = f"{g['num_factura']} ({g['proveedor'] or '—'})"
-                    data_gastos.append([
-                        Paragraph(formatear_fecha(g["fecha"]), centered),
-                        Paragraph(g["categoria"] or "-", centered),
-                        Paragraph(g["concepto"], centered),
-                        Paragraph(f"{g['importe']:.2f}", centered),
-                        Paragraph(factura_info, centered),
-                        Paragraph(g["observaciones"] or "-", centered)
-                    ])
-
-                table_gastos = Table(data_gastos, repeatRows=1, colWidths=[70, 70, 100, 70, 100, 90])
-                table_gastos.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#003366")),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                    ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.lightgrey])
-                ]))
-                elements.append(table_gastos)
-                elements.append(Spacer(1, 10))
-                elements.append(Paragraph(f"<b>Total gastos:</b> {total_gastos:.2f} €", styles['Heading3']))
-            else:
-                elements.append(Paragraph("No hay gastos registrados.", styles['Normal']))
-
+        def generar(matricula, al_avanzar, cancelar):
+            conn = conectar(solo_lectura=True)
+            try:
+                return informes.generar_informe_coche(conn, matricula, al_avanzar=al_avanzar, cancelar=cancelar)
+            finally:
+                conn.close()
 
-            # FACTURAS
+        ventana = VentanaProgreso(self.root, f"Informe de {matricula}", lambda: self.tareas_pdf[matricula].cancelar.set())
 
-            elements.append(Spacer(1, 20))
-            elements.append(Paragraph("<b>Facturas asociadas</b>", styles['Heading2']))
-            elements.append(Spacer(1, 8))
+        def al_terminar(pdf_name):
+            del self.tareas_pdf[matricula]
+            ventana.destroy()
+            messagebox.showinfo("PDF generado", f"✅ PDF '{pdf_name}' generado correctamente.")
 
-            try:
-                cursor_fact = self.conn.execute("""
-                    SELECT 
-                    f.num_factura,
-                    p.nombre AS proveedor,
-                    f.fecha_emision,
-                    f.importe_total
-                    FROM Factura f
-                    JOIN Proveedor p ON f.id_proveedor = p.id_proveedor
-                    WHERE TRIM(f.matricula) = ?
-                    ORDER BY date(replace(f.fecha_emision, '-', '/')) DESC
-                """, (matricula.strip(),))
-                facturas = cursor_fact.fetchall()
-            except Exception as e:
-                print("Error al obtener facturas para el PDF:", e)
-                facturas = []
-
-            total_facturas = 0
-
-            if facturas:
-                total_facturas = 0.0
-                data_facturas = [["Nº Factura", "Proveedor", "Fecha emisión", "Importe (€)"]]
-                for f in facturas:
-                    importe = float(f["importe_total"]) if f["importe_total"] else 0.0
-                    total_facturas += importe
-                    data_facturas.append([
-                        Paragraph(f["num_factura"], centered),
-                        Paragraph(f["proveedor"], centered),
-                        Paragraph(formatear_fecha(f["fecha_emision"]), centered),
-                        Paragraph(f"{importe:.2f}", centered)
-                    ])
-
-                tabla_facturas = Table(data_facturas, repeatRows=1, colWidths=[100, 150, 100, 80])
-                tabla_facturas.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#003366")),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
-                    ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.lightgrey])
-                ]))
-                elements.append(tabla_facturas)
-                elements.append(Spacer(1, 10))
-                elements.append(Paragraph(f"<b>Total facturas:</b> {total_facturas:.2f} €", styles['Heading3']))
+        def al_fallar(e):
+            del self.tareas_pdf[matricula]
+            ventana.destroy()
+            if isinstance(e, informes.InformeCancelado):
+                return
+            if isinstance(e, ValueError):
+                messagebox.showerror("Error", str(e))
             else:
-                elements.append(Paragraph("No hay facturas registradas.", styles['Normal']))
-
+                messagebox.showerror("Error", f"No se pudo generar el PDF:\n{e}")
+                print("Error exportar_pdf:", e)
 
-            # TOTAL GENERAL (Gastos + Facturas)
+        self.tareas_pdf[matricula] = TareaLarga(
+            self.root, generar, matricula,
+            al_avanzar=lambda filas, total: ventana.avanzar(filas, total, f"Maquetando: {filas} de {total} filas"),
+            al_terminar=al_terminar, al_fallar=al_fallar,
+        )
 
-            total_general = total_gastos + total_facturas
-            elements.append(Spacer(1, 15))
-            elements.append(Paragraph(f"<b>Total Coste (Gastos + Facturas):</b> {total_general:.2f} €", styles['Heading2']))
+    def exportar_pdf_flota(self):
+        """Genera en una carpeta el informe PDF de todos los vehículos, en paralelo y en segundo plano."""
+        if self.tarea_flota:
+            messagebox.showinfo("Informes", "Ya se están generando los informes de la flota.")
+            return
+        destino = filedialog.askdirectory(title="Carpeta para los informes de la flota")
+        if not destino:
+            return
 
+        matriculas = [f["matricula"] for f in self.conn.execute("SELECT matricula FROM Coche ORDER BY matricula")]
+        existentes = len(matriculas) - len(informes.informes_pendientes(matriculas, destino))
+        rehacer = False
+        if existentes:
+            respuesta = messagebox.askyesnocancel(
+                "Informes",
+                f"La carpeta ya tiene {existentes} de los {len(matriculas)} informes.\n\n"
+                "Sí: generar solo los que faltan (p. ej. para continuar un lote interrumpido).\n"
+                "No: volver a generarlos todos."
+            )
+            if respuesta is None:
+                return
+            rehacer = not respuesta
 
-            # Generar PDF
+        ventana = VentanaProgreso(self.root, "Informes de la flota", lambda: self.tarea_flota.cancelar.set())
 
-            doc.build(elements)
-            messagebox.showinfo("PDF generado", f"✅ PDF '{pdf_name}' generado correctamente.")
+        def al_avanzar(hechos, total, matricula, error):
+            ventana.avanzar(hechos, total, f"{hechos} de {total} informes ({matricula})")
+            if error is not None:
+                print(f"Error en el informe de {matricula}:", error)
 
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudo generar el PDF:\n{e}")
-            print("Error exportar_pdf:", e)
+        def al_acabar(resultado=None, error=None):
+            self.tarea_flota = None
+            ventana.destroy()
+            if error is not None:
+                messagebox.showerror("Error", f"No se pudieron generar los informes:\n{error}")
+                return
+            mensaje = f"{len(resultado['generados'])} informes generados en {destino}."
+            if resultado["omitidos"]:
+                mensaje += f"\n{resultado['omitidos']} ya estaban generados."
+            if resultado["fallidos"]:
+                mensaje += f"\n{len(resultado['fallidos'])} fallaron: {', '.join(sorted(resultado['fallidos'])[:10])}"
+            if resultado["cancelado"]:
+                mensaje += "\n\nCancelado: vuelve a lanzarlo sobre la misma carpeta para generar el resto."
+            messagebox.showinfo("Informes de la flota", mensaje)
+
+        self.tarea_flota = TareaLarga(
+            self.root, informes.generar_informes, matriculas, destino, None, rehacer,
+            al_avanzar=al_avanzar,
+            al_terminar=lambda resultado: al_acabar(resultado),
+            al_fallar=lambda e: al_acabar(error=e),
+        )
 
 
 if __name__ == "__main__":
-    inicializar_base_datos()
-    root = ctk.CTk()
-    app = MantenimientoApp(root)
-    root.mainloop()
\ No newline at end of file
+    # --tiempos: imprime el desglose del arranque y, al salir, el de toda la sesión
+    if "--tiempos" in sys.argv:
+        tiempos.activar()
+    with tiempos.medir("arranque", "inicializar_base_datos"):
+        inicializar_base_datos()
+    with tiempos.medir("arranque", "ventana y pestañas"):
+        root = ctk.CTk()
+        app = MantenimientoApp(root)
+    root.mainloop()
+    tiempos.informe("Sesión")
\ No newline at end of file
@@ -0,0 +1,975 @@
+"""Acceso a la base de datos de Fleet Plus: configuración, conexiones, esquema y migraciones.
+
+El esquema base se crea con ``CREATE TABLE IF NOT EXISTS`` y, a partir de ahí,
+cada cambio estructural es una migración numerada.  La versión aplicada se guarda
+en ``PRAGMA user_version``, de modo que las bases de datos existentes se
+actualizan en el sitio al arrancar.
+
+La ubicación de la BD y los parámetros del motor se leen de ``fleet_plus.ini``
+(sección ``[almacenamiento]``) y pueden sobrescribirse con variables de entorno
+``FLEET_PLUS_<CLAVE>``, p. ej. ``FLEET_PLUS_RUTA`` o ``FLEET_PLUS_CACHE_SIZE``.
+"""
+import configparser
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+import tiempos
+
+# Ruta base del proyecto y fichero de configuración
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.environ.get("FLEET_PLUS_CONFIG", os.path.join(BASE_DIR, "fleet_plus.ini"))
+
+CONFIG_POR_DEFECTO = {
+    "ruta": "app_mantenimiento.db",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": "-65536",        # negativo = KiB (64 MiB)
+    "mmap_size": "268435456",      # 256 MiB
+    "temp_store": "MEMORY",
+    "busy_timeout": "5000",        # ms
+}
+
+_VALORES_PERMITIDOS = {
+    "journal_mode": {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"},
+    "synchronous": {"OFF", "NORMAL", "FULL", "EXTRA"},
+    "temp_store": {"DEFAULT", "FILE", "MEMORY"},
+}
+_CLAVES_ENTERAS = ("cache_size", "mmap_size", "busy_timeout")
+
+
+def cargar_configuracion(ruta=CONFIG_PATH):
+    """Lee la configuración de almacenamiento: valores por defecto, fichero y entorno, en ese orden."""
+    config = dict(CONFIG_POR_DEFECTO)
+
+    if os.path.exists(ruta):
+        parser = configparser.ConfigParser()
+        parser.read(ruta, encoding="utf-8")
+        if parser.has_section("almacenamiento"):
+            config.update({k: v for k, v in parser.items("almacenamiento") if k in config})
+
+    for clave in config:
+        valor = os.environ.get(f"FLEET_PLUS_{clave.upper()}")
+        if valor:
+            config[clave] = valor
+
+    # Validación: los PRAGMA no admiten parámetros, así que no dejamos pasar nada raro
+    for clave, permitidos in _VALORES_PERMITIDOS.items():
+        config[clave] = config[clave].strip().upper()
+        if config[clave] not in permitidos:
+            raise ValueError(f"Valor no válido para {clave}: {config[clave]}")
+    for clave in _CLAVES_ENTERAS:
+        config[clave] = int(config[clave])
+
+    config["ruta"] = os.path.join(BASE_DIR, os.path.expanduser(config["ruta"]))
+    return config
+
+
+CONFIG = cargar_configuracion()
+DB_PATH = CONFIG["ruta"]
+
+
+def conectar(solo_lectura=False, config=None, **kwargs):
+    """Abre una conexión a la BD con el perfil de almacenamiento configurado.
+
+    Todas las conexiones de la aplicación deben abrirse con esta función para que
+    compartan ``journal_mode``, caché, ``mmap`` y ``busy_timeout``. Con
+    ``solo_lectura=True`` la conexión se abre en modo ``ro``. El resto de
+    argumentos se pasan a ``sqlite3.connect``. Con el desglose de tiempos activo
+    (``--tiempos``) las consultas de la conexión se cronometran.
+    """
+    config = config or CONFIG
+    timeout = config["busy_timeout"] / 1000
+    if tiempos.activo:
+        kwargs.setdefault("factory", tiempos.ConexionCronometrada)
+    if solo_lectura:
+        conn = sqlite3.connect(f"file:{config['ruta']}?mode=ro", uri=True, timeout=timeout, **kwargs)
+    else:
+        conn = sqlite3.connect(config["ruta"], timeout=timeout, **kwargs)
+    conn.row_factory = sqlite3.Row
+
+    if not solo_lectura:
+        # journal_mode es persistente en el fichero; basta con que lo fije un escritor
+        conn.execute(f"PRAGMA journal_mode = {config['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {config['synchronous']}")
+    conn.execute(f"PRAGMA cache_size = {config['cache_size']}")
+    conn.execute(f"PRAGMA mmap_size = {config['mmap_size']}")
+    conn.execute(f"PRAGMA temp_store = {config['temp_store']}")
+    conn.execute(f"PRAGMA busy_timeout = {config['busy_timeout']}")
+    return conn
+
+# Formato canónico de fechas en la BD (ISO-8601) y formatos aceptados al escribir
+FORMATO_FECHA = "%Y-%m-%d"
+FORMATOS_ENTRADA = ("%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y")
+
+
+def normalizar_fecha(texto, obligatoria=True):
+    """Convierte una fecha escrita por el usuario al formato ISO 'AAAA-MM-DD'.
+
+    Acepta los formatos de ``FORMATOS_ENTRADA``. Devuelve ``None`` si el texto está
+    vacío y la fecha no es obligatoria; en cualquier otro caso lanza ``ValueError``.
+    """
+    texto = (texto or "").strip()
+    if not texto:
+        if obligatoria:
+            raise ValueError("La fecha es obligatoria.")
+        return None
+    for fmt in FORMATOS_ENTRADA:
+        try:
+            return datetime.strptime(texto, fmt).strftime(FORMATO_FECHA)
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha no válida: '{texto}'. Usa el formato AAAA-MM-DD.")
+
+
+def formatear_fecha(fecha_iso):
+    """Formatea una fecha ISO de la BD como 'DD-MM-AAAA' para mostrarla."""
+    if not fecha_iso:
+        return "-"
+    try:
+        return datetime.strptime(fecha_iso, FORMATO_FECHA).strftime("%d-%m-%Y")
+    except ValueError:
+        return fecha_iso
+
+
+ESQUEMA_BASE = """
+    CREATE TABLE IF NOT EXISTS TipoComponente (
+        id_tipo INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        descripcion TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS Producto (
+        id_producto INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_tipo INTEGER NOT NULL,
+        marca TEXT,
+        modelo TEXT,
+        tipo TEXT,
+        descripcion TEXT,
+        vida_util_km INTEGER,
+        vida_util_meses INTEGER,
+        FOREIGN KEY (id_tipo) REFERENCES TipoComponente(id_tipo)
+    );
+
+    CREATE TABLE IF NOT EXISTS Coche (
+        matricula TEXT PRIMARY KEY,
+        marca TEXT NOT NULL,
+        modelo TEXT NOT NULL,
+        km_actuales INTEGER,
+        fecha_matriculacion DATE NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS Mantenimiento (
+        id_mantenimiento INTEGER PRIMARY KEY AUTOINCREMENT,
+        matricula TEXT NOT NULL,
+        id_producto INTEGER NOT NULL,
+        fecha DATE NOT NULL,
+        km INTEGER NOT NULL,
+        descripcion TEXT,
+        FOREIGN KEY (matricula) REFERENCES Coche(matricula),
+        FOREIGN KEY (id_producto) REFERENCES Producto(id_producto)
+    );
+
+    CREATE TABLE IF NOT EXISTS Obligaciones (
+        id_obligacion INTEGER PRIMARY KEY AUTOINCREMENT,
+        matricula TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        descripcion TEXT,
+        fecha_inicio DATE,
+        fecha_vencimiento DATE,
+        estado TEXT DEFAULT 'Vigente',
+        FOREIGN KEY (matricula) REFERENCES Coche(matricula)
+    );
+
+    CREATE TABLE IF NOT EXISTS Proveedor (
+        id_proveedor INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL,
+        cif_nif TEXT UNIQUE,
+        tipo TEXT,
+        telefono TEXT,
+        email TEXT,
+        direccion TEXT,
+        descripcion TEXT
+    );
+
+    CREATE TABLE IF NOT EXISTS Factura (
+        id_factura INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_proveedor INTEGER NOT NULL,
+        num_factura TEXT NOT NULL,
+        fecha_emision DATE,
+        importe_total REAL,
+        matricula TEXT,
+        FOREIGN KEY (id_proveedor) REFERENCES Proveedor(id_proveedor),
+        FOREIGN KEY (matricula) REFERENCES Coche(matricula),
+        UNIQUE (id_proveedor, num_factura)
+    );
+
+    CREATE TABLE IF NOT EXISTS Gasto (
+        id_gasto INTEGER PRIMARY KEY AUTOINCREMENT,
+        matricula TEXT NOT NULL,
+        id_factura INTEGER,
+        fecha DATE NOT NULL,
+        categoria TEXT,
+        concepto TEXT NOT NULL,
+        importe REAL NOT NULL,
+        observaciones TEXT,
+        FOREIGN KEY (matricula) REFERENCES Coche(matricula),
+        FOREIGN KEY (id_factura) REFERENCES Factura(id_factura)
+    );
+
+"""
+
+# Tablas de datos del esquema base, con las referenciadas antes que las que las referencian
+TABLAS = ("TipoComponente", "Producto", "Coche", "Mantenimiento", "Obligaciones", "Proveedor", "Factura", "Gasto")
+
+# Clave primaria de cada tabla de datos
+CLAVES_PRIMARIAS = {
+    "TipoComponente": "id_tipo",
+    "Producto": "id_producto",
+    "Coche": "matricula",
+    "Mantenimiento": "id_mantenimiento",
+    "Obligaciones": "id_obligacion",
+    "Proveedor": "id_proveedor",
+    "Factura": "id_factura",
+    "Gasto": "id_gasto",
+}
+
+
+# MIGRACIONES
+
+# Columnas de fecha que se guardan en formato ISO: (tabla, clave primaria, columnas)
+COLUMNAS_FECHA = [
+    ("Coche", "matricula", ("fecha_matriculacion",)),
+    ("Mantenimiento", "id_mantenimiento", ("fecha",)),
+    ("Obligaciones", "id_obligacion", ("fecha_inicio", "fecha_vencimiento")),
+    ("Factura", "id_factura", ("fecha_emision",)),
+    ("Gasto", "id_gasto", ("fecha",)),
+]
+
+
+def _normalizar_fechas_existentes(conn):
+    """Reescribe en formato ISO las fechas guardadas como texto libre."""
+    for tabla, clave, columnas in COLUMNAS_FECHA:
+        for columna in columnas:
+            cambios = []
+            sin_convertir = 0
+            filas = conn.execute(
+                f"SELECT {clave}, {columna} FROM {tabla} WHERE {columna} IS NOT NULL AND {columna} != ''"
+            )
+            for id_fila, valor in filas:
+                try:
+                    iso = normalizar_fecha(str(valor))
+                except ValueError:
+                    sin_convertir += 1
+                    continue
+                if iso != valor:
+                    cambios.append((iso, id_fila))
+
+            conn.executemany(f"UPDATE {tabla} SET {columna} = ? WHERE {clave} = ?", cambios)
+            if sin_convertir:
+                print(f"Aviso: {sin_convertir} fechas de {tabla}.{columna} no se pudieron convertir.")
+
+
+# Índice de búsqueda de texto completo.  Cada fila de Busqueda apunta a una fila
+# de otra tabla; su rowid es ``id * 8 + codigo`` para que los triggers la
+# localicen sin recorrer el índice.  (tabla, código, clave primaria, columnas de
+# texto, columna de matrícula o None)
+FUENTES_BUSQUEDA = [
+    ("Mantenimiento", 1, "id_mantenimiento", ("descripcion",), "matricula"),
+    ("Gasto", 2, "id_gasto", ("concepto", "observaciones"), "matricula"),
+    ("Factura", 3, "id_factura", ("num_factura",), "matricula"),
+    ("Obligaciones", 4, "id_obligacion", ("tipo", "descripcion"), "matricula"),
+    ("Producto", 5, "id_producto", ("marca", "modelo", "descripcion"), None),
+    ("Proveedor", 6, "id_proveedor", ("nombre",), None),
+]
+
+
+_INSERTAR_BUSQUEDA = "INSERT INTO Busqueda (rowid, texto, tabla, id_fila, matricula) SELECT {}"
+
+
+def _fila_busqueda(fuente, ref):
+    """Valores de la fila de Busqueda de la fila ``ref`` (``NEW.``, ``OLD.`` o ``""``) de una fuente."""
+    tabla, codigo, clave, columnas, matricula = fuente
+    texto = " || ' ' || ".join(f"coalesce({ref}{c}, '')" for c in columnas)
+    mat = f"{ref}{matricula}" if matricula else "NULL"
+    return f"{ref}{clave} * 8 + {codigo}, {texto}, '{tabla}', {ref}{clave}, {mat}"
+
+
+def _crear_indice_busqueda(conn):
+    """Crea la tabla FTS5 de búsqueda, sus triggers de sincronización y la rellena."""
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS Busqueda USING fts5(
+            texto, tabla UNINDEXED, id_fila UNINDEXED, matricula UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+
+    for fuente in FUENTES_BUSQUEDA:
+        tabla, codigo, clave, columnas, matricula = fuente
+        insertar = _INSERTAR_BUSQUEDA.format(_fila_busqueda(fuente, "NEW."))
+        borrar = f"DELETE FROM Busqueda WHERE rowid = OLD.{clave} * 8 + {codigo}"
+        vigiladas = ", ".join((clave,) + columnas + ((matricula,) if matricula else ()))
+
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_busqueda_{tabla.lower()}_ins AFTER INSERT ON {tabla}
+            BEGIN {insertar}; END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_busqueda_{tabla.lower()}_upd AFTER UPDATE OF {vigiladas} ON {tabla}
+            BEGIN {borrar}; {insertar}; END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_busqueda_{tabla.lower()}_del AFTER DELETE ON {tabla}
+            BEGIN {borrar}; END
+        """)
+        conn.execute(_INSERTAR_BUSQUEDA.format(_fila_busqueda(fuente, "")) + f" FROM {tabla}")
+
+    conn.execute("INSERT INTO Busqueda (Busqueda) VALUES ('optimize')")
+
+
+# Índice de prefijos para el selector de vehículos: cada coche tiene una fila por
+# clave (matrícula, marca, modelo y marca+modelo) normalizada con CLAVE_COCHE,
+# de modo que buscar mientras se escribe es un único rango sobre la clave primaria.
+CLAVE_COCHE = "lower(replace(replace({}, ' ', ''), '-', ''))"
+
+
+def _crear_indice_coches(conn):
+    """Crea CocheIndice, sus triggers de sincronización y lo rellena."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CocheIndice (
+            clave TEXT NOT NULL,
+            matricula TEXT NOT NULL,
+            PRIMARY KEY (clave, matricula)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cocheindice_matricula ON CocheIndice(matricula)")
+
+    def claves(ref):
+        return [CLAVE_COCHE.format(c) for c in (
+            f"{ref}matricula", f"{ref}marca", f"{ref}modelo", f"{ref}marca || {ref}modelo"
+        )]
+
+    def insertar(ref):
+        valores = ", ".join(f"({clave})" for clave in claves(ref))
+        return f"""
+            INSERT OR IGNORE INTO CocheIndice (clave, matricula)
+            SELECT column1, {ref}matricula FROM (VALUES {valores}) WHERE column1 != ''
+        """
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_cocheindice_ins AFTER INSERT ON Coche
+        BEGIN {insertar("NEW.")}; END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_cocheindice_upd AFTER UPDATE OF matricula, marca, modelo ON Coche
+        BEGIN DELETE FROM CocheIndice WHERE matricula = OLD.matricula; {insertar("NEW.")}; END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_cocheindice_del AFTER DELETE ON Coche
+        BEGIN DELETE FROM CocheIndice WHERE matricula = OLD.matricula; END
+    """)
+    for clave in claves(""):
+        conn.execute(f"""
+            INSERT OR IGNORE INTO CocheIndice (clave, matricula)
+            SELECT {clave}, matricula FROM Coche WHERE {clave} != ''
+        """)
+
+
+# Próximo cambio de un mantenimiento M según la vida útil de su producto P
+PROXIMO_KM = "CASE WHEN P.vida_util_km THEN M.km + P.vida_util_km END"
+PROXIMA_FECHA = "CASE WHEN P.vida_util_meses THEN date(M.fecha, '+' || (P.vida_util_meses * 30) || ' days') END"
+
+# Vencimiento guarda, por vehículo y tipo de componente, el último mantenimiento
+# y cuándo toca el siguiente.  Los triggers recalculan solo los vehículos
+# afectados por cada cambio; km_restantes se mantiene al actualizar los km del
+# coche para que la lista de la flota sea una búsqueda por índice.
+_RECALCULAR_VENCIMIENTOS = f"""
+    INSERT INTO Vencimiento (matricula, id_tipo, id_mantenimiento, fecha, km, prox_km, prox_fecha, km_restantes)
+    SELECT matricula, id_tipo, id_mantenimiento, fecha, km, prox_km, prox_fecha, prox_km - km_actuales
+    FROM (
+        SELECT M.matricula, P.id_tipo, M.id_mantenimiento, M.fecha, M.km,
+            {PROXIMO_KM} AS prox_km,
+            {PROXIMA_FECHA} AS prox_fecha,
+            C.km_actuales,
+            row_number() OVER (
+                PARTITION BY M.matricula, P.id_tipo
+                ORDER BY M.fecha DESC, M.km DESC, M.id_mantenimiento DESC
+            ) AS n
+        FROM Mantenimiento M
+        JOIN Producto P ON M.id_producto = P.id_producto
+        JOIN Coche C ON C.matricula = M.matricula
+        WHERE {{filtro}}
+    )
+    WHERE n = 1
+"""
+
+
+def _crear_vencimientos(conn):
+    """Crea la tabla Vencimiento, sus triggers de mantenimiento incremental y la calcula."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Vencimiento (
+            matricula TEXT NOT NULL,
+            id_tipo INTEGER NOT NULL,
+            id_mantenimiento INTEGER NOT NULL,
+            fecha DATE NOT NULL,
+            km INTEGER NOT NULL,
+            prox_km INTEGER,
+            prox_fecha DATE,
+            km_restantes INTEGER,
+            UNIQUE (matricula, id_tipo)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vencimiento_prox_fecha ON Vencimiento(prox_fecha)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vencimiento_km_restantes ON Vencimiento(km_restantes)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_mantenimiento_producto ON Mantenimiento(id_producto)")
+
+    def recalcular(matricula):
+        return (f"DELETE FROM Vencimiento WHERE matricula = {matricula}; "
+                + _RECALCULAR_VENCIMIENTOS.format(filtro=f"M.matricula = {matricula}") + ";")
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vencimiento_mant_ins AFTER INSERT ON Mantenimiento
+        BEGIN {recalcular("NEW.matricula")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vencimiento_mant_upd
+        AFTER UPDATE OF matricula, id_producto, fecha, km ON Mantenimiento
+        BEGIN {recalcular("OLD.matricula")} {recalcular("NEW.matricula")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vencimiento_mant_del AFTER DELETE ON Mantenimiento
+        BEGIN {recalcular("OLD.matricula")} END
+    """)
+    afectados = "(SELECT DISTINCT matricula FROM Mantenimiento WHERE id_producto = NEW.id_producto)"
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_vencimiento_producto_upd
+        AFTER UPDATE OF id_tipo, vida_util_km, vida_util_meses ON Producto
+        BEGIN
+            DELETE FROM Vencimiento WHERE matricula IN {afectados};
+            {_RECALCULAR_VENCIMIENTOS.format(filtro=f"M.matricula IN {afectados}")};
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vencimiento_coche_km AFTER UPDATE OF km_actuales ON Coche
+        BEGIN
+            UPDATE Vencimiento SET km_restantes = prox_km - NEW.km_actuales WHERE matricula = NEW.matricula;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_vencimiento_coche_del AFTER DELETE ON Coche
+        BEGIN
+            DELETE FROM Vencimiento WHERE matricula = OLD.matricula;
+        END
+    """)
+
+    conn.execute("DELETE FROM Vencimiento")
+    conn.execute(_RECALCULAR_VENCIMIENTOS.format(filtro="1"))
+
+
+# Costes agregados.  Los importes se acumulan en céntimos enteros para que sumar
+# y restar en los triggers no arrastre errores de redondeo.  Cada agregado es
+# (tabla, tabla origen, columnas clave -> expresión, columna de importe, columna
+# de número de filas, condición para que la fila cuente); en las expresiones
+# ``{r}`` es el prefijo de la fila (``NEW.``/``OLD.`` en los triggers).
+CENTIMOS = "CAST(round(coalesce({r}%s, 0) * 100) AS INTEGER)"
+
+AGREGADOS_COSTE = [
+    ("CosteVehiculo", "Gasto", {"matricula": "{r}matricula"},
+     "gastos", "num_gastos", "1"),
+    ("CosteVehiculo", "Factura", {"matricula": "{r}matricula"},
+     "facturas", "num_facturas", "{r}matricula IS NOT NULL"),
+    ("CosteCategoriaMes", "Gasto",
+     {"matricula": "{r}matricula", "categoria": "coalesce({r}categoria, '')", "mes": "substr({r}fecha, 1, 7)"},
+     "importe", "num", "1"),
+    ("CosteProveedorMes", "Factura",
+     {"id_proveedor": "{r}id_proveedor", "mes": "coalesce(substr({r}fecha_emision, 1, 7), '')"},
+     "importe", "num", "1"),
+]
+
+# Por tabla origen: columna del importe y columnas que afectan a algún agregado
+ORIGENES_COSTE = {
+    "Gasto": ("importe", ("matricula", "categoria", "fecha", "importe")),
+    "Factura": ("importe_total", ("matricula", "id_proveedor", "fecha_emision", "importe_total")),
+}
+
+
+# Contadores de filas de cada tabla de agregados; una fila con todos a 0 se borra
+_CONTADORES = {
+    "CosteVehiculo": ("num_gastos", "num_facturas"),
+    "CosteCategoriaMes": ("num",),
+    "CosteProveedorMes": ("num",),
+}
+
+
+def _sumar_coste(agregado, ref, signo):
+    """SQL que suma (``signo`` 1) o resta (-1) la fila ``ref`` de un agregado."""
+    tabla, origen, claves, col_importe, col_num, condicion = agregado
+    columnas = ", ".join(claves)
+    valores = [e.format(r=ref) for e in claves.values()]
+    importe = (CENTIMOS % ORIGENES_COSTE[origen][0]).format(r=ref)
+    donde = " AND ".join(f"{c} = {v}" for c, v in zip(claves, valores))
+    vacia = " AND ".join(f"{c} = 0" for c in _CONTADORES[tabla])
+    return f"""
+        INSERT INTO {tabla} ({columnas}, {col_importe}, {col_num})
+        SELECT {", ".join(valores)}, {signo} * {importe}, {signo} WHERE {condicion.format(r=ref)}
+        ON CONFLICT ({columnas}) DO UPDATE SET
+            {col_importe} = {col_importe} + excluded.{col_importe},
+            {col_num} = {col_num} + excluded.{col_num};
+        DELETE FROM {tabla} WHERE {donde} AND {vacia};
+    """
+
+
+def _acumular_costes(conn, origen=None, desde=None):
+    """Suma a los agregados las filas de ``origen`` (o de todas las tablas) con clave mayor que ``desde``."""
+    for tabla, origen_agregado, claves, col_importe, col_num, condicion in AGREGADOS_COSTE:
+        if origen not in (None, origen_agregado):
+            continue
+        columnas = ", ".join(claves)
+        expresiones = ", ".join(e.format(r="") for e in claves.values())
+        filtro = condicion.format(r="")
+        if desde is not None:
+            filtro += f" AND {CLAVES_PRIMARIAS[origen_agregado]} > {int(desde)}"
+        conn.execute(f"""
+            INSERT INTO {tabla} ({columnas}, {col_importe}, {col_num})
+            SELECT {expresiones}, sum({(CENTIMOS % ORIGENES_COSTE[origen_agregado][0]).format(r="")}), count(*)
+            FROM {origen_agregado}
+            WHERE {filtro}
+            GROUP BY {expresiones}
+            ON CONFLICT ({columnas}) DO UPDATE SET
+                {col_importe} = {col_importe} + excluded.{col_importe},
+                {col_num} = {col_num} + excluded.{col_num}
+        """)
+
+
+def reconstruir_costes(conn):
+    """Recalcula desde cero las tablas de costes agregados (las deja como las mantendrían los triggers)."""
+    for tabla in _CONTADORES:
+        conn.execute(f"DELETE FROM {tabla}")
+    _acumular_costes(conn)
+
+
+def _crear_costes(conn):
+    """Crea las tablas de costes agregados, sus triggers de mantenimiento incremental y las calcula."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CosteVehiculo (
+            matricula TEXT PRIMARY KEY,
+            gastos INTEGER NOT NULL DEFAULT 0,
+            num_gastos INTEGER NOT NULL DEFAULT 0,
+            facturas INTEGER NOT NULL DEFAULT 0,
+            num_facturas INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CosteCategoriaMes (
+            matricula TEXT NOT NULL,
+            categoria TEXT NOT NULL,
+            mes TEXT NOT NULL,
+            importe INTEGER NOT NULL DEFAULT 0,
+            num INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (matricula, categoria, mes)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_costecategoriames_mes ON CosteCategoriaMes(mes)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CosteProveedorMes (
+            id_proveedor INTEGER NOT NULL,
+            mes TEXT NOT NULL,
+            importe INTEGER NOT NULL DEFAULT 0,
+            num INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (id_proveedor, mes)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_costeproveedormes_mes ON CosteProveedorMes(mes)")
+
+    for origen, (_, vigiladas) in ORIGENES_COSTE.items():
+        agregados = [a for a in AGREGADOS_COSTE if a[1] == origen]
+        sumar = "".join(_sumar_coste(a, "NEW.", 1) for a in agregados)
+        restar = "".join(_sumar_coste(a, "OLD.", -1) for a in agregados)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_coste_{origen.lower()}_ins AFTER INSERT ON {origen}
+            BEGIN {sumar} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_coste_{origen.lower()}_upd AFTER UPDATE OF {", ".join(vigiladas)} ON {origen}
+            BEGIN {restar} {sumar} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_coste_{origen.lower()}_del AFTER DELETE ON {origen}
+            BEGIN {restar} END
+        """)
+
+    reconstruir_costes(conn)
+
+
+# Histórico de km.  LecturaKm guarda una lectura del cuentakilómetros por vehículo
+# y día (la última del día gana); la alimentan los triggers de Coche (alta y
+# cambios de km_actuales) y de Mantenimiento.  RitmoKm guarda los km/día de cada
+# vehículo, ajustados por mínimos cuadrados sobre sus lecturas recientes, para
+# estimar cuándo se llegará al próximo cambio por km.  Cada cambio de lecturas
+# apunta el vehículo en RitmoPendiente y ``recalcular_ritmos`` los recalcula
+# todos de una vez.
+
+# Días de lecturas que entran en el ajuste, contados desde la última lectura (las dos últimas entran siempre)
+RITMO_DIAS = 365
+
+# Fecha en que el vehículo de la fila Vencimiento V llega a su próximo cambio por km al ritmo R
+FECHA_ESTIMADA = """CASE WHEN R.km_dia > 0 AND V.prox_km IS NOT NULL
+    THEN date(R.fecha, printf('%+d days', CAST(round((V.prox_km - R.km) / R.km_dia) AS INTEGER))) END"""
+
+
+def recalcular_ritmos(conn, todos=False):
+    """Recalcula los km/día de los vehículos pendientes (o de toda la flota) en una sola consulta.
+
+    La pendiente de la recta km = a + b·día se calcula centrando en la media de
+    cada vehículo (Σdx·dy / Σdx²), que no pierde precisión con fechas julianas.
+    Los ritmos negativos (correcciones del cuentakilómetros) se dejan en 0.
+    """
+    filtro = "1" if todos else "matricula IN (SELECT matricula FROM RitmoPendiente)"
+    conn.execute(f"DELETE FROM RitmoKm WHERE {filtro}")
+    conn.execute(f"""
+        INSERT INTO RitmoKm (matricula, km_dia, lecturas, fecha, km)
+        SELECT matricula, max(coalesce(sum(dx * dy) / nullif(sum(dx * dx), 0), 0), 0), count(*),
+            -- max() devuelve las demás columnas de la fila del máximo: la última lectura
+            date(max(x)), y
+        FROM (
+            SELECT matricula, x, y, x - avg(x) OVER v AS dx, y - avg(y) OVER v AS dy
+            FROM (
+                SELECT matricula, julianday(fecha) AS x, km AS y,
+                    max(julianday(fecha)) OVER v AS ultima,
+                    row_number() OVER (PARTITION BY matricula ORDER BY fecha DESC) AS n
+                FROM LecturaKm
+                WHERE {filtro}
+                WINDOW v AS (PARTITION BY matricula)
+            )
+            WHERE x >= ultima - {RITMO_DIAS} OR n <= 2
+            WINDOW v AS (PARTITION BY matricula)
+        )
+        GROUP BY matricula
+        HAVING count(*) >= 2
+    """)
+    conn.execute("DELETE FROM RitmoPendiente")
+
+
+def _crear_lecturas_km(conn):
+    """Crea LecturaKm y RitmoKm con sus triggers, las rellena con los datos existentes y calcula los ritmos."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS LecturaKm (
+            matricula TEXT NOT NULL,
+            fecha DATE NOT NULL,
+            km INTEGER NOT NULL,
+            PRIMARY KEY (matricula, fecha)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS RitmoKm (
+            matricula TEXT PRIMARY KEY,
+            km_dia REAL NOT NULL,
+            lecturas INTEGER NOT NULL,
+            fecha DATE NOT NULL,
+            km INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS RitmoPendiente (matricula TEXT PRIMARY KEY) WITHOUT ROWID")
+
+    def lectura(matricula, fecha, km):
+        return f"""
+            INSERT INTO LecturaKm (matricula, fecha, km) VALUES ({matricula}, {fecha}, {km})
+            ON CONFLICT (matricula, fecha) DO UPDATE SET km = excluded.km;
+        """
+    def quitar_lectura(ref):
+        return f"DELETE FROM LecturaKm WHERE matricula = {ref}matricula AND fecha = {ref}fecha AND km = {ref}km;"
+
+    hoy = "date('now', 'localtime')"
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_lecturakm_coche_ins AFTER INSERT ON Coche
+        BEGIN
+            {lectura("NEW.matricula", "NEW.fecha_matriculacion", "0")}
+            INSERT INTO LecturaKm (matricula, fecha, km)
+            SELECT NEW.matricula, {hoy}, NEW.km_actuales WHERE NEW.km_actuales IS NOT NULL
+            ON CONFLICT (matricula, fecha) DO UPDATE SET km = excluded.km;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_lecturakm_coche_km AFTER UPDATE OF km_actuales ON Coche
+        WHEN NEW.km_actuales IS NOT NULL
+        BEGIN {lectura("NEW.matricula", hoy, "NEW.km_actuales")} END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_lecturakm_coche_del AFTER DELETE ON Coche
+        BEGIN DELETE FROM LecturaKm WHERE matricula = OLD.matricula; END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_lecturakm_mant_ins AFTER INSERT ON Mantenimiento
+        BEGIN {lectura("NEW.matricula", "NEW.fecha", "NEW.km")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_lecturakm_mant_upd AFTER UPDATE OF matricula, fecha, km ON Mantenimiento
+        BEGIN {quitar_lectura("OLD.")} {lectura("NEW.matricula", "NEW.fecha", "NEW.km")} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_lecturakm_mant_del AFTER DELETE ON Mantenimiento
+        BEGIN {quitar_lectura("OLD.")} END
+    """)
+    # ON CONFLICT DO NOTHING y no INSERT OR IGNORE: dentro de un trigger manda la
+    # política de conflictos de la sentencia que lo dispara, y los upserts sobre
+    # LecturaKm fallarían al apuntar un vehículo que ya estaba pendiente
+    for evento, ref in (("INSERT", "NEW."), ("UPDATE", "NEW."), ("DELETE", "OLD.")):
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_ritmopendiente_{evento.lower()} AFTER {evento} ON LecturaKm
+            BEGIN
+                INSERT INTO RitmoPendiente (matricula) VALUES ({ref}matricula) ON CONFLICT (matricula) DO NOTHING;
+            END
+        """)
+
+    # Lecturas que se deducen de los datos existentes: 0 km al matricular, los km
+    # de cada mantenimiento y los km actuales, fechados hoy
+    ultima_gana = "ON CONFLICT (matricula, fecha) DO UPDATE SET km = excluded.km"
+    conn.execute(f"""
+        INSERT INTO LecturaKm (matricula, fecha, km)
+        SELECT matricula, fecha_matriculacion, 0 FROM Coche WHERE fecha_matriculacion IS NOT NULL {ultima_gana}
+    """)
+    conn.execute(f"""
+        INSERT INTO LecturaKm (matricula, fecha, km)
+        SELECT matricula, fecha, km FROM Mantenimiento WHERE true ORDER BY fecha, id_mantenimiento {ultima_gana}
+    """)
+    conn.execute(f"""
+        INSERT INTO LecturaKm (matricula, fecha, km)
+        SELECT matricula, {hoy}, km_actuales FROM Coche WHERE km_actuales IS NOT NULL {ultima_gana}
+    """)
+    recalcular_ritmos(conn, todos=True)
+
+
+# Telemetría de los sensores (ver sensores.py).  Los km van a LecturaKm; el nivel
+# de combustible se guarda como serie temporal y los códigos de avería (DTC) se
+# agregan por vehículo y código con la primera y la última vez que se vieron.
+def _crear_telemetria(conn):
+    """Crea las tablas de telemetría."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS LecturaCombustible (
+            matricula TEXT NOT NULL,
+            instante TEXT NOT NULL,
+            nivel REAL NOT NULL,
+            PRIMARY KEY (matricula, instante)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS CodigoAveria (
+            matricula TEXT NOT NULL,
+            codigo TEXT NOT NULL,
+            primera TEXT NOT NULL,
+            ultima TEXT NOT NULL,
+            veces INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (matricula, codigo)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_codigoaveria_ultima ON CodigoAveria(ultima)")
+
+
+# Cargas masivas.  Los triggers que mantienen la búsqueda, los costes y los
+# próximos cambios trabajan fila a fila, y en una importación de un millón de
+# filas son la mayor parte del tiempo (los de vencimientos, además, recalculan
+# todo el vehículo en cada fila).  carga_masiva los quita mientras se insertan
+# las filas y al terminar pone al día lo derivado de las filas nuevas en una
+# sola pasada por tabla.
+@contextmanager
+def carga_masiva(conn, tabla):
+    """Contexto para insertar muchas filas nuevas en ``tabla`` sin los triggers de INSERT por fila.
+
+    Debe usarse dentro de una transacción abierta (el DROP TRIGGER no abre una
+    por sí mismo): si algo falla, deshacerla restaura también los triggers.
+    Solo admite filas nuevas con clave autonumérica (se localizan por tener una
+    clave mayor que la máxima al empezar); las actualizaciones y borrados
+    siguen pasando por sus triggers normales.
+    """
+    if not conn.in_transaction:
+        raise RuntimeError("carga_masiva necesita una transacción abierta.")
+    fuente = next((f for f in FUENTES_BUSQUEDA if f[0] == tabla), None)
+    nombres = [f"trg_busqueda_{tabla.lower()}_ins", f"trg_coste_{tabla.lower()}_ins"]
+    if tabla == "Mantenimiento":
+        nombres.append("trg_vencimiento_mant_ins")
+    marcadores = ", ".join("?" for _ in nombres)
+    triggers = [sql for (sql,) in conn.execute(
+        f"SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({marcadores})", nombres)]
+    clave = CLAVES_PRIMARIAS[tabla]
+    desde = conn.execute(f"SELECT coalesce(max({clave}), 0) FROM {tabla}").fetchone()[0]
+    for nombre in nombres:
+        conn.execute(f"DROP TRIGGER IF EXISTS {nombre}")
+
+    yield
+
+    if fuente:
+        conn.execute(_INSERTAR_BUSQUEDA.format(_fila_busqueda(fuente, "")) + f" FROM {tabla} WHERE {clave} > ?", (desde,))
+    if tabla in ORIGENES_COSTE:
+        _acumular_costes(conn, tabla, desde)
+    if tabla == "Mantenimiento":
+        afectados = f"(SELECT DISTINCT matricula FROM Mantenimiento WHERE id_mantenimiento > {int(desde)})"
+        conn.execute(f"DELETE FROM Vencimiento WHERE matricula IN {afectados}")
+        conn.execute(_RECALCULAR_VENCIMIENTOS.format(filtro=f"M.matricula IN {afectados}"))
+    for sql in triggers:
+        conn.execute(sql)
+
+
+# Registro de cambios para la sincronización (ver sincronizacion.py).  Cambio
+# guarda solo el último cambio de cada fila de las tablas de datos, con una
+# versión que crece con cada escritura (AUTOINCREMENT no reutiliza números);
+# las filas borradas quedan como lápida (borrado = 1) para que los clientes
+# sepan que deben eliminarlas.  Las tablas derivadas (costes, vencimientos,
+# ritmos, búsqueda) no se registran: se recalculan a partir de estas.
+def _apuntar_cambio(tabla, ref, borrado):
+    # Borrar y volver a insertar da a la fila una versión nueva; un upsert no
+    # puede cambiar la clave AUTOINCREMENT y un INSERT OR REPLACE heredaría la
+    # política de conflictos de la sentencia que dispara el trigger.  El + quita
+    # la afinidad INTEGER de la columna: sin él, clave (sin tipo) tendría que
+    # convertirse a número para compararla, SQLite no podría usar el índice único
+    # y cada escritura recorrería todas las filas de la tabla en Cambio.
+    return f"""
+        DELETE FROM Cambio WHERE tabla = '{tabla}' AND clave = +{ref}{CLAVES_PRIMARIAS[tabla]};
+        INSERT INTO Cambio (tabla, clave, borrado) VALUES ('{tabla}', {ref}{CLAVES_PRIMARIAS[tabla]}, {borrado});
+    """
+
+
+def _crear_triggers_cambio(conn):
+    for tabla, clave in CLAVES_PRIMARIAS.items():
+        nombre = f"trg_cambio_{tabla.lower()}"
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {nombre}_ins AFTER INSERT ON {tabla}
+            BEGIN {_apuntar_cambio(tabla, "NEW.", 0)} END
+        """)
+        # Si cambia la clave (una matrícula corregida), la antigua queda como borrada
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {nombre}_upd_clave AFTER UPDATE OF {clave} ON {tabla}
+            WHEN OLD.{clave} IS NOT NEW.{clave}
+            BEGIN {_apuntar_cambio(tabla, "OLD.", 1)} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {nombre}_upd AFTER UPDATE ON {tabla}
+            BEGIN {_apuntar_cambio(tabla, "NEW.", 0)} END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {nombre}_del AFTER DELETE ON {tabla}
+            BEGIN {_apuntar_cambio(tabla, "OLD.", 1)} END
+        """)
+
+
+def _crear_registro_cambios(conn):
+    """Crea el registro de cambios con sus triggers y apunta las filas que ya existen."""
+    # clave sin tipo: las claves enteras siguen siendo enteras y las matrículas texto
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS Cambio (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            clave NOT NULL,
+            borrado INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (tabla, clave)
+        )
+    """)
+    _crear_triggers_cambio(conn)
+    for tabla, clave in CLAVES_PRIMARIAS.items():
+        conn.execute(f"INSERT OR IGNORE INTO Cambio (tabla, clave) SELECT '{tabla}', {clave} FROM {tabla} ORDER BY {clave}")
+
+
+#
+# Cada entrada es un script SQL o una función que recibe la conexión.  La
+# posición en la lista (empezando en 1) es el número de versión: nunca se
+# reordenan ni se modifican las ya publicadas, solo se añaden al final.
+
+MIGRACIONES = [
+    # 1: índices para las consultas por vehículo y por fecha
+    """
+    CREATE INDEX IF NOT EXISTS idx_mantenimiento_matricula_fecha ON Mantenimiento(matricula, fecha);
+    CREATE INDEX IF NOT EXISTS idx_mantenimiento_matricula_km ON Mantenimiento(matricula, km);
+    CREATE INDEX IF NOT EXISTS idx_gasto_matricula_fecha ON Gasto(matricula, fecha);
+    CREATE INDEX IF NOT EXISTS idx_factura_matricula_fecha ON Factura(matricula, fecha_emision);
+    CREATE INDEX IF NOT EXISTS idx_obligaciones_matricula_vencimiento ON Obligaciones(matricula, fecha_vencimiento);
+    CREATE INDEX IF NOT EXISTS idx_obligaciones_vencimiento ON Obligaciones(fecha_vencimiento);
+    CREATE INDEX IF NOT EXISTS idx_producto_tipo_marca_modelo ON Producto(id_tipo, marca, modelo);
+    """,
+    # 2: fechas en formato ISO
+    _normalizar_fechas_existentes,
+    # 3: índices para los listados globales ordenados por fecha
+    """
+    CREATE INDEX IF NOT EXISTS idx_gasto_fecha ON Gasto(fecha);
+    CREATE INDEX IF NOT EXISTS idx_factura_fecha ON Factura(fecha_emision);
+    """,
+    # 4: búsqueda de texto completo (FTS5)
+    _crear_indice_busqueda,
+    # 5: índice de prefijos del selector de vehículos
+    _crear_indice_coches,
+    # 6: próximos cambios precalculados por vehículo y tipo de componente
+    _crear_vencimientos,
+    # 7: costes agregados por vehículo, por vehículo/categoría/mes y por proveedor/mes
+    _crear_costes,
+    # 8: histórico de km y ritmo de uso (km/día) de cada vehículo
+    _crear_lecturas_km,
+    # 9: telemetría de sensores: nivel de combustible y códigos de avería
+    _crear_telemetria,
+    # 10: registro de cambios por fila para la sincronización
+    _crear_registro_cambios,
+    # 11: matrículas sin espacios alrededor, para que las consultas por vehículo
+    # puedan comparar la columna tal cual (y usar su índice) en vez de TRIM()
+    """
+    UPDATE Factura SET matricula = trim(matricula) WHERE matricula <> trim(matricula);
+    UPDATE Gasto SET matricula = trim(matricula) WHERE matricula <> trim(matricula);
+    UPDATE Mantenimiento SET matricula = trim(matricula) WHERE matricula <> trim(matricula);
+    UPDATE Obligaciones SET matricula = trim(matricula) WHERE matricula <> trim(matricula);
+    """,
+    # 12: facturas sin vehículo con matrícula NULL y no '', que CosteVehiculo
+    # contaba como de un vehículo ''
+    """
+    UPDATE Factura SET matricula = NULL WHERE matricula = '';
+    """,
+]
+
+
+def version_esquema(conn):
+    """Devuelve la versión de esquema guardada en ``PRAGMA user_version``."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _aplicar_migracion(conn, numero, paso):
+    """Aplica una migración y sube ``user_version`` dentro de la misma transacción."""
+    try:
+        if callable(paso):
+            conn.execute("BEGIN")
+            paso(conn)
+            conn.execute(f"PRAGMA user_version = {numero}")
+            conn.commit()
+        else:
+            conn.executescript(f"BEGIN;\n{paso}\nPRAGMA user_version = {numero};\nCOMMIT;")
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+
+
+def migrar(conn):
+    """Lleva el esquema hasta la última versión. Devuelve la versión final."""
+    version = version_esquema(conn)
+    for numero in range(version + 1, len(MIGRACIONES) + 1):
+        print(f"Aplicando migración {numero}...")
+        _aplicar_migracion(conn, numero, MIGRACIONES[numero - 1])
+
+    if version < len(MIGRACIONES):
+        conn.execute("PRAGMA optimize")
+    return version_esquema(conn)
+
+
+def inicializar_base_datos():
+    """Crea la base de datos y todas las tablas necesarias si no existen y aplica las migraciones pendientes."""
+    db_existe = os.path.exists(DB_PATH)
+    conn = conectar()
+
+    if not db_existe:
+        print("Creando base de datos...")
+
+    conn.executescript(ESQUEMA_BASE)
+    conn.commit()
+    migrar(conn)
+    conn.close()
+
+    if not db_existe:
+        print("Base de datos creada correctamente.")
+    else:
+        print("Base de datos existente, arrancamos.")
@@ -0,0 +1,185 @@
+"""Catálogo en memoria de las entidades que aparecen en los desplegables.
+
+Cada conjunto (tipos de componente, productos, mantenimientos, obligaciones y
+proveedores) se lee entero una sola vez, la primera vez que se necesita. Desde
+ahí se mantiene fila a fila: cada escritura avisa con ``Catalogos.cambio`` de la
+fila que ha tocado y solo se vuelven a leer esa fila y las que muestran datos
+suyos en la etiqueta (p. ej. los mantenimientos de un producto renombrado).
+
+Las etiquetas se guardan ya ordenadas, así que rellenar un combo no consulta la
+base de datos ni ordena nada.
+"""
+from bisect import bisect_left, insort
+
+# Claves por consulta al releer filas sueltas (por debajo del límite de parámetros de SQLite)
+LOTE = 500
+
+
+class Catalogo:
+    """Filas de una tabla indexadas por clave y por su etiqueta visible.
+
+    ``select`` es la consulta sin WHERE, ``clave`` la columna de clave primaria
+    tal y como se escribe en esa consulta, ``etiqueta(fila)`` el texto del combo
+    e ``incluir(fila)`` decide qué filas aparecen. ``orden`` es la función de
+    ordenación de las etiquetas (por defecto, orden alfabético normal).
+    """
+
+    def __init__(self, conn, select, clave, etiqueta, orden=None, incluir=None):
+        self.conn = conn
+        self.select = select
+        self.clave = clave
+        self._etiqueta = etiqueta
+        self._orden = orden
+        self._incluir = incluir
+        self._cargado = False
+
+    def _asegurar(self):
+        if not self._cargado:
+            self.recargar()
+
+    def recargar(self):
+        """Lee de nuevo la tabla entera."""
+        self._etiquetas = {}     # clave -> etiqueta
+        self._claves = {}        # etiqueta -> claves con esa etiqueta (la última es la vigente)
+        self._ordenadas = []     # etiquetas distintas, ya ordenadas
+        for fila in self.conn.execute(self.select).fetchall():
+            self._poner(fila[0], fila)
+        self._cargado = True
+
+    # Consultas
+
+    def etiquetas(self):
+        """Etiquetas ordenadas para el combo (no modificar la lista devuelta)."""
+        self._asegurar()
+        return self._ordenadas
+
+    def clave_de(self, etiqueta):
+        self._asegurar()
+        claves = self._claves.get(etiqueta)
+        return claves[-1] if claves else None
+
+    def etiqueta(self, clave):
+        self._asegurar()
+        return self._etiquetas.get(clave)
+
+    # Mantenimiento incremental
+
+    def actualizar(self, *claves):
+        """Vuelve a leer esas filas: las nuevas se añaden y las que ya no existen se quitan."""
+        if not self._cargado:
+            return
+        for i in range(0, len(claves), LOTE):
+            lote = claves[i:i + LOTE]
+            marcas = ", ".join("?" * len(lote))
+            filas = {f[0]: f for f in self.conn.execute(
+                f"{self.select} WHERE {self.clave} IN ({marcas})", lote
+            ).fetchall()}
+            for clave in lote:
+                self._poner(clave, filas.get(clave))
+
+    def actualizar_dependientes(self, consulta_claves, *parametros):
+        """Vuelve a leer las filas cuyas claves devuelve ``consulta_claves`` (las que dependen de otra fila cambiada)."""
+        if self._cargado:
+            self.actualizar(*(f[0] for f in self.conn.execute(consulta_claves, parametros).fetchall()))
+
+    def _poner(self, clave, fila):
+        anterior = self._etiquetas.pop(clave, None)
+        if anterior is not None:
+            claves = self._claves[anterior]
+            claves.remove(clave)
+            if not claves:
+                del self._claves[anterior]
+                self._quitar_ordenada(anterior)
+
+        if fila is None or (self._incluir and not self._incluir(fila)):
+            return
+        etiqueta = self._etiqueta(fila)
+        self._etiquetas[clave] = etiqueta
+        if etiqueta in self._claves:
+            self._claves[etiqueta].append(clave)
+        else:
+            self._claves[etiqueta] = [clave]
+            insort(self._ordenadas, etiqueta, key=self._orden)
+
+    def _quitar_ordenada(self, etiqueta):
+        orden = self._orden or (lambda e: e)
+        i = bisect_left(self._ordenadas, orden(etiqueta), key=self._orden)
+        # Con orden sin mayúsculas puede haber varias etiquetas con la misma clave de orden
+        while self._ordenadas[i] != etiqueta:
+            i += 1
+        del self._ordenadas[i]
+
+
+# La clave primaria va siempre en la primera columna
+
+_SELECT_MANTENIMIENTOS = """
+    SELECT M.id_mantenimiento, C.matricula, TC.nombre AS tipo_componente,
+        P.marca, P.modelo, P.tipo, M.fecha
+    FROM Mantenimiento M
+    LEFT JOIN Coche C ON M.matricula = C.matricula
+    LEFT JOIN Producto P ON M.id_producto = P.id_producto
+    LEFT JOIN TipoComponente TC ON P.id_tipo = TC.id_tipo
+"""
+
+_SELECT_PRODUCTOS = """
+    SELECT p.id_producto, tc.nombre AS tipo_componente, p.marca, p.modelo, p.tipo
+    FROM Producto p
+    JOIN TipoComponente tc ON p.id_tipo = tc.id_tipo
+"""
+
+
+class Catalogos:
+    """Los catálogos de la aplicación y qué hay que releer cuando cambia cada tabla."""
+
+    def __init__(self, conn):
+        self.tipos = Catalogo(
+            conn, "SELECT id_tipo, nombre FROM TipoComponente", "id_tipo",
+            etiqueta=lambda r: r["nombre"]
+        )
+        self.productos = Catalogo(
+            conn, _SELECT_PRODUCTOS, "p.id_producto",
+            etiqueta=lambda r: f"{r['tipo_componente']} / {r['marca']} {r['modelo']} {r['tipo']}",
+            orden=str.lower
+        )
+        self.mantenimientos = Catalogo(
+            conn, _SELECT_MANTENIMIENTOS, "M.id_mantenimiento",
+            etiqueta=lambda r: f"{r['matricula']} / {r['tipo_componente']}, {r['marca']} {r['modelo']} {r['tipo']} ({r['fecha']})",
+            orden=str.lower,
+            incluir=lambda r: r["matricula"] and r["tipo_componente"]
+        )
+        self.obligaciones = Catalogo(
+            conn, "SELECT id_obligacion, matricula, tipo, fecha_vencimiento FROM Obligaciones", "id_obligacion",
+            etiqueta=lambda r: f"{r['matricula']} - {r['tipo']} (vence {r['fecha_vencimiento']})"
+        )
+        self.proveedores = Catalogo(
+            conn, "SELECT id_proveedor, nombre FROM Proveedor", "id_proveedor",
+            etiqueta=lambda r: r["nombre"]
+        )
+
+    def cambio(self, tabla, clave):
+        """Avisa de que la fila ``clave`` de ``tabla`` se ha insertado, modificado o borrado.
+
+        Las filas dependientes se buscan por su clave ajena, que sigue apuntando
+        a la fila aunque se haya borrado, así que basta con avisar después.
+        """
+        if tabla == "TipoComponente":
+            self.tipos.actualizar(clave)
+            self.productos.actualizar_dependientes("SELECT id_producto FROM Producto WHERE id_tipo = ?", clave)
+            self.mantenimientos.actualizar_dependientes("""
+                SELECT M.id_mantenimiento FROM Mantenimiento M
+                JOIN Producto P ON P.id_producto = M.id_producto
+                WHERE P.id_tipo = ?
+            """, clave)
+        elif tabla == "Producto":
+            self.productos.actualizar(clave)
+            self.mantenimientos.actualizar_dependientes(
+                "SELECT id_mantenimiento FROM Mantenimiento WHERE id_producto = ?", clave)
+        elif tabla == "Mantenimiento":
+            self.mantenimientos.actualizar(clave)
+        elif tabla == "Coche":
+            self.mantenimientos.actualizar_dependientes(
+                "SELECT id_mantenimiento FROM Mantenimiento WHERE matricula = ?", clave)
+        elif tabla == "Obligaciones":
+            self.obligaciones.actualizar(clave)
+        elif tabla == "Proveedor":
+            self.proveedores.actualizar(clave)
@@ -0,0 +1,214 @@
+"""Línea de órdenes de Fleet Plus, sin interfaz gráfica.
+
+No importa Tk ni abre ventanas, así que sirve para tareas programadas (cron) y
+servidores sin pantalla, y arranca en milisegundos:
+
+    python3 cli.py init
+    python3 cli.py vencimientos --dias 30 --km 2000
+    python3 cli.py pdf 1234ABC 5678DEF --destino informes/
+    python3 cli.py pdf --todos --destino informes/2025-03/ --procesos 8
+    python3 cli.py exportar Gasto gastos.csv
+    python3 cli.py exportar Gasto --matricula 1234ABC --desde 2024-01-01 > gastos.csv
+    python3 cli.py exportar todas --destino volcado/ --formato ndjson --gzip
+    python3 cli.py importar Coche coches.csv
+    python3 cli.py reconstruir-costes
+
+Salvo ``init``, las órdenes necesitan una BD ya creada y al día; ``init`` la
+crea o aplica las migraciones pendientes. Devuelven 0 si todo fue bien y 1 si
+hubo errores, que se escriben en la salida de errores.
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+
+import consultas
+import exportacion
+import importacion
+import informes
+from base_datos import (DB_PATH, MIGRACIONES, TABLAS, conectar, formatear_fecha,
+                        inicializar_base_datos, recalcular_ritmos, reconstruir_costes,
+                        version_esquema)
+
+
+class ErrorOrden(Exception):
+    """Error que se muestra tal cual al usuario, sin traza."""
+
+
+def _abrir(solo_lectura=False):
+    """Conexión a la BD, comprobando que existe y que no le faltan migraciones."""
+    if not os.path.exists(DB_PATH):
+        raise ErrorOrden(f"No existe la base de datos {DB_PATH}; créala con 'python3 cli.py init'.")
+    conn = conectar(solo_lectura=solo_lectura)
+    if version_esquema(conn) < len(MIGRACIONES):
+        conn.close()
+        raise ErrorOrden("La base de datos tiene migraciones pendientes; aplícalas con 'python3 cli.py init'.")
+    return conn
+
+
+def _tabla(nombre):
+    for tabla in TABLAS:
+        if tabla.lower() == nombre.lower():
+            return tabla
+    raise ErrorOrden(f"Tabla desconocida: {nombre}. Tablas: {', '.join(TABLAS)}.")
+
+
+# Órdenes
+
+def orden_init(args):
+    inicializar_base_datos()
+
+
+def orden_vencimientos(args):
+    conn = _abrir(solo_lectura=True)
+    filas = consultas.vencimientos(conn, args.dias, args.km)
+    conn.close()
+
+    escritor = csv.writer(sys.stdout, delimiter="\t", lineterminator="\n")
+    escritor.writerow(("matricula", "componente", "ultimo_cambio", "km", "prox_km", "km_restantes",
+                       "llega_a_los_km", "prox_fecha", "dias_restantes", "vencido"))
+    for v in filas:
+        escritor.writerow((
+            v["matricula"], v["tipo_componente"], formatear_fecha(v["fecha"]), v["km"],
+            v["prox_km"] if v["prox_km"] is not None else "-",
+            v["km_restantes"] if v["km_restantes"] is not None else "-",
+            formatear_fecha(v["fecha_estimada"]), formatear_fecha(v["prox_fecha"]),
+            v["dias_restantes"] if v["dias_restantes"] is not None else "-",
+            "sí" if v["vencido"] else "no",
+        ))
+
+
+def orden_pdf(args):
+    if bool(args.matriculas) == args.todos:
+        raise ErrorOrden("Indica una o más matrículas o --todos.")
+    conn = _abrir(solo_lectura=True)
+    matriculas = args.matriculas or [f["matricula"] for f in conn.execute("SELECT matricula FROM Coche ORDER BY matricula")]
+    conn.close()
+
+    def al_avanzar(hechos, total, matricula, error):
+        if error is None:
+            print(os.path.join(args.destino, informes.nombre_informe(matricula)), flush=True)
+        else:
+            print(f"[{hechos}/{total}] Error en el informe de {matricula}: {error}", file=sys.stderr, flush=True)
+
+    try:
+        resultado = informes.generar_informes(matriculas, args.destino, args.procesos, args.rehacer, al_avanzar)
+    except KeyboardInterrupt:
+        raise ErrorOrden("Cancelado; repite la orden para generar los informes que faltan.")
+    except OSError as e:
+        raise ErrorOrden(f"No se pudieron generar los informes: {e}")
+    if resultado["omitidos"]:
+        print(f"{resultado['omitidos']} informes ya estaban en {args.destino} (--rehacer para volver a generarlos).",
+              file=sys.stderr)
+    if resultado["fallidos"]:
+        raise ErrorOrden(f"{len(resultado['fallidos'])} de {len(matriculas)} informes no se pudieron generar.")
+
+
+def orden_exportar(args):
+    conn = _abrir(solo_lectura=True)
+    try:
+        if args.tabla.lower() == "todas":
+            if args.fichero or args.matricula or args.desde or args.hasta:
+                raise ErrorOrden("'exportar todas' solo admite --destino, --formato y --gzip.")
+            for ruta, filas in exportacion.exportar_todo(conn, args.destino, args.formato or "csv", args.gzip).items():
+                print(f"{ruta}\t{filas}")
+        else:
+            filas = exportacion.exportar_tabla(conn, _tabla(args.tabla), args.fichero, args.formato,
+                                               args.gzip or None, args.matricula, args.desde, args.hasta)
+            if args.fichero not in (None, "-"):
+                print(f"{filas} filas exportadas a {args.fichero}.")
+    except (OSError, ValueError) as e:
+        raise ErrorOrden(f"No se pudo exportar: {e}")
+    finally:
+        conn.close()
+
+
+def orden_importar(args):
+    tabla = _tabla(args.tabla)
+    conn = _abrir()
+    try:
+        resultado = importacion.importar_csv(conn, tabla, args.fichero, args.rechazos)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        raise ErrorOrden(f"No se importó nada: {e}")
+    finally:
+        conn.close()
+    print(f"{resultado['importadas']} filas importadas en {tabla}.")
+    if resultado["rechazadas"]:
+        print(f"{resultado['rechazadas']} filas rechazadas; el motivo de cada una está en {resultado['rechazos']}.",
+              file=sys.stderr)
+
+
+def orden_reconstruir_costes(args):
+    conn = _abrir()
+    with conn:
+        reconstruir_costes(conn)
+    conn.close()
+    print("Costes agregados reconstruidos.")
+
+
+def orden_recalcular_ritmos(args):
+    conn = _abrir()
+    with conn:
+        recalcular_ritmos(conn, todos=True)
+    conn.close()
+    print("Ritmos de uso recalculados.")
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="Fleet Plus sin interfaz gráfica.")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+
+    orden = ordenes.add_parser("init", help="crea la BD o aplica las migraciones pendientes")
+    orden.set_defaults(funcion=orden_init)
+
+    orden = ordenes.add_parser("vencimientos", help="componentes de la flota que vencen pronto (TSV)")
+    orden.add_argument("--dias", type=int, default=30)
+    orden.add_argument("--km", type=int, default=2000)
+    orden.set_defaults(funcion=orden_vencimientos)
+
+    orden = ordenes.add_parser("pdf", help="informe PDF de uno o varios vehículos")
+    orden.add_argument("matriculas", nargs="*")
+    orden.add_argument("--todos", action="store_true", help="todos los vehículos")
+    orden.add_argument("--destino", default=".", help="carpeta de los PDF (por defecto la actual)")
+    orden.add_argument("--procesos", type=int, help="informes en paralelo (por defecto, uno por núcleo)")
+    orden.add_argument("--rehacer", action="store_true", help="regenera también los que ya están en --destino")
+    orden.set_defaults(funcion=orden_pdf)
+
+    orden = ordenes.add_parser("exportar", help="vuelca una tabla, o todas, a CSV o NDJSON")
+    orden.add_argument("tabla", help=", ".join(TABLAS) + " o 'todas'")
+    orden.add_argument("fichero", nargs="?", help="por defecto, la salida estándar; el formato sale de la extensión")
+    orden.add_argument("--formato", choices=exportacion.FORMATOS)
+    orden.add_argument("--gzip", action="store_true", help="comprime con gzip (implícito con la extensión .gz)")
+    orden.add_argument("--matricula", help="solo las filas de un vehículo")
+    orden.add_argument("--desde", help="solo las filas de esta fecha en adelante")
+    orden.add_argument("--hasta", help="solo las filas hasta esta fecha, incluida")
+    orden.add_argument("--destino", default=".", help="carpeta de 'exportar todas' (por defecto la actual)")
+    orden.set_defaults(funcion=orden_exportar)
+
+    orden = ordenes.add_parser("importar", help="añade a una tabla las filas de un CSV con cabecera")
+    orden.add_argument("tabla", help=", ".join(TABLAS))
+    orden.add_argument("fichero")
+    orden.add_argument("--rechazos", help="CSV de filas rechazadas (por defecto, g.rechazos.csv para g.csv)")
+    orden.set_defaults(funcion=orden_importar)
+
+    orden = ordenes.add_parser("reconstruir-costes", help="recalcula las tablas de costes agregados")
+    orden.set_defaults(funcion=orden_reconstruir_costes)
+
+    orden = ordenes.add_parser("recalcular-ritmos", help="recalcula los km/día de toda la flota")
+    orden.set_defaults(funcion=orden_recalcular_ritmos)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    try:
+        args.funcion(args)
+    except ErrorOrden as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""Consultas de lectura de Fleet Plus.
+
+Funciones que solo reciben una conexión y devuelven filas: no tocan la interfaz,
+así que pueden ejecutarse en los hilos del ejecutor de consultas, cada uno con su
+propia conexión.
+"""
+from base_datos import CLAVE_COCHE, FECHA_ESTIMADA, PROXIMA_FECHA, PROXIMO_KM
+
+
+def buscar_coches(conn, texto, limite=15):
+    """Vehículos cuya matrícula, marca, modelo o marca+modelo empieza por ``texto``.
+
+    Es un único rango sobre la clave de CocheIndice, normalizada igual que el
+    texto (sin espacios ni guiones y en minúsculas). Sin texto devuelve las
+    primeras matrículas.
+    """
+    clave = CLAVE_COCHE.format(":texto")
+    if not texto.strip():
+        return conn.execute(
+            "SELECT matricula, marca, modelo FROM Coche ORDER BY matricula LIMIT ?", (limite,)
+        ).fetchall()
+    return conn.execute(f"""
+        SELECT matricula, marca, modelo
+        FROM Coche
+        WHERE matricula IN (
+            SELECT DISTINCT matricula FROM CocheIndice
+            WHERE clave >= {clave} AND clave < {clave} || char(1114111)
+            LIMIT :limite
+        )
+        ORDER BY matricula
+    """, {"texto": texto, "limite": limite}).fetchall()
+
+
+def mantenimientos_coche(conn, matricula):
+    """Datos básicos del coche y sus mantenimientos, ordenados por km."""
+    coche = conn.execute(
+        "SELECT km_actuales, fecha_matriculacion FROM Coche WHERE matricula = ?", (matricula,)
+    ).fetchone()
+
+    return {"coche": coche, "mantenimientos": recorrer_mantenimientos(conn, matricula).fetchall()}
+
+
+def recorrer_mantenimientos(conn, matricula):
+    """Cursor sobre los mantenimientos del coche, ordenados por km, para leerlos por bloques."""
+    return conn.execute(f"""
+        SELECT M.fecha, M.km, M.descripcion,
+            T.nombre AS tipo_componente,
+            P.marca, P.modelo, P.tipo,
+            {PROXIMO_KM} AS prox_km,
+            {PROXIMA_FECHA} AS prox_fecha
+        FROM Mantenimiento M
+        JOIN Producto P ON M.id_producto = P.id_producto
+        JOIN TipoComponente T ON P.id_tipo = T.id_tipo
+        WHERE M.matricula = ?
+        ORDER BY M.km
+    """, (matricula,))
+
+
+def vencimientos(conn, dias=30, km=2000):
+    """Componentes de toda la flota cuyo próximo cambio vence en ``dias`` días o ``km`` km, o ya ha vencido.
+
+    Lee la tabla precalculada Vencimiento por sus índices de fecha y km
+    restantes. Primero lo ya vencido y luego por fecha y km restantes.
+    ``fecha_estimada`` es cuándo se llegará a ``prox_km`` al ritmo de uso del vehículo.
+    """
+    return conn.execute(f"""
+        SELECT V.matricula, C.marca, C.modelo, T.nombre AS tipo_componente,
+            V.fecha, V.km, V.prox_km, V.prox_fecha, V.km_restantes,
+            {FECHA_ESTIMADA} AS fecha_estimada,
+            CAST(julianday(V.prox_fecha) - julianday('now', 'localtime', 'start of day') AS INTEGER) AS dias_restantes,
+            coalesce(V.prox_fecha <= date('now', 'localtime') OR V.km_restantes <= 0, 0) AS vencido
+        FROM Vencimiento V
+        JOIN Coche C ON C.matricula = V.matricula
+        JOIN TipoComponente T ON T.id_tipo = V.id_tipo
+        LEFT JOIN RitmoKm R ON R.matricula = V.matricula
+        WHERE V.prox_fecha <= date('now', 'localtime', '+' || :dias || ' days')
+           OR V.km_restantes <= :km
+        ORDER BY vencido DESC, coalesce(V.prox_fecha, '9999-12-31'), V.km_restantes, V.matricula
+    """, {"dias": dias, "km": km}).fetchall()
+
+
+def vencimientos_coche(conn, matricula):
+    """Próximo cambio de cada tipo de componente del coche (filas de Vencimiento)."""
+    return conn.execute(f"""
+        SELECT T.nombre AS tipo_componente, V.prox_km, V.prox_fecha, V.km_restantes,
+            {FECHA_ESTIMADA} AS fecha_estimada
+        FROM Vencimiento V
+        JOIN TipoComponente T ON T.id_tipo = V.id_tipo
+        LEFT JOIN RitmoKm R ON R.matricula = V.matricula
+        WHERE V.matricula = ?
+    """, (matricula,)).fetchall()
+
+
+def lecturas_km(conn, matricula):
+    """Histórico de km del coche y su ritmo de uso estimado (``None`` si no hay bastantes lecturas)."""
+    lecturas = conn.execute(
+        "SELECT fecha, km FROM LecturaKm WHERE matricula = ? ORDER BY fecha", (matricula,)
+    ).fetchall()
+    ritmo = conn.execute("SELECT km_dia, lecturas, fecha, km FROM RitmoKm WHERE matricula = ?", (matricula,)).fetchone()
+    return {"lecturas": lecturas, "ritmo": ritmo}
+
+
+def obligaciones_coche(conn, matricula):
+    """Obligaciones del coche ordenadas por fecha de vencimiento."""
+    return conn.execute("""
+        SELECT tipo, descripcion, fecha_inicio, fecha_vencimiento
+        FROM Obligaciones
+        WHERE matricula = ?
+        ORDER BY fecha_vencimiento ASC
+    """, (matricula,)).fetchall()
+
+
+def gastos_coche(conn, matricula):
+    """Gastos del coche, del más reciente al más antiguo."""
+    return conn.execute("""
+        SELECT fecha, categoria, concepto, importe, observaciones
+        FROM Gasto
+        WHERE matricula = ?
+        ORDER BY fecha DESC
+    """, (matricula,)).fetchall()
+
+
+def facturas_coche(conn, matricula):
+    """Facturas asociadas al coche, de la más reciente a la más antigua."""
+    return recorrer_facturas(conn, matricula).fetchall()
+
+
+def recorrer_facturas(conn, matricula):
+    """Cursor sobre las facturas del coche, de la más reciente a la más antigua."""
+    return conn.execute("""
+        SELECT
+            f.num_factura,
+            p.nombre AS proveedor,
+            f.fecha_emision,
+            f.importe_total
+        FROM Factura f
+        JOIN Proveedor p ON f.id_proveedor = p.id_proveedor
+        WHERE f.matricula = ?
+        ORDER BY f.fecha_emision DESC
+    """, (matricula,))
+
+
+# Costes agregados (tablas Coste*, mantenidas por triggers; importes en céntimos)
+
+def costes_coche(conn, matricula):
+    """Total y número de gastos y de facturas del coche, en euros."""
+    fila = conn.execute("""
+        SELECT gastos / 100.0 AS gastos, num_gastos, facturas / 100.0 AS facturas, num_facturas
+        FROM CosteVehiculo WHERE matricula = ?
+    """, (matricula,)).fetchone()
+    return fila or {"gastos": 0.0, "num_gastos": 0, "facturas": 0.0, "num_facturas": 0}
+
+
+def costes_flota(conn, mes=None):
+    """Totales de gastos y facturas de toda la flota; con ``mes`` ('AAAA-MM'), solo de ese mes."""
+    filtro, params = ("WHERE mes = ?", (mes,)) if mes else ("", ())
+    return conn.execute(f"""
+        SELECT
+            (SELECT coalesce(sum(importe), 0) FROM CosteCategoriaMes {filtro}) / 100.0 AS gastos,
+            (SELECT coalesce(sum(importe), 0) FROM CosteProveedorMes {filtro}) / 100.0 AS facturas
+    """, params * 2).fetchone()
+
+
+def gastos_por_categoria_mes(conn, matricula=None, desde=None, hasta=None):
+    """Gastos agrupados por categoría y mes, de un coche o de toda la flota, entre los meses ``desde`` y ``hasta``."""
+    condiciones, params = [], []
+    for condicion, valor in (("matricula = ?", matricula), ("mes >= ?", desde), ("mes <= ?", hasta)):
+        if valor:
+            condiciones.append(condicion)
+            params.append(valor)
+    donde = "WHERE " + " AND ".join(condiciones) if condiciones else ""
+    return conn.execute(f"""
+        SELECT mes, categoria, sum(importe) / 100.0 AS importe, sum(num) AS num
+        FROM CosteCategoriaMes {donde}
+        GROUP BY mes, categoria
+        ORDER BY mes DESC, categoria
+    """, params).fetchall()
+
+
+def facturas_por_proveedor_mes(conn, desde=None, hasta=None):
+    """Facturación de cada proveedor por mes entre los meses ``desde`` y ``hasta``."""
+    return conn.execute("""
+        SELECT C.mes, P.nombre AS proveedor, C.importe / 100.0 AS importe, C.num
+        FROM CosteProveedorMes C
+        JOIN Proveedor P ON P.id_proveedor = C.id_proveedor
+        WHERE C.mes >= coalesce(?, '') AND C.mes <= coalesce(?, '9999-99')
+        ORDER BY C.mes DESC, C.importe DESC
+    """, (desde, hasta)).fetchall()
+
+
+# Listados globales. Se leen por páginas con paginación por clave (keyset) sobre
+# (fecha, id), que recorre el índice de fecha sin OFFSET ni ordenación temporal.
+# Cada uno tiene además su variante de una sola fila por clave primaria, con las
+# mismas columnas, para refrescar solo la fila editada.
+
+TAMANO_PAGINA = 200
+
+_SELECT_FACTURAS = """
+    SELECT f.id_factura, p.nombre AS proveedor, f.num_factura, f.fecha_emision, f.importe_total, f.matricula
+    FROM Factura f
+    JOIN Proveedor p ON f.id_proveedor = p.id_proveedor
+"""
+
+_SELECT_MANTENIMIENTOS = """
+    SELECT M.id_mantenimiento, M.matricula, M.fecha, M.km, M.descripcion,
+        T.nombre AS tipo_componente, P.marca, P.modelo, P.tipo
+    FROM Mantenimiento M
+    JOIN Producto P ON M.id_producto = P.id_producto
+    JOIN TipoComponente T ON P.id_tipo = T.id_tipo
+"""
+
+_SELECT_OBLIGACIONES = """
+    SELECT O.id_obligacion, O.matricula, O.tipo, O.descripcion, O.fecha_inicio, O.fecha_vencimiento, O.estado
+    FROM Obligaciones O
+"""
+
+_SELECT_GASTOS = """
+    SELECT g.id_gasto, g.matricula, f.num_factura AS factura, g.fecha, g.categoria, g.concepto, g.importe
+    FROM Gasto g
+    LEFT JOIN Factura f ON g.id_factura = f.id_factura
+"""
+
+
+def _pagina(conn, select, col_fecha, col_id, despues, limite, filtro=None, params=()):
+    """Página ordenada por (fecha DESC, id DESC) que empieza justo después de la clave ``despues``.
+
+    ``despues`` es la tupla (fecha, id) de la última fila ya cargada, o ``None`` para
+    la primera página. Como en ``ORDER BY ... DESC``, las filas sin fecha van al
+    final; se leen aparte para que la condición por clave siga usando el índice.
+    ``filtro`` es una condición SQL adicional con sus parámetros ``params``.
+    """
+    def donde(condicion):
+        return select + (f" WHERE {filtro} AND " if filtro else " WHERE ") + condicion
+
+    orden = f" ORDER BY {col_fecha} DESC, {col_id} DESC LIMIT ?"
+    if despues is None:
+        filas = conn.execute(donde(f"{col_fecha} IS NOT NULL") + orden, (*params, limite)).fetchall()
+    elif despues[0] is not None:
+        filas = conn.execute(donde(f"({col_fecha}, {col_id}) < (?, ?)") + orden,
+                             (*params, *despues, limite)).fetchall()
+    else:
+        filas = []
+
+    if len(filas) < limite:
+        if despues is not None and despues[0] is None:
+            filas += conn.execute(donde(f"{col_fecha} IS NULL AND {col_id} < ?") + orden,
+                                  (*params, despues[1], limite - len(filas))).fetchall()
+        else:
+            filas += conn.execute(donde(f"{col_fecha} IS NULL") + orden,
+                                  (*params, limite - len(filas))).fetchall()
+    return filas
+
+
+def pagina_facturas(conn, despues=None, limite=TAMANO_PAGINA, matricula=None):
+    """Página de facturas (de un vehículo o todas); ``despues`` es (fecha_emision, id_factura) de la última fila cargada."""
+    return _pagina(conn, _SELECT_FACTURAS, "f.fecha_emision", "f.id_factura", despues, limite,
+                   *(("f.matricula = ?", (matricula,)) if matricula else ()))
+
+
+def total_facturas(conn):
+    return conn.execute("SELECT count(*) FROM Factura").fetchone()[0]
+
+
+def factura(conn, id_factura):
+    """Una fila de la tabla de facturas."""
+    return conn.execute(_SELECT_FACTURAS + " WHERE f.id_factura = ?", (id_factura,)).fetchone()
+
+
+def pagina_gastos(conn, despues=None, limite=TAMANO_PAGINA, matricula=None):
+    """Página de gastos (de un vehículo o todos); ``despues`` es (fecha, id_gasto) de la última fila cargada."""
+    return _pagina(conn, _SELECT_GASTOS, "g.fecha", "g.id_gasto", despues, limite,
+                   *(("g.matricula = ?", (matricula,)) if matricula else ()))
+
+
+def pagina_mantenimientos(conn, despues=None, limite=TAMANO_PAGINA, matricula=None):
+    """Página de mantenimientos (de un vehículo o todos); ``despues`` es (fecha, id_mantenimiento)."""
+    return _pagina(conn, _SELECT_MANTENIMIENTOS, "M.fecha", "M.id_mantenimiento", despues, limite,
+                   *(("M.matricula = ?", (matricula,)) if matricula else ()))
+
+
+def pagina_obligaciones(conn, despues=None, limite=TAMANO_PAGINA, matricula=None):
+    """Página de obligaciones, de la que vence más tarde a la que antes; ``despues`` es (fecha_vencimiento, id_obligacion)."""
+    return _pagina(conn, _SELECT_OBLIGACIONES, "O.fecha_vencimiento", "O.id_obligacion", despues, limite,
+                   *(("O.matricula = ?", (matricula,)) if matricula else ()))
+
+
+def coche(conn, matricula):
+    """Datos de un vehículo con su ritmo de uso, o ``None`` si no existe."""
+    return conn.execute("""
+        SELECT C.matricula, C.marca, C.modelo, C.km_actuales, C.fecha_matriculacion, R.km_dia
+        FROM Coche C
+        LEFT JOIN RitmoKm R ON R.matricula = C.matricula
+        WHERE C.matricula = ?
+    """, (matricula,)).fetchone()
+
+
+def pagina_coches(conn, despues=None, limite=TAMANO_PAGINA):
+    """Página de vehículos por matrícula, con su ritmo de uso; ``despues`` es la última matrícula cargada."""
+    return conn.execute("""
+        SELECT C.matricula, C.marca, C.modelo, C.km_actuales, C.fecha_matriculacion, R.km_dia
+        FROM Coche C
+        LEFT JOIN RitmoKm R ON R.matricula = C.matricula
+        WHERE C.matricula > coalesce(?, '')
+        ORDER BY C.matricula
+        LIMIT ?
+    """, (despues, limite)).fetchall()
+
+
+def total_gastos(conn):
+    return conn.execute("SELECT count(*) FROM Gasto").fetchone()[0]
+
+
+def gasto(conn, id_gasto):
+    """Una fila de la tabla de gastos."""
+    return conn.execute(_SELECT_GASTOS + " WHERE g.id_gasto = ?", (id_gasto,)).fetchone()
+
+
+def tabla_proveedores(conn):
+    """Todos los proveedores para la pestaña Proveedores."""
+    return conn.execute("SELECT * FROM Proveedor ORDER BY id_proveedor").fetchall()
+
+
+def proveedor(conn, id_proveedor):
+    """Una fila de la tabla de proveedores."""
+    return conn.execute("SELECT * FROM Proveedor WHERE id_proveedor = ?", (id_proveedor,)).fetchone()
+
+
+# Búsqueda de texto completo sobre la tabla FTS5 Busqueda (ver base_datos.FUENTES_BUSQUEDA)
+
+def expresion_busqueda(texto):
+    """Convierte lo que escribe el usuario en una consulta FTS5 segura.
+
+    Todas las palabras deben aparecer.  La última se busca como prefijo, porque
+    se busca mientras se escribe (salvo que el texto acabe en espacio); las
+    anteriores ya están completas y se buscan exactas, que es mucho más barato.
+    Las comillas y operadores de FTS5 que escriba el usuario se tratan como
+    texto normal.
+    """
+    terminos = [t.replace('"', "") for t in texto.split()]
+    terminos = [f'"{t}"' for t in terminos if t]
+    if terminos and not texto[-1].isspace():
+        terminos[-1] += "*"
+    return " ".join(terminos)
+
+
+# Con más coincidencias que esto no se ordena por relevancia (ver buscar)
+LIMITE_RELEVANCIA = 1000
+
+
+def buscar(conn, texto, desplazamiento=0, limite=50):
+    """Resultados de la búsqueda, por páginas.
+
+    Se ordenan por relevancia (bm25) cuando hay pocas coincidencias.  Puntuar
+    obliga a recorrer todas, así que para términos muy comunes se ordenan de la
+    fila más reciente a la más antigua, que se lee directamente del índice y
+    mantiene la consulta en milisegundos aunque haya millones de filas.
+    """
+    expresion = expresion_busqueda(texto)
+    if not expresion:
+        return []
+    coincidencias = conn.execute(
+        "SELECT count(*) FROM (SELECT 1 FROM Busqueda WHERE Busqueda MATCH ? LIMIT ?)",
+        (expresion, LIMITE_RELEVANCIA + 1)
+    ).fetchone()[0]
+    orden = "rank" if coincidencias <= LIMITE_RELEVANCIA else "rowid DESC"
+    return conn.execute(f"""
+        SELECT tabla, id_fila, matricula,
+            snippet(Busqueda, 0, '«', '»', '…', 12) AS fragmento
+        FROM Busqueda
+        WHERE Busqueda MATCH ?
+        ORDER BY {orden}
+        LIMIT ? OFFSET ?
+    """, (expresion, limite, desplazamiento)).fetchall()
@@ -0,0 +1,194 @@
+"""Ejecutor de consultas en segundo plano para la interfaz.
+
+Las consultas de lectura se ejecutan en hilos de trabajo, cada uno con su propia
+conexión de solo lectura, y el resultado vuelve al hilo de Tk mediante
+``root.after``. Cada tarea lleva una clave (p. ej. ``"gastos_coche"``): enviar
+otra tarea con la misma clave deja obsoleta la anterior, que se interrumpe si ya
+estaba en marcha y cuyo resultado se descarta.
+
+El bucle de recogida de resultados solo está activo mientras hay tareas en
+vuelo, de modo que en reposo no consume CPU.
+
+``TareaLarga`` es para trabajos de minutos (p. ej. los informes de toda la
+flota): van en su propio hilo, informan de su avance y se pueden cancelar.
+"""
+import queue
+import sqlite3
+import threading
+
+from base_datos import conectar
+
+
+class EjecutorConsultas:
+    def __init__(self, root, hilos=2, intervalo_ms=15):
+        self.root = root
+        self.intervalo_ms = intervalo_ms
+
+        self._tareas = queue.Queue()
+        self._resultados = queue.Queue()
+        self._lock = threading.Lock()
+        self._generaciones = {}   # clave -> generación vigente
+        self._en_curso = {}       # clave -> (generación, conexión) de la tarea que se está ejecutando
+        self._en_vuelo = 0        # tareas enviadas cuyo resultado aún no se ha recogido (solo hilo de Tk)
+        self._recogida_programada = False
+
+        self._hilos = [threading.Thread(target=self._trabajar, daemon=True) for _ in range(hilos)]
+        for hilo in self._hilos:
+            hilo.start()
+
+    # API (llamar siempre desde el hilo de Tk)
+
+    def enviar(self, clave, funcion, *args, al_terminar=None, al_fallar=None):
+        """Ejecuta ``funcion(conn, *args)`` en segundo plano.
+
+        ``al_terminar(resultado)`` o ``al_fallar(excepcion)`` se llaman en el hilo de
+        Tk solo si la tarea sigue vigente, es decir, si no se ha enviado otra con la
+        misma clave ni se ha cancelado.
+        """
+        generacion = self._nueva_generacion(clave)
+        self._tareas.put((clave, generacion, funcion, args, al_terminar, al_fallar))
+        self._en_vuelo += 1
+        self._programar_recogida()
+
+    def cancelar(self, clave):
+        """Descarta la tarea pendiente o en curso con esa clave."""
+        self._nueva_generacion(clave)
+
+    def cerrar(self):
+        """Detiene los hilos de trabajo."""
+        for _ in self._hilos:
+            self._tareas.put(None)
+
+    # Internos
+
+    def _nueva_generacion(self, clave):
+        with self._lock:
+            generacion = self._generaciones.get(clave, 0) + 1
+            self._generaciones[clave] = generacion
+            en_curso = self._en_curso.get(clave)
+        if en_curso:
+            # interrupt() es seguro desde otro hilo: corta la consulta obsoleta
+            en_curso[1].interrupt()
+        return generacion
+
+    def _vigente(self, clave, generacion):
+        with self._lock:
+            return self._generaciones.get(clave) == generacion
+
+    def _trabajar(self):
+        conn = conectar(solo_lectura=True, check_same_thread=False)
+        while True:
+            tarea = self._tareas.get()
+            if tarea is None:
+                break
+            clave, generacion, funcion, args, al_terminar, al_fallar = tarea
+
+            resultado = error = None
+            if self._vigente(clave, generacion):
+                with self._lock:
+                    self._en_curso[clave] = (generacion, conn)
+                try:
+                    resultado = self._ejecutar(conn, clave, generacion, funcion, args)
+                except Exception as e:
+                    error = e
+                finally:
+                    with self._lock:
+                        if self._en_curso.get(clave, (None,))[0] == generacion:
+                            del self._en_curso[clave]
+                    if conn.in_transaction:
+                        conn.rollback()
+
+            self._resultados.put((clave, generacion, resultado, error, al_terminar, al_fallar))
+        conn.close()
+
+    def _ejecutar(self, conn, clave, generacion, funcion, args):
+        try:
+            return funcion(conn, *args)
+        except sqlite3.OperationalError as e:
+            # La interrupción iba dirigida a una tarea anterior de esta conexión: se repite
+            if "interrupted" in str(e) and self._vigente(clave, generacion):
+                return funcion(conn, *args)
+            raise
+
+    def _programar_recogida(self):
+        if not self._recogida_programada:
+            self._recogida_programada = True
+            self.root.after(self.intervalo_ms, self._recoger)
+
+    def _recoger(self):
+        self._recogida_programada = False
+        while True:
+            try:
+                clave, generacion, resultado, error, al_terminar, al_fallar = self._resultados.get_nowait()
+            except queue.Empty:
+                break
+            self._en_vuelo -= 1
+            if not self._vigente(clave, generacion):
+                continue
+            if error is not None:
+                if al_fallar:
+                    al_fallar(error)
+                elif not (isinstance(error, sqlite3.OperationalError) and "interrupted" in str(error)):
+                    print(f"Error en consulta '{clave}':", error)
+            elif al_terminar:
+                al_terminar(resultado)
+
+        if self._en_vuelo > 0:
+            self._programar_recogida()
+
+
+class TareaLarga:
+    """Tarea larga en un hilo propio que informa de su avance y se puede cancelar.
+
+    Llama a ``funcion(*args, al_avanzar=..., cancelar=...)``: ``cancelar`` es un
+    ``threading.Event`` que la función debe consultar, y cada llamada a
+    ``al_avanzar(*datos)`` desde el hilo llega a ``al_avanzar(*datos)`` en el
+    hilo de Tk. Al acabar se llama, también en el hilo de Tk,
+    ``al_terminar(resultado)`` o ``al_fallar(excepcion)``.
+
+    A diferencia de ``EjecutorConsultas`` no usa una conexión compartida: la
+    función abre las suyas.
+    """
+
+    def __init__(self, root, funcion, *args, al_avanzar=None, al_terminar=None, al_fallar=None, intervalo_ms=100):
+        self.root = root
+        self.intervalo_ms = intervalo_ms
+        self.al_avanzar = al_avanzar
+        self.al_terminar = al_terminar
+        self.al_fallar = al_fallar
+        self.cancelar = threading.Event()
+
+        self._avances = queue.Queue()
+        self._fin = None
+        self._hilo = threading.Thread(target=self._trabajar, args=(funcion, args), daemon=True)
+        self._hilo.start()
+        self.root.after(self.intervalo_ms, self._recoger)
+
+    def _trabajar(self, funcion, args):
+        try:
+            self._fin = (funcion(*args, al_avanzar=lambda *datos: self._avances.put(datos),
+                                 cancelar=self.cancelar), None)
+        except Exception as e:
+            self._fin = (None, e)
+
+    def _recoger(self):
+        terminada = not self._hilo.is_alive()
+        while True:
+            try:
+                datos = self._avances.get_nowait()
+            except queue.Empty:
+                break
+            if self.al_avanzar:
+                self.al_avanzar(*datos)
+
+        if not terminada:
+            self.root.after(self.intervalo_ms, self._recoger)
+            return
+        resultado, error = self._fin
+        if error is not None:
+            if self.al_fallar:
+                self.al_fallar(error)
+            else:
+                print("Error en tarea en segundo plano:", error)
+        elif self.al_terminar:
+            self.al_terminar(resultado)
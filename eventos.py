@@ -0,0 +1,62 @@
+"""Bus de cambios en memoria para refrescar la interfaz.
+
+Cada escritura publica las tablas que ha modificado (``publicar("Factura")``) y
+cada vista se suscribe a las tablas que muestra, indicando la pestaña en la que
+vive. Una vista afectada se marca como pendiente y solo se refresca cuando su
+pestaña está visible: en el momento si ya lo está, o la próxima vez que el
+usuario la abra. Así no hace falta sondear la pestaña activa, en reposo no se
+consume CPU y no se consulta nada para vistas que nadie está mirando.
+
+Todo se llama desde el hilo de Tk.
+"""
+
+
+class _Suscripcion:
+    __slots__ = ("tablas", "refrescar", "pestana", "pendiente")
+
+    def __init__(self, tablas, refrescar, pestana):
+        self.tablas = frozenset(tablas)
+        self.refrescar = refrescar
+        self.pestana = pestana
+        self.pendiente = False
+
+
+class BusCambios:
+    def __init__(self, pestana_actual):
+        # pestana_actual() devuelve el nombre de la pestaña visible
+        self._pestana_actual = pestana_actual
+        self._suscripciones = []
+
+    def suscribir(self, tablas, refrescar, pestana=None):
+        """Llama a ``refrescar()`` cuando cambie alguna de ``tablas``.
+
+        Con ``pestana`` el refresco espera a que esa pestaña esté visible; sin
+        ella se hace en el momento (para datos que no pertenecen a ninguna).
+        """
+        self._suscripciones.append(_Suscripcion(tablas, refrescar, pestana))
+
+    def publicar(self, *tablas, excepto=()):
+        """Avisa de que ``tablas`` han cambiado.
+
+        ``excepto`` son refrescos que quien escribe ya ha hecho por su cuenta
+        (p. ej. actualizar solo la fila editada) y no deben repetirse.
+        """
+        tablas = set(tablas)
+        for s in self._suscripciones:
+            if s.refrescar not in excepto and not s.tablas.isdisjoint(tablas):
+                s.pendiente = True
+        self._refrescar_pendientes()
+
+    def pestana_mostrada(self, *args):
+        """Refresca lo pendiente de la pestaña que acaba de mostrarse."""
+        self._refrescar_pendientes()
+
+    def _refrescar_pendientes(self):
+        actual = self._pestana_actual()
+        for s in self._suscripciones:
+            if s.pendiente and s.pestana in (None, actual):
+                s.pendiente = False
+                try:
+                    s.refrescar()
+                except Exception as e:
+                    print(f"Error al refrescar {getattr(s.refrescar, '__name__', s.refrescar)}:", e)
@@ -0,0 +1,155 @@
+"""Exportación de tablas a CSV o JSON Lines (NDJSON), opcionalmente comprimidas con gzip.
+
+    exportar_tabla(conn, "Gasto", "gastos.csv.gz", matricula="1234ABC", desde="2024-01-01")
+    exportar_todo(conn, "volcado/", formato="ndjson", comprimir=True)
+
+Las filas se leen del cursor por bloques con ``fetchmany`` y se escriben según
+llegan, así que la memoria no depende del tamaño de la tabla.  El formato y la
+compresión se deducen de la extensión (``.csv``, ``.ndjson``/``.jsonl`` y
+``.gz``) salvo que se indiquen.  En CSV los valores nulos quedan vacíos; en
+NDJSON cada línea es un objeto con los nombres de columna.
+"""
+import csv
+import gzip
+import io
+import os
+import sys
+
+from base_datos import COLUMNAS_FECHA, TABLAS, normalizar_fecha
+
+# Filas por fetchmany
+LOTE = 5000
+
+# Búfer de escritura; con bloques grandes el volcado va al ritmo del disco
+BUFER = 1 << 20
+
+# gzip rápido: con niveles altos la compresión, y no el disco, marca el ritmo
+NIVEL_GZIP = 1
+
+FORMATOS = ("csv", "ndjson")
+
+EXTENSIONES = {"csv": ".csv", "ndjson": ".ndjson"}
+
+# Columna de fecha por la que se filtra un periodo en cada tabla (en Obligaciones, el vencimiento)
+FECHA_PERIODO = {tabla: columnas[-1] for tabla, _, columnas in COLUMNAS_FECHA}
+
+
+def formato_de(ruta):
+    """Formato y compresión que corresponden a la extensión de ``ruta`` (CSV sin comprimir si no la reconoce)."""
+    nombre = ruta.lower()
+    comprimir = nombre.endswith(".gz")
+    if comprimir:
+        nombre = nombre[:-3]
+    return ("ndjson" if nombre.endswith((".ndjson", ".jsonl")) else "csv"), comprimir
+
+
+def _consulta(conn, tabla, formato, matricula=None, desde=None, hasta=None):
+    """SELECT de ``tabla`` con los filtros de vehículo y periodo, y sus parámetros.
+
+    En NDJSON cada línea la construye ya SQLite con json_object, que es varias
+    veces más rápido que pasar cada fila a un diccionario y codificarla en Python.
+    """
+    if tabla not in TABLAS:
+        raise ValueError(f"Tabla desconocida: {tabla}. Tablas: {', '.join(TABLAS)}.")
+    columnas = [f["name"] for f in conn.execute(f"PRAGMA table_info({tabla})")]
+    if formato == "ndjson":
+        seleccion = "json_object(" + ", ".join(f"'{c}', {c}" for c in columnas) + ")"
+    else:
+        seleccion = "*"
+    condiciones, params = [], []
+    if matricula:
+        if "matricula" not in columnas:
+            raise ValueError(f"{tabla} no tiene matrícula por la que filtrar.")
+        condiciones.append("matricula = ?")
+        params.append(matricula)
+    if desde or hasta:
+        if tabla not in FECHA_PERIODO:
+            raise ValueError(f"{tabla} no tiene fecha por la que filtrar.")
+        if desde:
+            condiciones.append(f"{FECHA_PERIODO[tabla]} >= ?")
+            params.append(normalizar_fecha(desde))
+        if hasta:
+            condiciones.append(f"{FECHA_PERIODO[tabla]} <= ?")
+            params.append(normalizar_fecha(hasta))
+    donde = f" WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return f"SELECT {seleccion} FROM {tabla}{donde}", params
+
+
+def _abrir_salida(ruta, comprimir):
+    """Fichero de texto en el que escribir (``None`` o ``"-"`` es la salida estándar)."""
+    if ruta in (None, "-"):
+        if comprimir:
+            binario = gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb", compresslevel=NIVEL_GZIP)
+            return io.TextIOWrapper(binario, encoding="utf-8", newline="")
+        return sys.stdout
+    if comprimir:
+        return gzip.open(ruta, "wt", compresslevel=NIVEL_GZIP, encoding="utf-8", newline="")
+    return open(ruta, "w", newline="", encoding="utf-8", buffering=BUFER)
+
+
+def _escribir(cursor, salida, formato):
+    """Vuelca el cursor en ``salida`` por bloques. Devuelve el número de filas."""
+    total = 0
+    if formato == "csv":
+        escritor = csv.writer(salida, lineterminator="\n")
+        escritor.writerow(d[0] for d in cursor.description)
+        while filas := cursor.fetchmany(LOTE):
+            escritor.writerows(filas)
+            total += len(filas)
+    else:
+        while filas := cursor.fetchmany(LOTE):
+            salida.write("\n".join(linea for (linea,) in filas))
+            salida.write("\n")
+            total += len(filas)
+    return total
+
+
+def exportar_tabla(conn, tabla, ruta=None, formato=None, comprimir=None, matricula=None, desde=None, hasta=None):
+    """Exporta ``tabla`` (o solo las filas de un vehículo o un periodo) a ``ruta``.
+
+    ``ruta`` ``None`` o ``"-"`` escribe en la salida estándar.  ``formato`` es
+    ``"csv"`` o ``"ndjson"``; con ``None``, él y ``comprimir`` se deducen de la
+    extensión.  ``desde`` y ``hasta`` (incluidos) filtran por la fecha de
+    ``FECHA_PERIODO``.  Devuelve el número de filas exportadas.
+    """
+    formato_ruta, comprimir_ruta = formato_de(ruta or "")
+    formato = formato or formato_ruta
+    comprimir = comprimir_ruta if comprimir is None else comprimir
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato}. Formatos: {', '.join(FORMATOS)}.")
+
+    sql, params = _consulta(conn, tabla, formato, matricula, desde, hasta)
+    # Tuplas en vez de sqlite3.Row: el volcado no necesita acceder por nombre
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+
+    salida = _abrir_salida(ruta, comprimir)
+    try:
+        return _escribir(cursor, salida, formato)
+    finally:
+        cursor.close()
+        if salida is sys.stdout:
+            salida.flush()
+        else:
+            salida.close()
+
+
+def exportar_todo(conn, carpeta, formato="csv", comprimir=False):
+    """Exporta cada tabla de datos a ``carpeta/<Tabla>.<ext>``, todas del mismo instante.
+
+    Las tablas se leen dentro de una única transacción de lectura, así que el
+    volcado es coherente aunque otra conexión escriba mientras tanto.  Devuelve
+    un diccionario {ruta: filas}.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    extension = EXTENSIONES[formato] + (".gz" if comprimir else "")
+    resultado = {}
+    conn.execute("BEGIN")
+    try:
+        for tabla in TABLAS:
+            ruta = os.path.join(carpeta, tabla + extension)
+            resultado[ruta] = exportar_tabla(conn, tabla, ruta, formato, comprimir)
+    finally:
+        conn.rollback()
+    return resultado
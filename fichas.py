@@ -0,0 +1,113 @@
+"""Fichas de vehículo: todo lo que muestra la pestaña Vehículos de un coche.
+
+``leer_ficha`` lee en una sola transacción de lectura los datos del coche, sus
+mantenimientos, próximos cambios, obligaciones, gastos y facturas, y los deja
+listos para pintar: fechas formateadas y filas como tuplas de valores visibles.
+Los totales salen de CosteVehiculo, ya sumados por los triggers. Se ejecuta en
+los hilos del ejecutor de consultas, así que ese trabajo tampoco ocupa el hilo
+de Tk.
+
+``CacheFichas`` guarda las últimas fichas leídas para que volver a un coche ya
+visto no cueste ninguna consulta. Se vacía entera cuando cambia cualquiera de
+las tablas de ``TABLAS_FICHA``.
+"""
+from collections import OrderedDict
+
+import consultas
+from base_datos import formatear_fecha
+
+# Tablas de las que sale algún dato de la ficha
+TABLAS_FICHA = {"Coche", "Mantenimiento", "Producto", "TipoComponente", "Obligaciones", "Gasto", "Factura", "Proveedor"}
+
+
+def leer_ficha(conn, matricula):
+    """Ficha del coche ``matricula``; todas las lecturas ven el mismo estado de la BD."""
+    conn.execute("BEGIN")
+    try:
+        datos = consultas.mantenimientos_coche(conn, matricula)
+        vencimientos = consultas.vencimientos_coche(conn, matricula)
+        obligaciones = consultas.obligaciones_coche(conn, matricula)
+        gastos = consultas.gastos_coche(conn, matricula)
+        facturas = consultas.facturas_coche(conn, matricula)
+        costes = consultas.costes_coche(conn, matricula)
+    finally:
+        conn.rollback()
+
+    coche = datos["coche"]
+    mantenimientos = [(
+        f"{m['tipo_componente']} - {m['marca']} {m['modelo']} ({m['tipo'] or '—'})",
+        formatear_fecha(m["fecha"]),
+        m["km"],
+        m["prox_km"] or "-",
+        formatear_fecha(m["prox_fecha"]),
+        m["descripcion"] or "-"
+    ) for m in datos["mantenimientos"]]
+
+    # Próximo cambio por km y por fecha entre todos los componentes del coche
+    por_km = min((v for v in vencimientos if v["km_restantes"] is not None),
+                 key=lambda v: v["km_restantes"], default=None)
+    por_fecha = min((v for v in vencimientos if v["prox_fecha"]),
+                    key=lambda v: v["prox_fecha"], default=None)
+
+    return {
+        "matricula": matricula,
+        "km_actuales": (coche["km_actuales"] or 0) if coche else 0,
+        "fecha_matriculacion": formatear_fecha(coche["fecha_matriculacion"]) if coche else "—",
+        "mantenimientos": mantenimientos,
+        "proximo_km": (por_km["tipo_componente"], por_km["km_restantes"],
+                       formatear_fecha(por_km["fecha_estimada"]) if por_km["fecha_estimada"] else None) if por_km else None,
+        "proxima_fecha": (por_fecha["tipo_componente"], formatear_fecha(por_fecha["prox_fecha"])) if por_fecha else None,
+        "obligaciones": [(
+            o["tipo"],
+            o["descripcion"] or "-",
+            formatear_fecha(o["fecha_inicio"]),
+            formatear_fecha(o["fecha_vencimiento"])
+        ) for o in obligaciones],
+        "gastos": [(
+            formatear_fecha(g["fecha"]),
+            g["categoria"],
+            g["concepto"],
+            f"{float(g['importe'] or 0):.2f} €",
+            g["observaciones"]
+        ) for g in gastos],
+        "total_gastos": costes["gastos"],
+        "facturas": [(
+            f["num_factura"],
+            f["proveedor"],
+            formatear_fecha(f["fecha_emision"]),
+            f"{float(f['importe_total'] or 0):.2f} €"
+        ) for f in facturas],
+        "total_facturas": costes["facturas"],
+    }
+
+
+class CacheFichas:
+    """Últimas ``capacidad`` fichas leídas, de la menos a la más recientemente usada."""
+
+    def __init__(self, capacidad=16):
+        self.capacidad = capacidad
+        self._fichas = OrderedDict()
+        # Cambia al vaciar: una ficha leída antes de vaciar ya no se guarda
+        self.version = 0
+
+    def obtener(self, matricula):
+        ficha = self._fichas.get(matricula)
+        if ficha is not None:
+            self._fichas.move_to_end(matricula)
+        return ficha
+
+    def __contains__(self, matricula):
+        return matricula in self._fichas
+
+    def guardar(self, ficha, version):
+        """Guarda la ficha si se empezó a leer con la ``version`` vigente."""
+        if version != self.version:
+            return
+        self._fichas[ficha["matricula"]] = ficha
+        self._fichas.move_to_end(ficha["matricula"])
+        while len(self._fichas) > self.capacidad:
+            self._fichas.popitem(last=False)
+
+    def vaciar(self):
+        self._fichas.clear()
+        self.version += 1
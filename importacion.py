@@ -0,0 +1,382 @@
+"""Importación masiva de CSV para dar de alta una flota de golpe.
+
+    importar_csv(conn, "Gasto", "gastos.csv")
+
+El fichero se lee fila a fila, así que su tamaño no importa.  Cada fila se
+valida y se normaliza (fechas, matrículas, importes con coma decimal) y las
+referencias se resuelven con mapas en memoria cargados una sola vez: matrícula,
+nombre de proveedor → ``id_proveedor``, proveedor y número de factura →
+``id_factura`` y marca/modelo/tipo → ``id_producto``.  Las filas válidas se
+insertan por lotes con ``executemany`` en una única transacción; las que no,
+van a un fichero de rechazos con el número de línea y el motivo, y no impiden
+importar las demás.
+
+Las cabeceras no distinguen mayúsculas ni tildes (``Matrícula`` vale por
+``matricula``) y el separador puede ser ``,`` o ``;``.  Columnas aceptadas:
+
+- Coche: matricula, marca, modelo, km_actuales, fecha_matriculacion
+- Factura: proveedor (nombre) o id_proveedor, num_factura, fecha_emision, importe_total, matricula
+- Gasto: matricula, fecha, concepto, importe, categoria, observaciones y, si va
+  asociado a una factura, id_factura o proveedor + num_factura
+- Mantenimiento: matricula, fecha, km, descripcion y el producto como id_producto o marca + modelo + tipo
+
+El resto de tablas se importan columna a columna, con las mismas comprobaciones
+de fechas, matrículas y campos obligatorios.
+"""
+import csv
+import os
+import re
+import sqlite3
+import unicodedata
+from contextlib import nullcontext
+from functools import cached_property, lru_cache
+
+from base_datos import CLAVES_PRIMARIAS, COLUMNAS_FECHA, carga_masiva, normalizar_fecha, recalcular_ritmos
+
+# Filas por executemany
+LOTE = 10_000
+
+_FECHAS = {tabla: columnas for tabla, _, columnas in COLUMNAS_FECHA}
+
+_MILES = re.compile(r"\d{1,3}(\.\d{3})+")
+
+# En un fichero grande las mismas fechas se repiten miles de veces y strptime es lo más lento de validar
+_fecha = lru_cache(maxsize=8192)(normalizar_fecha)
+
+
+class ErrorImportacion(ValueError):
+    """El fichero no se puede importar (por ejemplo, le faltan columnas obligatorias)."""
+
+
+def clave_matricula(matricula):
+    """Forma de comparar matrículas: sin espacios ni guiones y en minúsculas, como CLAVE_COCHE."""
+    return matricula.replace(" ", "").replace("-", "").lower()
+
+
+def normalizar_matricula(texto):
+    """Matrícula tal como se guarda al importar: en mayúsculas y sin espacios ni guiones."""
+    matricula = clave_matricula(texto or "").upper()
+    if not matricula:
+        raise ValueError("Falta la matrícula.")
+    return matricula
+
+
+def _nombre_columna(texto):
+    sin_tildes = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    return sin_tildes.strip().lower().replace(" ", "_")
+
+
+def _clave_texto(*textos):
+    return tuple((t or "").strip().lower() for t in textos)
+
+
+def _numero(texto, nombre, entero=False):
+    """Número escrito a la española o a la inglesa ('1.234,5', '1234.5'); ``None`` si está vacío.
+
+    En los enteros (km) un punto seguido de tres cifras es separador de miles: '120.500'.
+    """
+    if not texto:
+        return None
+    if "," in texto or entero and _MILES.fullmatch(texto):
+        texto = texto.replace(".", "").replace(",", ".")
+    try:
+        return int(texto) if entero else float(texto)
+    except ValueError:
+        raise ValueError(f"{nombre} no válido: '{texto}'.")
+
+
+def _obligatorio(fila, columna):
+    if not fila.get(columna):
+        raise ValueError(f"Falta {columna}.")
+    return fila[columna]
+
+
+class Mapas:
+    """Claves de las tablas referenciadas, cargadas la primera vez que se necesitan.
+
+    Un nombre que corresponde a varias filas (dos proveedores con el mismo nombre)
+    se guarda como ``None`` para rechazar las filas que lo usen en vez de adivinar.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @staticmethod
+    def _unicos(pares):
+        mapa = {}
+        for clave, valor in pares:
+            mapa[clave] = None if clave in mapa else valor
+        return mapa
+
+    @cached_property
+    def coches(self):
+        return {clave_matricula(m): m for (m,) in self.conn.execute("SELECT matricula FROM Coche")}
+
+    @cached_property
+    def proveedores(self):
+        return self._unicos((_clave_texto(n), i) for i, n in self.conn.execute("SELECT id_proveedor, nombre FROM Proveedor"))
+
+    @cached_property
+    def id_proveedores(self):
+        return {i for (i,) in self.conn.execute("SELECT id_proveedor FROM Proveedor")}
+
+    @cached_property
+    def facturas(self):
+        return {(p, _clave_texto(n)): i for i, p, n in
+                self.conn.execute("SELECT id_factura, id_proveedor, num_factura FROM Factura")}
+
+    @cached_property
+    def id_facturas(self):
+        return set(self.facturas.values())
+
+    @cached_property
+    def productos(self):
+        return self._unicos((_clave_texto(ma, mo, t), i) for i, ma, mo, t in
+                            self.conn.execute("SELECT id_producto, marca, modelo, tipo FROM Producto"))
+
+    @cached_property
+    def id_productos(self):
+        return {i for (i,) in self.conn.execute("SELECT id_producto FROM Producto")}
+
+    def coche(self, texto, obligatoria=True):
+        if not texto and not obligatoria:
+            return None
+        matricula = self.coches.get(clave_matricula(normalizar_matricula(texto)))
+        if matricula is None:
+            raise ValueError(f"No existe el vehículo {texto}.")
+        return matricula
+
+    def proveedor(self, fila):
+        if fila.get("id_proveedor"):
+            id_proveedor = _numero(fila["id_proveedor"], "id_proveedor", entero=True)
+            if id_proveedor not in self.id_proveedores:
+                raise ValueError(f"No existe el proveedor {id_proveedor}.")
+            return id_proveedor
+        nombre = _obligatorio(fila, "proveedor")
+        clave = _clave_texto(nombre)
+        if clave not in self.proveedores:
+            raise ValueError(f"No existe el proveedor '{nombre}'.")
+        if self.proveedores[clave] is None:
+            raise ValueError(f"Hay varios proveedores llamados '{nombre}'; usa id_proveedor.")
+        return self.proveedores[clave]
+
+    def factura(self, fila):
+        if fila.get("id_factura"):
+            id_factura = _numero(fila["id_factura"], "id_factura", entero=True)
+            if id_factura not in self.id_facturas:
+                raise ValueError(f"No existe la factura {id_factura}.")
+            return id_factura
+        if not fila.get("num_factura"):
+            return None
+        id_factura = self.facturas.get((self.proveedor(fila), _clave_texto(fila["num_factura"])))
+        if id_factura is None:
+            raise ValueError(f"No existe la factura {fila['num_factura']} de ese proveedor.")
+        return id_factura
+
+    def producto(self, fila):
+        if fila.get("id_producto"):
+            id_producto = _numero(fila["id_producto"], "id_producto", entero=True)
+            if id_producto not in self.id_productos:
+                raise ValueError(f"No existe el producto {id_producto}.")
+            return id_producto
+        clave = _clave_texto(fila.get("marca"), fila.get("modelo"), fila.get("tipo"))
+        if clave not in self.productos:
+            raise ValueError("No existe un producto con esa marca, modelo y tipo; usa id_producto.")
+        if self.productos[clave] is None:
+            raise ValueError("Hay varios productos con esa marca, modelo y tipo; usa id_producto.")
+        return self.productos[clave]
+
+
+# Importadores por tabla: columnas del INSERT, columnas obligatorias del CSV
+# (cada elemento es una columna o una tupla de alternativas) y la función que
+# convierte una fila del CSV en los valores del INSERT.
+
+def _fila_coche(fila, mapas):
+    matricula = normalizar_matricula(fila.get("matricula"))
+    if clave_matricula(matricula) in mapas.coches:
+        raise ValueError(f"Ya existe el vehículo {matricula}.")
+    valores = (matricula, _obligatorio(fila, "marca"), _obligatorio(fila, "modelo"),
+               _numero(fila.get("km_actuales"), "km_actuales", entero=True) or 0,
+               _fecha(fila.get("fecha_matriculacion")))
+    mapas.coches[clave_matricula(matricula)] = matricula
+    return valores
+
+
+def _fila_factura(fila, mapas):
+    id_proveedor = mapas.proveedor(fila)
+    num_factura = _obligatorio(fila, "num_factura")
+    clave = (id_proveedor, _clave_texto(num_factura))
+    if clave in mapas.facturas:
+        raise ValueError(f"Ya existe la factura {num_factura} de ese proveedor.")
+    valores = (id_proveedor, num_factura, _fecha(fila.get("fecha_emision"), obligatoria=False),
+               _numero(fila.get("importe_total"), "importe_total"), mapas.coche(fila.get("matricula"), obligatoria=False))
+    mapas.facturas[clave] = None
+    return valores
+
+
+def _fila_gasto(fila, mapas):
+    importe = _numero(_obligatorio(fila, "importe"), "importe")
+    return (mapas.coche(fila.get("matricula")), mapas.factura(fila), _fecha(fila.get("fecha")),
+            fila.get("categoria"), _obligatorio(fila, "concepto"), importe, fila.get("observaciones"))
+
+
+def _fila_mantenimiento(fila, mapas):
+    km = _numero(_obligatorio(fila, "km"), "km", entero=True)
+    return (mapas.coche(fila.get("matricula")), mapas.producto(fila), _fecha(fila.get("fecha")),
+            km, fila.get("descripcion"))
+
+
+IMPORTADORES = {
+    "Coche": (("matricula", "marca", "modelo", "km_actuales", "fecha_matriculacion"),
+              ("matricula", "marca", "modelo", "fecha_matriculacion"), _fila_coche),
+    "Factura": (("id_proveedor", "num_factura", "fecha_emision", "importe_total", "matricula"),
+                (("proveedor", "id_proveedor"), "num_factura"), _fila_factura),
+    "Gasto": (("matricula", "id_factura", "fecha", "categoria", "concepto", "importe", "observaciones"),
+              ("matricula", "fecha", "concepto", "importe"), _fila_gasto),
+    "Mantenimiento": (("matricula", "id_producto", "fecha", "km", "descripcion"),
+                      ("matricula", ("id_producto", "marca"), "fecha", "km"), _fila_mantenimiento),
+}
+
+
+def _importador_generico(conn, tabla, cabecera):
+    """Importador columna a columna para las tablas sin uno propio."""
+    info = {f["name"]: f for f in conn.execute(f"PRAGMA table_info({tabla})")}
+    desconocidas = set(cabecera) - set(info)
+    if desconocidas:
+        raise ErrorImportacion(f"Columnas que no existen en {tabla}: {', '.join(sorted(desconocidas))}.")
+    columnas = tuple(cabecera)
+    obligatorias = tuple(c for c, f in info.items()
+                         if f["notnull"] and f["dflt_value"] is None and c != CLAVES_PRIMARIAS[tabla])
+    fechas = _FECHAS.get(tabla, ())
+
+    def convertir(fila, mapas):
+        for c in obligatorias:
+            _obligatorio(fila, c)
+        valores = dict(fila)
+        for c in fechas:
+            if c in valores:
+                valores[c] = _fecha(valores[c], obligatoria=False)
+        if "matricula" in valores:
+            valores["matricula"] = mapas.coche(valores["matricula"], obligatoria="matricula" in obligatorias)
+        # Una fila con menos campos que la cabecera deja vacías las columnas que le faltan
+        return tuple(valores.get(c) for c in columnas)
+
+    return columnas, obligatorias, convertir
+
+
+class _Rechazos:
+    """Fichero de filas rechazadas, que solo se crea al rechazar la primera."""
+
+    def __init__(self, ruta, cabecera):
+        self.ruta = ruta
+        self.cabecera = cabecera
+        self.total = 0
+        self._fichero = self._escritor = None
+
+    def anotar(self, linea, fila, motivo):
+        if self._fichero is None:
+            self._fichero = open(self.ruta, "w", newline="", encoding="utf-8")
+            self._escritor = csv.writer(self._fichero)
+            self._escritor.writerow(["linea", "error", *self.cabecera])
+        self._escritor.writerow([linea, motivo, *fila])
+        self.total += 1
+
+    def cerrar(self):
+        if self._fichero is not None:
+            self._fichero.close()
+
+
+def _insertar_lote(conn, insert, lote, rechazos):
+    """Inserta un lote de (línea, fila CSV, valores) con executemany y devuelve cuántas filas entraron.
+
+    executemany pide cada fila al iterador justo antes de insertarla, así que si
+    una falla es la última entregada: las anteriores ya están dentro (SQLite solo
+    deshace la sentencia que falla), esa va a rechazos y se sigue con el resto.
+    Es mucho más rápido que envolver cada lote en un SAVEPOINT.
+
+    Solo se rechazan filas por restricciones (``IntegrityError``); cualquier otro
+    error (BD bloqueada, disco lleno, E/S) aborta la importación entera, porque
+    SQLite puede haber deshecho ya toda la transacción.
+    """
+    pendientes = iter(lote)
+    entregadas = 0
+    ultima = None
+
+    def valores():
+        nonlocal entregadas, ultima
+        for ultima in pendientes:
+            entregadas += 1
+            yield ultima[2]
+
+    insertadas = 0
+    while True:
+        entregadas = 0
+        try:
+            conn.executemany(insert, valores())
+            return insertadas + entregadas
+        except sqlite3.IntegrityError as e:
+            insertadas += entregadas - 1
+            linea, fila, _ = ultima
+            rechazos.anotar(linea, fila, str(e))
+
+
+def importar_csv(conn, tabla, ruta, ruta_rechazos=None, lote=LOTE):
+    """Importa en ``tabla`` las filas del CSV ``ruta`` en una sola transacción.
+
+    ``conn`` no debe tener ninguna transacción abierta.
+    Las filas rechazadas se escriben en ``ruta_rechazos`` (por defecto, junto al
+    fichero y con ``.rechazos.csv`` en vez de su extensión), que solo se crea si hay alguna.  Devuelve un
+    diccionario con ``importadas``, ``rechazadas`` y ``rechazos`` (la ruta del
+    fichero de rechazos o ``None``).  Lanza ``ErrorImportacion`` si el fichero no
+    se puede importar en absoluto.
+    """
+    ruta_rechazos = ruta_rechazos or os.path.splitext(ruta)[0] + ".rechazos.csv"
+    mapas = Mapas(conn)
+    importadas = 0
+
+    with open(ruta, newline="", encoding="utf-8-sig") as fichero:
+        primera = fichero.readline()
+        fichero.seek(0)
+        lector = csv.reader(fichero, delimiter=";" if primera.count(";") > primera.count(",") else ",")
+        cabecera_original = next(lector, None)
+        if not cabecera_original:
+            raise ErrorImportacion(f"{ruta} está vacío.")
+        cabecera = [_nombre_columna(c) for c in cabecera_original]
+
+        if tabla in IMPORTADORES:
+            columnas, obligatorias, convertir = IMPORTADORES[tabla]
+        else:
+            columnas, obligatorias, convertir = _importador_generico(conn, tabla, cabecera)
+        faltan = [c if isinstance(c, str) else " o ".join(c) for c in obligatorias
+                  if not set([c] if isinstance(c, str) else c) & set(cabecera)]
+        if faltan:
+            raise ErrorImportacion(f"Faltan columnas en {ruta}: {', '.join(faltan)}.")
+        insert = f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})"
+        rechazos = _Rechazos(ruta_rechazos, cabecera_original)
+
+        # Coche no tiene clave autonumérica ni triggers que merezca la pena suspender
+        masiva = tabla != "Coche" and CLAVES_PRIMARIAS[tabla] not in columnas
+        try:
+            with conn:
+                conn.execute("BEGIN")
+                with carga_masiva(conn, tabla) if masiva else nullcontext():
+                    pendientes = []
+                    for fila in lector:
+                        if not any(fila):
+                            continue
+                        datos = {c: v.strip() or None for c, v in zip(cabecera, fila)}
+                        try:
+                            pendientes.append((lector.line_num, fila, convertir(datos, mapas)))
+                        except ValueError as e:
+                            rechazos.anotar(lector.line_num, fila, str(e))
+                            continue
+                        if len(pendientes) >= lote:
+                            importadas += _insertar_lote(conn, insert, pendientes, rechazos)
+                            pendientes = []
+                    importadas += _insertar_lote(conn, insert, pendientes, rechazos)
+                recalcular_ritmos(conn)
+        finally:
+            rechazos.cerrar()
+
+    return {"importadas": importadas, "rechazadas": rechazos.total,
+            "rechazos": ruta_rechazos if rechazos.total else None}
@@ -0,0 +1,379 @@
+"""Informes en PDF de Fleet Plus.
+
+No dependen de la interfaz: reciben una conexión y escriben el fichero, así que
+los usan tanto la aplicación como la línea de órdenes (``cli.py``). reportlab se
+importa al generar el primer informe, no al importar el módulo.
+
+``generar_informes`` hace el informe de muchos vehículos a la vez (el paquete
+mensual de toda la flota) repartiéndolos entre varios procesos.
+"""
+import multiprocessing
+import os
+import signal
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import chain
+
+import consultas
+from base_datos import CONFIG, conectar, formatear_fecha
+
+# Filas que se leen de la BD de cada vez al maquetar una tabla
+LOTE = 500
+
+# Sufijo del PDF mientras se escribe; solo se renombra al nombre final cuando está completo
+SUFIJO_PARCIAL = ".parcial"
+
+# Conexión de solo lectura de cada proceso de trabajo (la abre _iniciar_proceso)
+_conn_proceso = None
+
+
+class InformeCancelado(Exception):
+    """Se ha pedido cancelar el informe mientras se generaba."""
+
+
+def nombre_informe(matricula):
+    """Nombre del fichero del informe de un vehículo."""
+    return f"{matricula.replace('/', '_').replace(' ', '_')}_informe_completo.pdf"
+
+
+def _comprobar(cancelar):
+    if cancelar is not None and cancelar.is_set():
+        raise InformeCancelado("Informe cancelado.")
+
+
+def generar_informe_coche(conn, matricula, ruta=None, al_avanzar=None, cancelar=None):
+    """Escribe el historial completo del vehículo (mantenimientos, obligaciones, gastos y facturas) en PDF.
+
+    Por defecto el fichero se llama como indica ``nombre_informe``. Devuelve la
+    ruta del PDF; lanza ``ValueError`` si el vehículo no existe.
+
+    Las filas se leen por bloques de ``LOTE`` y se maquetan página a página
+    (``tablas_pdf``), así que la memoria no crece con el historial y el tiempo
+    crece en proporción a las filas, no a su cuadrado.
+
+    Mientras se maqueta, ``al_avanzar(filas, total)`` recibe cuántas filas de las
+    tablas están ya colocadas en páginas.  Si se activa el ``threading.Event``
+    ``cancelar`` se lanza ``InformeCancelado``; reportlab solo escribe el fichero
+    al terminar, así que no queda nada a medias.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import Table, TableStyle, SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_CENTER
+    from tablas_pdf import Flujo, TablaPorPaginas, celda
+
+    # --- Datos del coche ---
+    cursor_coche = conn.execute(
+        "SELECT marca, modelo, fecha_matriculacion, km_actuales FROM Coche WHERE matricula = ?",
+        (matricula,)
+    )
+    coche_info = cursor_coche.fetchone()
+    if not coche_info:
+        raise ValueError(f"No se encontró el coche con matrícula {matricula}.")
+
+    marca = coche_info["marca"]
+    modelo = coche_info["modelo"]
+    fecha_matriculacion = formatear_fecha(coche_info["fecha_matriculacion"])
+    km_actuales = coche_info["km_actuales"] if coche_info["km_actuales"] is not None else 0
+
+    costes = consultas.costes_coche(conn, matricula)
+    total_gastos = costes["gastos"]
+    total_facturas = costes["facturas"]
+
+    # Solo para el avance: cuántas filas hay que maquetar
+    total_filas = conn.execute("""
+        SELECT (SELECT count(*) FROM Mantenimiento WHERE matricula = :m)
+             + (SELECT count(*) FROM Obligaciones WHERE matricula = :m)
+             + (SELECT count(*) FROM Gasto WHERE matricula = :m)
+             + (SELECT count(*) FROM Factura WHERE matricula = :m)
+    """, {"m": matricula}).fetchone()[0]
+
+    ruta = ruta or nombre_informe(matricula)
+    doc = SimpleDocTemplate(ruta, pagesize=A4)
+    styles = getSampleStyleSheet()
+    centered = ParagraphStyle('centered', parent=styles['Normal'], alignment=TA_CENTER)
+    estilo_tabla = TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor("#003366")),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('GRID', (0,0), (-1,-1), 0.5, colors.grey),
+        ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.whitesmoke, colors.lightgrey])
+    ])
+
+    def tabla(cursor, cabecera, anchos, textos):
+        """TablaPorPaginas con las filas del cursor, o ``None`` si no tiene ninguna.
+
+        ``textos(fila)`` da el texto de cada columna; solo los que no caben en una
+        línea se convierten en Paragraph.
+        """
+        def filas():
+            while bloque := cursor.fetchmany(LOTE):
+                _comprobar(cancelar)
+                for fila in bloque:
+                    yield [celda(texto, ancho, centered) for texto, ancho in zip(textos(fila), anchos)]
+
+        filas = filas()
+        primera = next(filas, None)
+        if primera is None:
+            return None
+        return TablaPorPaginas(cabecera, chain([primera], filas), anchos, estilo_tabla)
+
+    def texto_mantenimiento(m):
+        return [
+            f"{m['tipo_componente']} ({m['marca']} {m['modelo']} {m['tipo']})",
+            formatear_fecha(m["fecha"]),
+            str(m["km"]),
+            str(m["prox_km"]) if m["prox_km"] else "-",
+            formatear_fecha(m["prox_fecha"]),
+            m["descripcion"] or "-",
+        ]
+
+    def texto_obligacion(o):
+        return [
+            o["tipo"],
+            formatear_fecha(o["fecha_inicio"]),
+            formatear_fecha(o["fecha_vencimiento"]),
+            o["estado"] or "-",
+            o["descripcion"] or "-",
+        ]
+
+    def texto_gasto(g):
+        factura_info = "-"
+        if g["num_factura"]:
+            factura_info = f"{g['num_factura']} ({g['proveedor'] or '—'})"
+        return [
+            formatear_fecha(g["fecha"]),
+            g["categoria"] or "-",
+            g["concepto"],
+            f"{g['importe']:.2f}",
+            factura_info,
+            g["observaciones"] or "-",
+        ]
+
+    def texto_factura(f):
+        importe = float(f["importe_total"]) if f["importe_total"] else 0.0
+        return [f["num_factura"], f["proveedor"], formatear_fecha(f["fecha_emision"]), f"{importe:.2f}"]
+
+    def elementos():
+        # --- Encabezado principal ---
+        title = Paragraph(f"<b>Informe del vehículo {matricula}</b>", styles['Title'])
+
+        subtitle_text = (
+            f"<b>Marca:</b> {marca} &nbsp;&nbsp; "
+            f"<b>Modelo:</b> {modelo} &nbsp;&nbsp; "
+            f"<b>Fecha matriculación:</b> {fecha_matriculacion} &nbsp;&nbsp;<br/> "
+            f"<b>Kilómetros actuales:</b> {km_actuales} km"
+        )
+
+        subtitle = Paragraph(subtitle_text, centered)
+
+        yield from (title, subtitle, Spacer(1, 16))
+
+        # MANTENIMIENTOS
+
+        yield Paragraph("<b>Mantenimientos</b>", styles['Heading2'])
+        yield Spacer(1, 8)
+
+        _comprobar(cancelar)
+        table = tabla(consultas.recorrer_mantenimientos(conn, matricula),
+                      ["Componente", "Fecha", "Km", "Próx. km", "Próx. fecha", "Descripción"],
+                      [140, 70, 55, 80, 80, 140], texto_mantenimiento)
+        yield table or Paragraph("No hay mantenimientos registrados.", styles['Normal'])
+
+        # OBLIGACIONES
+
+        yield Spacer(1, 20)
+        yield Paragraph("<b>Obligaciones</b>", styles['Heading2'])
+        yield Spacer(1, 8)
+
+        _comprobar(cancelar)
+        cursor_oblig = conn.execute("""
+            SELECT tipo, fecha_inicio, fecha_vencimiento, estado, descripcion
+            FROM Obligaciones
+            WHERE matricula = ?
+            ORDER BY fecha_vencimiento ASC
+        """, (matricula,))
+        table_obl = tabla(cursor_oblig, ["Tipo", "Inicio", "Vencimiento", "Estado", "Descripción"],
+                          [70, 70, 70, 60, 160], texto_obligacion)
+        yield table_obl or Paragraph("No hay obligaciones registradas.", styles['Normal'])
+
+        # GASTOS
+
+        yield Spacer(1, 20)
+        yield Paragraph("<b>Gastos</b>", styles['Heading2'])
+        yield Spacer(1, 8)
+
+        _comprobar(cancelar)
+        cursor_gastos = conn.execute("""
+            SELECT G.fecha, G.categoria, G.concepto, G.importe, G.observaciones,
+                   F.num_factura, F.fecha_emision, F.importe_total,
+                   P.nombre AS proveedor
+            FROM Gasto G
+            LEFT JOIN Factura F ON G.id_factura = F.id_factura
+            LEFT JOIN Proveedor P ON F.id_proveedor = P.id_proveedor
+            WHERE G.matricula = ?
+            ORDER BY G.fecha DESC
+        """, (matricula,))
+        table_gastos = tabla(cursor_gastos,
+                             ["Fecha", "Categoría", "Concepto", "Importe (€)", "Factura / Proveedor", "Observaciones"],
+                             [70, 70, 100, 70, 100, 90], texto_gasto)
+        if table_gastos:
+            yield table_gastos
+            yield Spacer(1, 10)
+            yield Paragraph(f"<b>Total gastos:</b> {total_gastos:.2f} €", styles['Heading3'])
+        else:
+            yield Paragraph("No hay gastos registrados.", styles['Normal'])
+
+        # FACTURAS
+
+        yield Spacer(1, 20)
+        yield Paragraph("<b>Facturas asociadas</b>", styles['Heading2'])
+        yield Spacer(1, 8)
+
+        _comprobar(cancelar)
+        tabla_facturas = tabla(consultas.recorrer_facturas(conn, matricula),
+                               ["Nº Factura", "Proveedor", "Fecha emisión", "Importe (€)"],
+                               [100, 150, 100, 80], texto_factura)
+        if tabla_facturas:
+            yield tabla_facturas
+            yield Spacer(1, 10)
+            yield Paragraph(f"<b>Total facturas:</b> {total_facturas:.2f} €", styles['Heading3'])
+        else:
+            yield Paragraph("No hay facturas registradas.", styles['Normal'])
+
+        # TOTAL GENERAL (Gastos + Facturas)
+
+        total_general = total_gastos + total_facturas
+        yield Spacer(1, 15)
+        yield Paragraph(f"<b>Total Coste (Gastos + Facturas):</b> {total_general:.2f} €", styles['Heading2'])
+
+    # Generar PDF
+
+    colocadas = 0
+
+    def tras_elemento(elemento):
+        # Cada página de una tabla llega aquí como una LongTable con su cabecera
+        nonlocal colocadas
+        _comprobar(cancelar)
+        if al_avanzar and isinstance(elemento, Table):
+            colocadas += elemento._nrows - 1
+            al_avanzar(colocadas, total_filas)
+
+    doc.afterFlowable = tras_elemento
+    doc.build(Flujo(elementos()))
+    return ruta
+
+
+# Lotes en paralelo
+
+def _generar_en_destino(conn, matricula, destino):
+    """Genera el informe en ``destino`` sin dejar nunca un PDF a medias con el nombre final.
+
+    Devuelve (matricula, ruta, error) con ``error`` a ``None`` si salió bien;
+    el error va como texto para que pueda volver de otro proceso.
+    """
+    ruta = os.path.join(destino, nombre_informe(matricula))
+    parcial = ruta + SUFIJO_PARCIAL
+    try:
+        generar_informe_coche(conn, matricula, parcial)
+        os.replace(parcial, ruta)
+        return matricula, ruta, None
+    except Exception as e:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        return matricula, ruta, str(e) or type(e).__name__
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def _iniciar_proceso(config):
+    global _conn_proceso
+    # Ctrl+C lo atiende el proceso principal, que deja terminar los informes en curso
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _conn_proceso = conectar(solo_lectura=True, config=config)
+
+
+def _informe_en_proceso(matricula, destino):
+    return _generar_en_destino(_conn_proceso, matricula, destino)
+
+
+def informes_pendientes(matriculas, destino):
+    """Las ``matriculas`` cuyo informe aún no está en ``destino``."""
+    return [m for m in matriculas if not os.path.exists(os.path.join(destino, nombre_informe(m)))]
+
+
+def generar_informes(matriculas, destino, procesos=None, rehacer=False, al_avanzar=None, cancelar=None, config=None):
+    """Genera el informe de cada vehículo de ``matriculas`` en la carpeta ``destino``.
+
+    Los vehículos se reparten entre ``procesos`` procesos (por defecto, uno por
+    núcleo), cada uno con su propia conexión de solo lectura.  Cada PDF se
+    escribe con ``SUFIJO_PARCIAL`` y se renombra al terminar, así que los que
+    hay en ``destino`` siempre están completos: salvo con ``rehacer``, los que
+    ya existen no se vuelven a generar y repetir la llamada tras un corte o una
+    cancelación continúa donde se quedó.
+
+    ``al_avanzar(hechos, total, matricula, error)`` se llama, en el hilo que
+    llama a esta función, cada vez que termina un informe (``error`` es ``None``
+    si salió bien).  ``cancelar`` es un ``threading.Event``: al activarlo no se
+    empiezan más informes y se espera a que acaben los que están en curso.
+
+    Devuelve un diccionario con ``generados`` (rutas), ``omitidos`` (cuántos ya
+    existían), ``fallidos`` ({matrícula: error}) y ``cancelado``.
+    """
+    os.makedirs(destino, exist_ok=True)
+    config = config or CONFIG
+    pendientes = list(matriculas) if rehacer else informes_pendientes(matriculas, destino)
+    resultado = {"generados": [], "omitidos": len(matriculas) - len(pendientes), "fallidos": {}, "cancelado": False}
+    total = len(pendientes)
+    procesos = max(1, min(procesos or os.cpu_count() or 1, total))
+
+    def anotar(matricula, ruta, error):
+        if error is None:
+            resultado["generados"].append(ruta)
+        else:
+            resultado["fallidos"][matricula] = error
+        if al_avanzar:
+            al_avanzar(len(resultado["generados"]) + len(resultado["fallidos"]), total, matricula, error)
+
+    if procesos == 1:
+        # Sin paralelismo no compensa arrancar procesos
+        conn = conectar(solo_lectura=True, config=config)
+        try:
+            for matricula in pendientes:
+                if cancelar is not None and cancelar.is_set():
+                    resultado["cancelado"] = True
+                    break
+                anotar(*_generar_en_destino(conn, matricula, destino))
+        finally:
+            conn.close()
+        return resultado
+
+    # spawn en todas las plataformas: hacer fork de un proceso con hilos (la
+    # interfaz, el ejecutor de consultas) puede heredar cerrojos tomados
+    ejecutor = ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_iniciar_proceso, initargs=(config,))
+    try:
+        futuros = {ejecutor.submit(_informe_en_proceso, m, destino): m for m in pendientes}
+        en_curso = set(futuros)
+        while en_curso:
+            hechos, en_curso = wait(en_curso, timeout=0.2, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                if futuro.cancelled():
+                    continue
+                try:
+                    anotar(*futuro.result())
+                except Exception as e:
+                    # Un proceso que muere (p. ej. sin memoria) rompe el lote; lo que falte se genera al repetirlo
+                    anotar(futuros[futuro], None, str(e) or type(e).__name__)
+            if cancelar is not None and cancelar.is_set() and not resultado["cancelado"]:
+                resultado["cancelado"] = True
+                for futuro in en_curso:
+                    futuro.cancel()
+    except BaseException:
+        ejecutor.shutdown(wait=True, cancel_futures=True)
+        raise
+    ejecutor.shutdown(wait=True)
+    return resultado
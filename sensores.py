@@ -0,0 +1,347 @@
+"""Servicio de ingesta de lecturas de sensores.
+
+Recibe lecturas por un socket TCP o UNIX local con un protocolo de JSON por
+líneas: cada línea es un objeto como
+
+    {"matricula": "1234ABC", "tipo": "km", "valor": 120500, "instante": "2025-03-01T08:15:00"}
+
+donde ``tipo`` es ``km`` (cuentakilómetros), ``combustible`` (nivel en %) o
+``dtc`` (código de avería, p. ej. ``"P0301"``), e ``instante`` es opcional (por
+defecto, el momento de recepción). Las líneas no válidas y las lecturas de
+vehículos que no existen se cuentan y se descartan; el servidor no responde.
+
+Los hilos de las conexiones solo analizan las líneas y las dejan en una cola.
+Un único hilo escritor la vacía por lotes y escribe cada lote con
+``executemany`` en una transacción corta, de modo que la aplicación de
+escritorio, que usa la misma BD en modo WAL, como mucho espera lo que dura un
+lote. Los km actualizan LecturaKm, ``Coche.km_actuales`` y el ritmo de uso.
+
+    python3 sensores.py servir [--tcp 127.0.0.1:8765 | --unix /tmp/fleet_plus.sock]
+    python3 sensores.py simular --vehiculos 500 --lecturas 200000 [--tcp ... | --unix ...]
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import random
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from base_datos import conectar, inicializar_base_datos, recalcular_ritmos
+
+PUERTO = 8765
+
+# Un lote se escribe al llegar a LOTE lecturas o a los ESPERA segundos de la primera
+LOTE = 5000
+ESPERA = 0.2
+
+# Cada cuántos segundos imprime el escritor cuánto lleva escrito
+INFORME_CADA = 10
+
+# Mayor lectura de km que se acepta; más es un error del sensor (y no cabría en un INTEGER)
+KM_MAXIMO = 10_000_000
+
+# Reintentos de un lote si la BD sigue bloqueada tras busy_timeout
+REINTENTOS = 3
+
+# Una lectura de un vehículo que no existe no escribe nada (WHERE EXISTS)
+_EXISTE = "WHERE EXISTS (SELECT 1 FROM Coche WHERE matricula = ?)"
+
+_SQL_KM = f"""
+    INSERT INTO LecturaKm (matricula, fecha, km) SELECT ?, ?, ? {_EXISTE}
+    ON CONFLICT (matricula, fecha) DO UPDATE SET km = excluded.km
+"""
+_SQL_KM_ACTUALES = "UPDATE Coche SET km_actuales = ? WHERE matricula = ? AND coalesce(km_actuales, 0) < ?"
+_SQL_COMBUSTIBLE = f"""
+    INSERT INTO LecturaCombustible (matricula, instante, nivel) SELECT ?, ?, ? {_EXISTE}
+    ON CONFLICT (matricula, instante) DO UPDATE SET nivel = excluded.nivel
+"""
+_SQL_DTC = f"""
+    INSERT INTO CodigoAveria (matricula, codigo, primera, ultima) SELECT ?, ?, ?, ? {_EXISTE}
+    ON CONFLICT (matricula, codigo) DO UPDATE SET
+        primera = min(primera, excluded.primera),
+        ultima = max(ultima, excluded.ultima),
+        veces = veces + 1
+"""
+
+
+def leer_lectura(linea):
+    """Convierte una línea del protocolo en (tipo, matrícula, instante, valor).
+
+    Lanza ``ValueError`` si la línea no es una lectura válida.
+    """
+    datos = json.loads(linea)
+    if not isinstance(datos, dict):
+        raise ValueError("La lectura debe ser un objeto JSON.")
+
+    matricula = datos.get("matricula")
+    if not isinstance(matricula, str) or not matricula.strip():
+        raise ValueError("Falta la matrícula.")
+
+    instante = datos.get("instante")
+    if instante is None:
+        instante = datetime.now()
+    elif isinstance(instante, str):
+        instante = datetime.fromisoformat(instante)
+    else:
+        raise ValueError("El instante debe ser una fecha ISO.")
+
+    tipo, valor = datos.get("tipo"), datos.get("valor")
+    if tipo == "dtc":
+        if not isinstance(valor, str) or not valor.strip():
+            raise ValueError("El código de avería debe ser un texto.")
+        valor = valor.strip().upper()
+    elif tipo in ("km", "combustible"):
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)) or not 0 <= valor < math.inf:
+            raise ValueError(f"Valor no válido para {tipo}: {valor!r}")
+        if tipo == "km":
+            if valor > KM_MAXIMO:
+                raise ValueError(f"Lectura de km fuera de rango: {valor}")
+            valor = int(valor)
+        elif valor > 100:
+            raise ValueError(f"Nivel de combustible fuera de rango: {valor}")
+    else:
+        raise ValueError(f"Tipo de lectura desconocido: {tipo!r}")
+
+    return tipo, matricula.strip(), instante.isoformat(timespec="seconds"), valor
+
+
+class Ingesta:
+    """Cola de lecturas y el hilo que las escribe por lotes en la BD."""
+
+    def __init__(self, lote=LOTE, espera=ESPERA):
+        self.lote = lote
+        self.espera = espera
+        self._cola = queue.Queue()
+        self._lock = threading.Lock()
+        self.recibidas = 0
+        self.no_validas = 0
+        self.escritas = 0
+        self.descartadas = 0   # de vehículos que no existen o de lotes que no se pudieron escribir
+        self._hilo = threading.Thread(target=self._escribir, daemon=True)
+        self._hilo.start()
+
+    def recibir(self, lineas):
+        """Analiza unas líneas del protocolo y encola las lecturas válidas (llamable desde cualquier hilo)."""
+        recibidas = no_validas = 0
+        for linea in lineas:
+            if not linea.strip():
+                continue
+            recibidas += 1
+            try:
+                self._cola.put(leer_lectura(linea))
+            except (ValueError, TypeError):
+                no_validas += 1
+        with self._lock:
+            self.recibidas += recibidas
+            self.no_validas += no_validas
+
+    def cerrar(self):
+        """Escribe lo que quede en la cola y detiene el hilo escritor."""
+        self._cola.put(None)
+        self._hilo.join()
+
+    def resumen(self):
+        with self._lock:
+            return (f"{self.recibidas} lecturas recibidas, {self.escritas} escritas, "
+                    f"{self.no_validas} no válidas, {self.descartadas} descartadas")
+
+    # Hilo escritor
+
+    def _escribir(self):
+        conn = conectar()
+        ultimo_informe = time.monotonic()
+        escritas_informe = 0
+        terminar = False
+        while not terminar:
+            lecturas = [self._cola.get()]
+            limite = time.monotonic() + self.espera
+            while len(lecturas) < self.lote:
+                try:
+                    lecturas.append(self._cola.get(timeout=max(0, limite - time.monotonic())))
+                except queue.Empty:
+                    break
+            if None in lecturas:
+                terminar = True
+                lecturas = [l for l in lecturas if l is not None]
+
+            if lecturas:
+                self._guardar_lote(conn, lecturas)
+
+            ahora = time.monotonic()
+            if ahora - ultimo_informe >= INFORME_CADA:
+                ritmo = (self.escritas - escritas_informe) / (ahora - ultimo_informe)
+                print(f"{self.resumen()} ({ritmo:.0f} lecturas/s en los últimos {ahora - ultimo_informe:.0f} s)")
+                ultimo_informe, escritas_informe = ahora, self.escritas
+        conn.close()
+
+    def _guardar_lote(self, conn, lecturas):
+        escritas = 0
+        for intento in range(1, REINTENTOS + 1):
+            try:
+                escritas = self._escribir_lote(conn, lecturas)
+                break
+            except sqlite3.OperationalError as e:
+                # BD bloqueada más allá de busy_timeout: se reintenta el mismo lote
+                print(f"No se pudo escribir un lote de {len(lecturas)} lecturas (intento {intento}):", e)
+                time.sleep(intento)
+            except Exception as e:
+                # Cualquier otro error descarta el lote, pero el hilo escritor sigue
+                print(f"Lote de {len(lecturas)} lecturas descartado:", e)
+                break
+        with self._lock:
+            self.escritas += escritas
+            self.descartadas += len(lecturas) - escritas
+
+    @staticmethod
+    def _escribir_lote(conn, lecturas):
+        """Escribe un lote en una transacción. Devuelve cuántas lecturas se escribieron."""
+        km, combustible, averias = [], [], []
+        km_actuales = {}
+        # Por orden de instante, para que en LecturaKm quede la última lectura de cada día
+        for tipo, matricula, instante, valor in sorted(lecturas, key=lambda l: l[2]):
+            if tipo == "km":
+                km.append((matricula, instante[:10], valor, matricula))
+                km_actuales[matricula] = max(valor, km_actuales.get(matricula, 0))
+            elif tipo == "combustible":
+                combustible.append((matricula, instante, valor, matricula))
+            else:
+                averias.append((matricula, valor, instante, instante, matricula))
+
+        with conn:
+            escritas = conn.executemany(_SQL_KM, km).rowcount if km else 0
+            escritas += conn.executemany(_SQL_COMBUSTIBLE, combustible).rowcount if combustible else 0
+            escritas += conn.executemany(_SQL_DTC, averias).rowcount if averias else 0
+            if km_actuales:
+                conn.executemany(_SQL_KM_ACTUALES, [(v, m, v) for m, v in km_actuales.items()])
+                recalcular_ritmos(conn)
+        return escritas
+
+
+class _Manejador(socketserver.StreamRequestHandler):
+    # Líneas que se analizan de una vez antes de pasarlas a la ingesta
+    BLOQUE = 500
+
+    def handle(self):
+        bloque = []
+        for linea in self.rfile:
+            bloque.append(linea)
+            if len(bloque) >= self.BLOQUE:
+                self.server.ingesta.recibir(bloque)
+                bloque = []
+        self.server.ingesta.recibir(bloque)
+
+
+class _ServidorTCP(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _ServidorUnix(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _ServidorUnix = None
+
+
+def _direccion_tcp(texto):
+    host, _, puerto = texto.rpartition(":")
+    return host or "127.0.0.1", int(puerto)
+
+
+def servir(tcp=None, unix=None):
+    """Atiende conexiones hasta Ctrl+C; al salir escribe lo pendiente."""
+    inicializar_base_datos()
+    if unix:
+        if _ServidorUnix is None:
+            raise SystemExit("Este sistema no admite sockets UNIX; usa --tcp.")
+        if os.path.exists(unix):
+            os.unlink(unix)
+        servidor = _ServidorUnix(unix, _Manejador)
+        donde = unix
+    else:
+        servidor = _ServidorTCP(_direccion_tcp(tcp), _Manejador)
+        donde = "{}:{}".format(*servidor.server_address[:2])
+
+    servidor.ingesta = Ingesta()
+    print(f"Recibiendo lecturas en {donde} (Ctrl+C para terminar)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.ingesta.cerrar()
+        if unix and os.path.exists(unix):
+            os.unlink(unix)
+        print(servidor.ingesta.resumen())
+
+
+def simular(tcp=None, unix=None, vehiculos=100, lecturas=100_000):
+    """Envía ``lecturas`` lecturas inventadas de los primeros ``vehiculos`` coches de la BD."""
+    conn = conectar(solo_lectura=True)
+    coches = {f["matricula"]: f["km_actuales"] or 0 for f in conn.execute(
+        "SELECT matricula, km_actuales FROM Coche ORDER BY matricula LIMIT ?", (vehiculos,)
+    )}
+    conn.close()
+    if not coches:
+        raise SystemExit("No hay vehículos en la BD con los que simular.")
+
+    if unix:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix)
+    else:
+        sock = socket.create_connection(_direccion_tcp(tcp))
+
+    matriculas = list(coches)
+    inicio = time.perf_counter()
+    with sock:
+        lineas = []
+        for _ in range(lecturas):
+            matricula = random.choice(matriculas)
+            azar = random.random()
+            if azar < 0.7:
+                coches[matricula] += random.randint(0, 5)
+                lectura = {"matricula": matricula, "tipo": "km", "valor": coches[matricula]}
+            elif azar < 0.98:
+                lectura = {"matricula": matricula, "tipo": "combustible", "valor": round(random.uniform(5, 100), 1)}
+            else:
+                lectura = {"matricula": matricula, "tipo": "dtc", "valor": random.choice(("P0300", "P0301", "P0420", "P0171"))}
+            lectura["instante"] = datetime.now().isoformat(timespec="seconds")
+            lineas.append(json.dumps(lectura))
+            if len(lineas) >= 1000:
+                sock.sendall(("\n".join(lineas) + "\n").encode())
+                lineas = []
+        if lineas:
+            sock.sendall(("\n".join(lineas) + "\n").encode())
+    segundos = time.perf_counter() - inicio
+    print(f"{lecturas} lecturas de {len(coches)} vehículos enviadas en {segundos:.1f} s "
+          f"({lecturas / segundos:.0f} lecturas/s)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingesta de lecturas de sensores de Fleet Plus.")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+    for nombre, ayuda in (("servir", "recibe lecturas y las guarda en la BD"),
+                          ("simular", "envía lecturas inventadas a un servidor en marcha")):
+        orden = ordenes.add_parser(nombre, help=ayuda)
+        destino = orden.add_mutually_exclusive_group()
+        destino.add_argument("--tcp", default=f"127.0.0.1:{PUERTO}", help="HOST:PUERTO (por defecto %(default)s)")
+        destino.add_argument("--unix", help="ruta del socket UNIX")
+    ordenes.choices["simular"].add_argument("--vehiculos", type=int, default=100)
+    ordenes.choices["simular"].add_argument("--lecturas", type=int, default=100_000)
+
+    args = parser.parse_args(argv)
+    if args.orden == "servir":
+        servir(args.tcp, args.unix)
+    else:
+        simular(args.tcp, args.unix, args.vehiculos, args.lecturas)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Sincronización por deltas con la app móvil u otros puestos.
+
+Cada escritura en las tablas de datos queda apuntada en la tabla Cambio (la
+mantienen triggers, ver ``base_datos._crear_registro_cambios``) con una versión
+creciente.  El cliente guarda la versión más alta que ha recibido (su marca) y
+pide solo lo que ha cambiado después:
+
+    cambios_desde(conn, marca)  ->  filas nuevas o modificadas y lápidas
+
+Para subir sus cambios, el cliente manda cada fila con la versión que tenía
+cuando la descargó; si en el servidor la fila ha cambiado desde entonces, no se
+aplica y se devuelve como conflicto con su estado actual, para que el cliente
+decida y la vuelva a mandar con la versión nueva.
+"""
+import sqlite3
+
+from base_datos import CLAVES_PRIMARIAS, COLUMNAS_FECHA, normalizar_fecha, recalcular_ritmos
+
+# Cambios por lote de descarga
+LOTE = 500
+
+_FECHAS = {tabla: columnas for tabla, _, columnas in COLUMNAS_FECHA}
+
+
+class ErrorCambio(ValueError):
+    """Cambio subido que no se puede aplicar tal como viene."""
+
+
+def version_actual(conn):
+    """Versión del último cambio registrado (0 si no hay ninguno)."""
+    return conn.execute("SELECT coalesce(max(version), 0) FROM Cambio").fetchone()[0]
+
+
+def cambios_desde(conn, desde=0, limite=LOTE):
+    """Hasta ``limite`` cambios posteriores a la versión ``desde``, en orden de versión.
+
+    Devuelve un diccionario con:
+
+    - ``version``: la nueva marca del cliente, que la manda como ``desde`` en la siguiente petición;
+    - ``mas``: si quedan cambios por descargar;
+    - ``completa``: si es una descarga desde cero; el cliente debe vaciar antes sus datos.
+      Pasa con ``desde=0`` y cuando la marca es mayor que la del servidor (una BD restaurada);
+    - ``tablas``: por tabla, ``columnas`` y ``filas`` (listas de valores en ese orden; la primera
+      columna es ``version``) de las filas nuevas o modificadas;
+    - ``borrados``: por tabla, pares ``[clave, version]`` de las filas eliminadas.
+
+    Una fila que cambia varias veces solo aparece una vez, con su estado final.
+    """
+    completa = desde <= 0 or desde > version_actual(conn)
+    if completa:
+        desde = 0
+    cambios = conn.execute("""
+        SELECT version, tabla, clave, borrado FROM Cambio
+        WHERE version > ? AND (borrado = 0 OR ?)
+        ORDER BY version
+        LIMIT ?
+    """, (desde, not completa, limite)).fetchall()
+    hasta = cambios[-1]["version"] if cambios else max(desde, version_actual(conn))
+
+    tablas, borrados = {}, {}
+    for tabla in dict.fromkeys(c["tabla"] for c in cambios):
+        # Si la fila vuelve a cambiar mientras tanto, su versión ya es > hasta y
+        # llegará en un lote posterior
+        cursor = conn.execute(f"""
+            SELECT C.version, T.* FROM Cambio C
+            JOIN {tabla} T ON T.{CLAVES_PRIMARIAS[tabla]} = C.clave
+            WHERE C.tabla = ? AND C.borrado = 0 AND C.version > ? AND C.version <= ?
+            ORDER BY C.version
+        """, (tabla, desde, hasta))
+        filas = [list(f) for f in cursor]
+        if filas:
+            tablas[tabla] = {"columnas": [d[0] for d in cursor.description], "filas": filas}
+    for c in cambios:
+        if c["borrado"]:
+            borrados.setdefault(c["tabla"], []).append([c["clave"], c["version"]])
+
+    return {"version": hasta, "mas": len(cambios) == limite, "completa": completa,
+            "tablas": tablas, "borrados": borrados}
+
+
+def _es_entero(valor):
+    """Si ``valor`` es un entero (no un booleano) que cabe en un INTEGER de SQLite."""
+    return isinstance(valor, int) and not isinstance(valor, bool) and -2 ** 63 <= valor < 2 ** 63
+
+
+def _fila(conn, tabla, clave):
+    fila = conn.execute(f"SELECT * FROM {tabla} WHERE {CLAVES_PRIMARIAS[tabla]} = ?", (clave,)).fetchone()
+    return dict(fila) if fila else None
+
+
+def _valores(conn, tabla, fila):
+    """Columnas y valores de ``fila`` comprobados contra el esquema, con las fechas en ISO."""
+    if not isinstance(fila, dict) or not fila:
+        raise ErrorCambio("Falta la fila.")
+    columnas = {f["name"] for f in conn.execute(f"PRAGMA table_info({tabla})")} - {CLAVES_PRIMARIAS[tabla]}
+    desconocidas = set(fila) - columnas
+    if desconocidas:
+        raise ErrorCambio(f"Columnas que no existen en {tabla}: {', '.join(sorted(desconocidas))}.")
+    for columna, valor in fila.items():
+        if not (valor is None or isinstance(valor, (str, float)) or _es_entero(valor)):
+            raise ErrorCambio(f"Valor no válido en {tabla}.{columna}: {valor!r}.")
+    valores = dict(fila)
+    for columna in _FECHAS.get(tabla, ()):
+        if isinstance(valores.get(columna), str):
+            valores[columna] = normalizar_fecha(valores[columna], obligatoria=False)
+    return valores
+
+
+def _aplicar(conn, cambio):
+    """Aplica un cambio subido. Devuelve (clave, conflicto) con conflicto a ``None`` si se aplicó."""
+    tabla = cambio.get("tabla")
+    if not isinstance(tabla, str) or tabla not in CLAVES_PRIMARIAS:
+        raise ErrorCambio(f"Tabla desconocida: {tabla}.")
+    clave_primaria = CLAVES_PRIMARIAS[tabla]
+    clave, base = cambio.get("clave"), cambio.get("version")
+    if not (clave is None or isinstance(clave, str) or _es_entero(clave)):
+        raise ErrorCambio(f"Clave no válida: {clave!r}.")
+    borrar = bool(cambio.get("borrado"))
+
+    if clave is None:
+        if borrar or tabla == "Coche":
+            raise ErrorCambio("Falta la clave de la fila.")
+        valores = _valores(conn, tabla, cambio.get("fila"))
+        cursor = conn.execute(f"INSERT INTO {tabla} ({', '.join(valores)}) VALUES ({', '.join('?' * len(valores))})",
+                              list(valores.values()))
+        return cursor.lastrowid, None
+
+    actual = conn.execute("SELECT version, borrado FROM Cambio WHERE tabla = ? AND clave = ?", (tabla, clave)).fetchone()
+    if (actual is None and base is not None) or (actual is not None and actual["version"] != base):
+        if not (borrar and actual is not None and actual["borrado"]):
+            return clave, {"version": actual and actual["version"], "fila": _fila(conn, tabla, clave)}
+        # Los dos lados la han borrado: no hay nada que resolver
+        return clave, None
+
+    if borrar:
+        conn.execute(f"DELETE FROM {tabla} WHERE {clave_primaria} = ?", (clave,))
+    elif actual is not None and not actual["borrado"]:
+        valores = _valores(conn, tabla, cambio.get("fila"))
+        conn.execute(f"UPDATE {tabla} SET {', '.join(f'{c} = ?' for c in valores)} WHERE {clave_primaria} = ?",
+                     (*valores.values(), clave))
+    else:
+        valores = {clave_primaria: clave, **_valores(conn, tabla, cambio.get("fila"))}
+        conn.execute(f"INSERT INTO {tabla} ({', '.join(valores)}) VALUES ({', '.join('?' * len(valores))})",
+                     list(valores.values()))
+    return clave, None
+
+
+def aplicar_cambios(conn, cambios):
+    """Aplica los cambios subidos por un cliente dentro de la transacción de ``conn``.
+
+    Cada cambio es un diccionario con ``tabla``, ``clave`` (``None`` para una fila
+    nueva con clave autonumérica), ``version`` (la que tenía la fila al descargarla;
+    ``None`` si es nueva) y ``fila`` con las columnas a guardar, o ``borrado: true``.
+
+    Devuelve ``aplicados`` (``indice``, ``tabla``, ``clave`` y la ``version`` nueva,
+    con la que el cliente debe quedarse), ``conflictos`` (con la ``version`` y la
+    ``fila`` actuales del servidor; ``fila`` es ``None`` si está borrada) y
+    ``rechazados`` (``indice`` y ``error``).  Un cambio que falla no impide aplicar
+    los demás.
+    """
+    aplicados, conflictos, rechazados = [], [], []
+    for indice, cambio in enumerate(cambios):
+        conn.execute("SAVEPOINT cambio")
+        try:
+            if not isinstance(cambio, dict):
+                raise ErrorCambio("Cada cambio debe ser un objeto.")
+            clave, conflicto = _aplicar(conn, cambio)
+        except (ValueError, sqlite3.Error) as e:
+            conn.execute("ROLLBACK TO cambio")
+            rechazados.append({"indice": indice, "error": str(e)})
+            continue
+        finally:
+            conn.execute("RELEASE cambio")
+
+        resultado = {"indice": indice, "tabla": cambio["tabla"], "clave": clave}
+        if conflicto:
+            conflictos.append({**resultado, **conflicto})
+        else:
+            version = conn.execute("SELECT version FROM Cambio WHERE tabla = ? AND clave = ?",
+                                   (cambio["tabla"], clave)).fetchone()[0]
+            aplicados.append({**resultado, "version": version})
+
+    recalcular_ritmos(conn)
+    return {"aplicados": aplicados, "conflictos": conflictos, "rechazados": rechazados}
@@ -0,0 +1,118 @@
+"""Tablas de reportlab para historiales largos, con memoria acotada.
+
+Una ``Table`` con todas las filas de un vehículo obliga a tener todas las celdas
+en memoria y, al partirla entre páginas, reportlab vuelve a medir lo que queda
+de tabla en cada página, así que el tiempo crece con el cuadrado de las filas.
+``TablaPorPaginas`` lee las filas de un iterador según las necesita y en cada
+página coloca una ``LongTable`` con la cabecera y solo las filas que caben; con
+``Flujo`` los elementos del documento también se generan según se maquetan.
+
+Este módulo importa reportlab, por eso ``informes`` lo importa al generar el
+primer informe y no al cargarse.
+"""
+from xml.sax.saxutils import escape
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, LongTable, Paragraph
+
+# Relleno horizontal de una celda de Table (LEFTPADDING + RIGHTPADDING)
+_RELLENO = 12
+
+
+def celda(texto, ancho, estilo, fuente="Helvetica", tamano=10):
+    """El texto tal cual si cabe en una línea de ``ancho`` puntos; si no, un Paragraph que lo reparte.
+
+    Un Paragraph por celda es lo que hace lenta y pesada una tabla larga, y casi
+    todas las celdas (fechas, importes, categorías) caben de sobra en una línea.
+    """
+    if "\n" not in texto and stringWidth(texto, fuente, tamano) <= ancho - _RELLENO:
+        return texto
+    return Paragraph(escape(texto).replace("\n", "<br/>"), estilo)
+
+
+class Flujo(list):
+    """Lista de elementos para ``doc.build`` que se va llenando desde un generador.
+
+    reportlab consume la lista por delante (``flowables[0]``, ``del flowables[0]``)
+    y mira unos pocos elementos más allá para ``keepWithNext``; basta con tener
+    siempre ``margen`` elementos preparados.
+    """
+
+    def __init__(self, elementos, margen=4):
+        super().__init__()
+        self._elementos = iter(elementos)
+        self._margen = margen
+
+    def _rellenar(self):
+        while self._elementos is not None and list.__len__(self) < self._margen:
+            try:
+                self.append(next(self._elementos))
+            except StopIteration:
+                self._elementos = None
+
+    def __len__(self):
+        self._rellenar()
+        return list.__len__(self)
+
+    def __getitem__(self, indice):
+        self._rellenar()
+        return list.__getitem__(self, indice)
+
+
+class TablaPorPaginas(Flowable):
+    """Tabla de ``filas`` (un iterador de listas de celdas) que se parte en una LongTable por página.
+
+    Nunca se dibuja ella misma: al maquetarla siempre dice no caber, el marco la
+    parte y ``split`` devuelve la LongTable de la página y una TablaPorPaginas
+    nueva con el resto (nueva y no ``self`` porque reportlab marca como
+    aplazado el elemento que no cabe al final de una página).
+
+    Cada fila se mide una sola vez al leerla, y a la LongTable de la página solo
+    van las que caben; medir cada vez todas las filas preparadas hacía que una
+    fila de varias líneas se maquetara decenas de veces.
+    """
+
+    def __init__(self, cabecera, filas, anchos, estilo, pendiente=None):
+        super().__init__()
+        self.cabecera = cabecera
+        self.filas = filas
+        self.anchos = anchos
+        self.estilo = estilo
+        # Fila ya leída y medida que no cupo en la página anterior: (celdas, alto)
+        self.pendiente = pendiente
+
+    def _tabla(self, filas):
+        tabla = LongTable([self.cabecera] + filas, repeatRows=1, colWidths=self.anchos)
+        tabla.setStyle(self.estilo)
+        return tabla
+
+    def _leer(self, ancho_disponible, alto_cabecera):
+        """Siguiente fila del iterador con su alto, o ``None`` si no quedan."""
+        fila = next(self.filas, None)
+        if fila is None:
+            return None
+        return fila, self._tabla([fila]).wrap(ancho_disponible, 0)[1] - alto_cabecera
+
+    def wrap(self, ancho_disponible, alto_disponible):
+        return sum(self.anchos), alto_disponible + 1
+
+    def split(self, ancho_disponible, alto_disponible):
+        alto_cabecera = self._tabla([]).wrap(ancho_disponible, 0)[1]
+        libre = alto_disponible - alto_cabecera
+        colocadas = []
+        siguiente = self.pendiente or self._leer(ancho_disponible, alto_cabecera)
+        while siguiente is not None and siguiente[1] <= libre:
+            colocadas.append(siguiente[0])
+            libre -= siguiente[1]
+            siguiente = self._leer(ancho_disponible, alto_cabecera)
+        if not colocadas:
+            # Solo cabría la cabecera: pasa a la página siguiente
+            self.pendiente = siguiente
+            return []
+        tabla = self._tabla(colocadas)
+        if siguiente is None:
+            return [tabla]
+        return [tabla, TablaPorPaginas(self.cabecera, self.filas, self.anchos, self.estilo, siguiente)]
+
+    def draw(self):
+        raise AssertionError("TablaPorPaginas se parte siempre antes de dibujarse.")
@@ -0,0 +1,126 @@
+"""Desglose de tiempos de arranque y de consultas.
+
+Está desactivado salvo que la aplicación se lance con ``--tiempos``. Activado,
+acumula el tiempo de cada fase del arranque, de la construcción de cada pestaña
+y de cada consulta SQL (las conexiones abiertas con ``base_datos.conectar`` usan
+``ConexionCronometrada``) y ``informe`` lo imprime ordenado de mayor a menor.
+Desactivado, ``medir`` y ``registrar`` no hacen nada.
+"""
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+activo = False
+
+_inicio = time.perf_counter()
+_lock = threading.Lock()
+_tiempos = defaultdict(lambda: [0, 0.0])   # (categoría, nombre) -> [veces, segundos]
+
+# Orden de las secciones del informe
+CATEGORIAS = ("arranque", "pestaña", "consulta")
+
+
+def activar():
+    global activo
+    activo = True
+
+
+def desde_inicio():
+    """Segundos desde que se importó el módulo (en la práctica, desde el lanzamiento)."""
+    return time.perf_counter() - _inicio
+
+
+def registrar(categoria, nombre, segundos, veces=1):
+    if not activo:
+        return
+    with _lock:
+        tiempo = _tiempos[(categoria, nombre)]
+        tiempo[0] += veces
+        tiempo[1] += segundos
+
+
+@contextmanager
+def medir(categoria, nombre):
+    if not activo:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(categoria, nombre, time.perf_counter() - inicio)
+
+
+def informe(titulo, maximo=15):
+    """Imprime lo acumulado hasta ahora, las ``maximo`` entradas más lentas de cada categoría."""
+    if not activo:
+        return
+    print(f"--- {titulo}: {desde_inicio() * 1000:.0f} ms desde el lanzamiento ---")
+    with _lock:
+        entradas = list(_tiempos.items())
+    for categoria in CATEGORIAS:
+        filas = sorted(((n, v) for (c, n), v in entradas if c == categoria), key=lambda f: -f[1][1])
+        if not filas:
+            continue
+        total = sum(v[1] for _, v in filas)
+        print(f"{categoria} ({total * 1000:.1f} ms en total)")
+        for nombre, (veces, segundos) in filas[:maximo]:
+            print(f"  {segundos * 1000:9.1f} ms {veces:6}x  {nombre}")
+
+
+def _resumir(sql):
+    sql = " ".join(sql.split())
+    return sql if len(sql) <= 90 else sql[:87] + "..."
+
+
+class _CursorCronometrado(sqlite3.Cursor):
+    """Cuenta cada ``execute`` y suma a su consulta el tiempo de ejecutar y de leer filas."""
+
+    _sql = "?"
+
+    def execute(self, sql, parametros=()):
+        self._sql = _resumir(sql)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            registrar("consulta", self._sql, time.perf_counter() - inicio)
+
+    def executemany(self, sql, parametros):
+        self._sql = _resumir(sql)
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            registrar("consulta", self._sql, time.perf_counter() - inicio)
+
+    def _leer(self, leer, *args):
+        inicio = time.perf_counter()
+        try:
+            return leer(*args)
+        finally:
+            registrar("consulta", self._sql, time.perf_counter() - inicio, veces=0)
+
+    def fetchone(self):
+        return self._leer(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._leer(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._leer(super().fetchall)
+
+
+class ConexionCronometrada(sqlite3.Connection):
+    """Conexión cuyos ``execute`` pasan por ``_CursorCronometrado``."""
+
+    def cursor(self, factory=_CursorCronometrado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
@@ -0,0 +1,531 @@
+"""Widgets reutilizables de la interfaz de Fleet Plus."""
+from bisect import bisect_left
+import tkinter as tk
+from tkinter import ttk
+
+import consultas
+
+
+class TablaVirtual(ttk.Frame):
+    """Tabla que solo materializa las filas visibles.
+
+    Envuelve un ``ttk.Treeview`` de altura fija cuyos elementos se reutilizan como
+    una ventana sobre la lista de datos: al desplazarse solo se reescriben los
+    valores de las filas visibles. El coste de pintar no depende del número total
+    de filas, y ``formatear`` se aplica únicamente a lo que se ve. ``etiquetas``,
+    si se indica, devuelve los tags del Treeview para cada fila visible.
+    """
+
+    def __init__(self, master, columnas, titulos, alto=15, anchos=None, formatear=None, etiquetas=None):
+        super().__init__(master)
+        self.alto = alto
+        self.formatear = formatear or tuple
+        self.etiquetas = etiquetas or (lambda fila: ())
+        self.filas = []
+        self.inicio = 0
+
+        self.tree = ttk.Treeview(self, columns=columnas, show="headings", height=alto, selectmode="browse")
+        self.scroll = ttk.Scrollbar(self, orient="vertical", command=self._desplazar)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scroll.grid(row=0, column=1, sticky="ns")
+        self.grid_columnconfigure(0, weight=1)
+
+        anchos = anchos or [120] * len(columnas)
+        for col, titulo, ancho in zip(columnas, titulos, anchos):
+            self.tree.heading(col, text=titulo)
+            self.tree.column(col, width=ancho, anchor="center")
+
+        # La rueda desplaza la ventana de datos, no el contenedor con scroll
+        self.tree.bind("<MouseWheel>", lambda e: self._mover(-int(e.delta / 120) * 3))
+        self.tree.bind("<Button-4>", lambda e: self._mover(-3))
+        self.tree.bind("<Button-5>", lambda e: self._mover(3))
+        self.tree.bind("<Up>", lambda e: self._teclado(-1))
+        self.tree.bind("<Down>", lambda e: self._teclado(1))
+        self.tree.bind("<Prior>", lambda e: self._mover(-self.alto))
+        self.tree.bind("<Next>", lambda e: self._mover(self.alto))
+
+    def set_filas(self, filas):
+        """Sustituye los datos de la tabla y vuelve al principio."""
+        self.filas = filas
+        self.inicio = 0
+        self.tree.selection_remove(self.tree.selection())
+        self.tree.configure(height=max(1, min(self.alto, len(filas))))
+        self._pintar()
+
+    def fila_seleccionada(self):
+        """Devuelve el dato original de la fila seleccionada, o None."""
+        seleccion = self.tree.selection()
+        if not seleccion:
+            return None
+        return self.filas[self.inicio + int(seleccion[0])]
+
+    # Internos
+
+    def _pintar(self):
+        visibles = self.filas[self.inicio:self.inicio + self.alto]
+        for i in range(self.alto):
+            iid = str(i)
+            if i < len(visibles):
+                valores = self.formatear(visibles[i])
+                tags = self.etiquetas(visibles[i])
+                if self.tree.exists(iid):
+                    self.tree.item(iid, values=valores, tags=tags)
+                else:
+                    self.tree.insert("", "end", iid=iid, values=valores, tags=tags)
+            elif self.tree.exists(iid):
+                self.tree.delete(iid)
+
+        total = len(self.filas)
+        if total <= self.alto:
+            self.scroll.set(0, 1)
+        else:
+            self.scroll.set(self.inicio / total, (self.inicio + self.alto) / total)
+
+    def _mover(self, filas):
+        maximo = max(0, len(self.filas) - self.alto)
+        nuevo = min(max(0, self.inicio + filas), maximo)
+        if nuevo != self.inicio:
+            # La selección es por posición: al desplazar ya no apunta a la misma fila
+            seleccion = self.tree.selection()
+            self.inicio = nuevo
+            self._pintar()
+            if seleccion:
+                self.tree.selection_remove(seleccion)
+        return "break"
+
+    def _desplazar(self, accion, cantidad, unidad=None):
+        if accion == "moveto":
+            self._mover(int(float(cantidad) * len(self.filas)) - self.inicio)
+        elif accion == "scroll":
+            paso = self.alto if unidad == "pages" else 1
+            self._mover(int(cantidad) * paso)
+
+    def _teclado(self, direccion):
+        foco = self.tree.focus()
+        if not foco:
+            return None
+        posicion = int(foco) + direccion
+        if 0 <= posicion < min(self.alto, len(self.filas)):
+            return None  # dentro de la ventana: comportamiento normal del Treeview
+        self._mover(direccion)
+        self.tree.focus(foco)
+        self.tree.selection_set(foco)
+        return "break"
+
+
+class ModeloTabla:
+    """Mantiene un ``ttk.Treeview`` sincronizado con filas indexadas por clave primaria.
+
+    Cada elemento del Treeview usa como ``iid`` la clave primaria de su fila. En vez
+    de borrar y reinsertar toda la tabla, ``sincronizar`` compara con lo que ya se
+    muestra y aplica solo inserciones, cambios y borrados; ``upsert`` y ``eliminar``
+    tocan una única fila, que es lo que cuesta una edición desde el formulario.
+
+    ``orden`` devuelve la clave de ordenación de una fila y debe coincidir con el
+    ``ORDER BY`` de la consulta que alimenta la tabla.
+    """
+
+    def __init__(self, tree, clave, valores, orden, descendente=False):
+        self.tree = tree
+        self.clave = clave
+        self.valores = valores
+        self.orden = orden
+        self.descendente = descendente
+
+        self._valores = {}   # iid -> valores mostrados
+        self._claves = {}    # iid -> clave de ordenación
+        self._ordenadas = [] # (clave de ordenación, iid) en orden ascendente
+
+    def __len__(self):
+        return len(self._valores)
+
+    def __contains__(self, pk):
+        return str(pk) in self._valores
+
+    def sincronizar(self, filas):
+        """Deja la tabla igual que ``filas`` aplicando solo las diferencias."""
+        nuevas = {str(self.clave(f)): f for f in filas}
+        orden_anterior = [iid for _, iid in self._mostradas() if iid in nuevas]
+
+        for iid in [iid for iid in self._valores if iid not in nuevas]:
+            self.tree.delete(iid)
+            del self._valores[iid], self._claves[iid]
+
+        for iid, fila in nuevas.items():
+            valores = tuple(self.valores(fila))
+            if iid not in self._valores:
+                self.tree.insert("", "end", iid=iid, values=valores)
+            elif self._valores[iid] != valores:
+                self.tree.item(iid, values=valores)
+            self._valores[iid] = valores
+            self._claves[iid] = self.orden(fila)
+
+        self._ordenadas = sorted((k, iid) for iid, k in self._claves.items())
+        orden_nuevo = [iid for _, iid in self._mostradas()]
+        if orden_nuevo != orden_anterior:
+            # Solo se recoloca si ha cambiado el orden (p. ej. por filas nuevas)
+            for posicion, iid in enumerate(orden_nuevo):
+                self.tree.move(iid, "", posicion)
+
+    def upsert(self, fila):
+        """Inserta o actualiza una fila en su posición."""
+        iid = str(self.clave(fila))
+        valores = tuple(self.valores(fila))
+        clave_orden = self.orden(fila)
+
+        if iid in self._valores:
+            if self._claves[iid] == clave_orden:
+                if self._valores[iid] != valores:
+                    self.tree.item(iid, values=valores)
+                    self._valores[iid] = valores
+                return
+            # Cambia de posición: se saca y se vuelve a colocar
+            self._ordenadas.pop(bisect_left(self._ordenadas, (self._claves[iid], iid)))
+            self.tree.item(iid, values=valores)
+        else:
+            self.tree.insert("", "end", iid=iid, values=valores)
+
+        indice = bisect_left(self._ordenadas, (clave_orden, iid))
+        self._ordenadas.insert(indice, (clave_orden, iid))
+        self._valores[iid] = valores
+        self._claves[iid] = clave_orden
+        posicion = len(self._ordenadas) - 1 - indice if self.descendente else indice
+        self.tree.move(iid, "", posicion)
+
+    def agregar(self, filas):
+        """Añade al final filas que van detrás de todas las mostradas (siguiente página)."""
+        nuevas = []
+        for fila in filas:
+            iid = str(self.clave(fila))
+            if iid in self._valores:
+                self.upsert(fila)
+                continue
+            valores = tuple(self.valores(fila))
+            self.tree.insert("", "end" if self.descendente else 0, iid=iid, values=valores)
+            self._valores[iid] = valores
+            self._claves[iid] = self.orden(fila)
+            nuevas.append((self._claves[iid], iid))
+        nuevas.sort()
+        if self.descendente:
+            self._ordenadas[:0] = nuevas
+        else:
+            self._ordenadas.extend(nuevas)
+
+    def eliminar(self, pk):
+        """Quita la fila con esa clave primaria, si se está mostrando."""
+        iid = str(pk)
+        if iid not in self._valores:
+            return
+        self._ordenadas.pop(bisect_left(self._ordenadas, (self._claves[iid], iid)))
+        del self._valores[iid], self._claves[iid]
+        self.tree.delete(iid)
+
+    def seleccionar(self, pk):
+        """Selecciona y hace visible la fila con esa clave primaria."""
+        iid = str(pk)
+        if iid in self._valores:
+            self.tree.selection_set(iid)
+            self.tree.focus(iid)
+            self.tree.see(iid)
+
+    def _mostradas(self):
+        return reversed(self._ordenadas) if self.descendente else iter(self._ordenadas)
+
+
+class TablaPaginada:
+    """Carga un ``ModeloTabla`` por páginas a medida que el usuario se desplaza.
+
+    La primera página y el total de filas se piden juntos al ejecutor de
+    consultas; cuando el desplazamiento llega cerca del final se pide la
+    siguiente página a partir de la clave de la última fila cargada, así que la
+    memoria y el tiempo hasta el primer pintado no dependen del tamaño del
+    histórico. Las ediciones que caen más allá de lo cargado no se insertan: ya
+    aparecerán al llegar a su página.
+    """
+
+    def __init__(self, modelo, ejecutor, nombre, pagina, contar, clave_pagina, etiqueta,
+                 scrollbar=None, tamano=200, texto="filas"):
+        self.modelo = modelo
+        self.ejecutor = ejecutor
+        self.nombre = nombre
+        self.pagina = pagina
+        self.contar = contar
+        self.clave_pagina = clave_pagina
+        self.etiqueta = etiqueta
+        self.scrollbar = scrollbar
+        self.tamano = tamano
+        self.texto = texto
+
+        self.total = 0
+        self.hay_mas = False
+        self.cargando = False
+        self._despues = None   # clave (fecha, id) de la última fila cargada
+        self._frontera = None  # clave de ordenación de la última fila cargada
+
+        self.modelo.tree.configure(yscrollcommand=self._al_desplazar)
+
+    def recargar(self):
+        """Vuelve a la primera página (las filas que no cambian no se repintan)."""
+        self.cargando = True
+        self.modelo.tree.configure(cursor="watch")
+        self.etiqueta.configure(text=f"⏳ Cargando {self.texto}...")
+        self.ejecutor.enviar(self.nombre, self._consultar_primera, al_terminar=self._pintar_primera,
+                             al_fallar=self._fallo)
+
+    def upsert(self, fila, nueva=False):
+        """Refleja una fila insertada o modificada si cae dentro de lo ya cargado."""
+        if nueva:
+            self.total += 1
+        if self.hay_mas and self._frontera is not None and self.modelo.orden(fila) < self._frontera:
+            self.modelo.eliminar(self.modelo.clave(fila))
+        else:
+            self.modelo.upsert(fila)
+        self._actualizar_etiqueta()
+
+    def eliminar(self, pk):
+        self.total = max(0, self.total - 1)
+        self.modelo.eliminar(pk)
+        self._actualizar_etiqueta()
+
+    # Internos
+
+    def _consultar_primera(self, conn):
+        # Se ejecuta en un hilo de trabajo
+        return self.pagina(conn, None, self.tamano), self.contar(conn)
+
+    def _pintar_primera(self, resultado):
+        filas, self.total = resultado
+        self.modelo.sincronizar(filas)
+        self._tras_cargar(filas)
+
+    def _siguiente(self):
+        if self.cargando or not self.hay_mas:
+            return
+        self.cargando = True
+        self.etiqueta.configure(text=f"⏳ Cargando más {self.texto}...")
+        self.ejecutor.enviar(self.nombre, self.pagina, self._despues, self.tamano,
+                             al_terminar=self._pintar_siguiente, al_fallar=self._fallo)
+
+    def _pintar_siguiente(self, filas):
+        self.modelo.agregar(filas)
+        self._tras_cargar(filas)
+
+    def _fallo(self, error):
+        self.cargando = False
+        self.modelo.tree.configure(cursor="")
+        self.etiqueta.configure(text=f"⚠ Error al cargar {self.texto}")
+        print(f"Error al cargar {self.texto}:", error)
+
+    def _tras_cargar(self, filas):
+        self.cargando = False
+        self.modelo.tree.configure(cursor="")
+        self.hay_mas = len(filas) == self.tamano
+        if filas:
+            self._despues = self.clave_pagina(filas[-1])
+            self._frontera = self.modelo.orden(filas[-1])
+        self._actualizar_etiqueta()
+
+    def _actualizar_etiqueta(self):
+        self.etiqueta.configure(text=f"Mostrando {len(self.modelo)} de {self.total} {self.texto}")
+
+    def _al_desplazar(self, primero, ultimo):
+        if self.scrollbar:
+            self.scrollbar.set(primero, ultimo)
+        if float(ultimo) >= 0.9:
+            self._siguiente()
+
+
+class SelectorCoche(ttk.Combobox):
+    """Combobox de vehículos con búsqueda incremental.
+
+    No carga la flota entera: al escribir (con una pequeña espera para no consultar
+    en cada pulsación) busca en el índice de prefijos con
+    ``consultas.buscar_coches`` y muestra las ``limite`` primeras coincidencias en
+    una lista bajo el campo, que no le quita el foco. Flechas y Enter eligen de la
+    lista; el botón del combobox despliega las mismas coincidencias.
+
+    El valor elegido es ``"MATRÍCULA (marca modelo)"`` si ``detalle=True`` y solo
+    la matrícula en caso contrario. Al elegir se genera ``<<ComboboxSelected>>``.
+    El campo admite texto libre, así que antes de guardar hay que comprobar con
+    ``matricula()`` que corresponde a un vehículo que existe.
+    """
+
+    def __init__(self, master, conn, detalle=False, limite=15, espera_ms=150, **kwargs):
+        super().__init__(master, postcommand=self._antes_de_desplegar, **kwargs)
+        self.conn = conn
+        self.detalle = detalle
+        self.limite = limite
+        self.espera_ms = espera_ms
+
+        self._pendiente = None
+        self._consultado = None
+        self._coches = []
+        self._popup = None
+        self._lista = None
+
+        self.bind("<KeyRelease>", self._al_escribir, add="+")
+        self.bind("<Down>", lambda e: self._mover_en_lista(1), add="+")
+        self.bind("<Up>", lambda e: self._mover_en_lista(-1), add="+")
+        self.bind("<Return>", self._confirmar, add="+")
+        self.bind("<Escape>", lambda e: self._cerrar_lista(), add="+")
+        self.bind("<FocusOut>", lambda e: self.after(150, self._cerrar_lista), add="+")
+
+    def seleccionar(self, matricula):
+        """Pone como valor el vehículo con esa matrícula. Devuelve False si no existe."""
+        fila = self.conn.execute(
+            "SELECT matricula, marca, modelo FROM Coche WHERE matricula = ?", (matricula,)
+        ).fetchone()
+        if not fila:
+            return False
+        self.set(self._valor(fila))
+        self._consultado = self.get()
+        return True
+
+    def matricula(self):
+        """Matrícula del valor escrito o elegido, o None si está vacío o no existe ese vehículo."""
+        texto = self.get().strip()
+        matricula = texto.split(" (")[0] if self.detalle else texto
+        if not matricula:
+            return None
+        fila = self.conn.execute("SELECT 1 FROM Coche WHERE matricula = ?", (matricula,)).fetchone()
+        return matricula if fila else None
+
+    def limpiar(self):
+        self.set("")
+        self._consultado = None
+        self._cerrar_lista()
+
+    def vecinos(self, matricula):
+        """Matrículas anterior y siguiente a ``matricula`` en la última lista de coincidencias."""
+        matriculas = [c["matricula"] for c in self._coches]
+        if matricula not in matriculas:
+            return []
+        i = matriculas.index(matricula)
+        return [m for m in matriculas[max(i - 1, 0):i + 2] if m != matricula]
+
+    # Internos
+
+    def _valor(self, fila):
+        if self.detalle:
+            return f"{fila['matricula']} ({fila['marca']} {fila['modelo']})"
+        return fila["matricula"]
+
+    def _al_escribir(self, event):
+        if event.keysym in ("Up", "Down", "Return", "Escape", "Tab") or not event.char:
+            return
+        if self._pendiente:
+            self.after_cancel(self._pendiente)
+        self._pendiente = self.after(self.espera_ms, self._actualizar)
+
+    def _consultar(self):
+        texto = self.get()
+        if texto != self._consultado:
+            self._consultado = texto
+            self._coches = consultas.buscar_coches(self.conn, texto, self.limite)
+            self.configure(values=[self._valor(c) for c in self._coches])
+
+    def _actualizar(self):
+        self._pendiente = None
+        if not self.get().strip():
+            self._cerrar_lista()
+            return
+        self._consultar()
+        self._mostrar_lista()
+
+    def _antes_de_desplegar(self):
+        self._cerrar_lista()
+        self._consultar()
+
+    def _mostrar_lista(self):
+        if not self._coches or self.focus_get() is not self:
+            self._cerrar_lista()
+            return
+        if self._popup is None:
+            self._popup = tk.Toplevel(self)
+            self._popup.overrideredirect(True)
+            self._lista = tk.Listbox(self._popup, takefocus=0, exportselection=False)
+            self._lista.pack(fill="both", expand=True)
+            self._lista.bind("<ButtonRelease-1>", lambda e: self._elegir(self._lista.nearest(e.y)))
+
+        self._lista.delete(0, "end")
+        for c in self._coches:
+            self._lista.insert("end", f"{c['matricula']}  ·  {c['marca']} {c['modelo']}")
+        self._lista.configure(height=len(self._coches), width=max(int(str(self.cget("width"))), 30))
+        self._lista.selection_set(0)
+        self._popup.geometry(f"+{self.winfo_rootx()}+{self.winfo_rooty() + self.winfo_height()}")
+        self._popup.deiconify()
+        self._popup.lift()
+
+    def _cerrar_lista(self):
+        if self._popup is not None:
+            self._popup.withdraw()
+
+    def _lista_visible(self):
+        return self._popup is not None and self._popup.winfo_viewable()
+
+    def _mover_en_lista(self, paso):
+        if not self._lista_visible():
+            return None  # comportamiento normal del combobox (desplegar)
+        actual = self._lista.curselection()
+        indice = min(max((actual[0] if actual else -1) + paso, 0), self._lista.size() - 1)
+        self._lista.selection_clear(0, "end")
+        self._lista.selection_set(indice)
+        self._lista.see(indice)
+        return "break"
+
+    def _confirmar(self, event=None):
+        if self._pendiente:
+            # Enter antes de que venza la espera: se consulta ya
+            self.after_cancel(self._pendiente)
+            self._actualizar()
+        if self._lista_visible():
+            actual = self._lista.curselection()
+            self._elegir(actual[0] if actual else 0)
+            return "break"
+        return None
+
+    def _elegir(self, indice):
+        if not 0 <= indice < len(self._coches):
+            return
+        self.set(self._valor(self._coches[indice]))
+        self._consultado = self.get()
+        self.icursor("end")
+        self._cerrar_lista()
+        self.event_generate("<<ComboboxSelected>>")
+
+
+class VentanaProgreso(tk.Toplevel):
+    """Ventana pequeña con barra de progreso y botón de cancelar para una tarea larga.
+
+    No es modal: el resto de la aplicación se puede seguir usando mientras
+    tanto. Cerrarla equivale a pulsar *Cancelar*, que llama a ``al_cancelar()``;
+    quien la abrió la cierra con ``destroy()`` cuando la tarea termina.
+    """
+
+    def __init__(self, master, titulo, al_cancelar):
+        super().__init__(master)
+        self.title(titulo)
+        self.resizable(False, False)
+        self.al_cancelar = al_cancelar
+
+        self.texto = tk.StringVar(value="Preparando…")
+        ttk.Label(self, textvariable=self.texto, width=50).pack(padx=15, pady=(15, 5))
+        self.barra = ttk.Progressbar(self, length=360, mode="indeterminate")
+        self.barra.pack(padx=15, pady=5)
+        self.barra.start(15)
+        self.boton = ttk.Button(self, text="Cancelar", command=self._cancelar)
+        self.boton.pack(pady=(5, 15))
+        self.protocol("WM_DELETE_WINDOW", self._cancelar)
+
+    def avanzar(self, hechos, total, texto):
+        """Muestra ``hechos`` de ``total`` (la barra deja de ser indeterminada) y ``texto``."""
+        if str(self.barra["mode"]) == "indeterminate":
+            self.barra.stop()
+            self.barra.configure(mode="determinate")
+        self.barra.configure(maximum=max(total, 1), value=hechos)
+        self.texto.set(texto)
+
+    def _cancelar(self):
+        self.boton.configure(state="disabled")
+        self.texto.set("Cancelando…")
+        self.al_cancelar()